@@ -11,14 +11,12 @@ class SeparateSessionMiddleware(MiddlewareMixin):
         else:
             settings.SESSION_COOKIE_NAME = 'user_sessionid'
 
-        # Ghi nhận lượt truy cập đơn giản.
+        # Ghi nhận lượt truy cập: chỉ cộng vào bucket theo phút trong bộ nhớ,
+        # thread nền flush định kỳ vào SiteVisitBucket (website/visits.py).
         # AuthenticationMiddleware chạy sau middleware này, nên request.user
-        # có thể chưa tồn tại — kiểm tra an toàn trước khi sử dụng.
+        # có thể chưa tồn tại — visits.record tự kiểm tra khi ghi mẫu SiteVisit.
         try:
-            from website.models import SiteVisit
-            ip = request.META.get('REMOTE_ADDR')
-            user = getattr(request, 'user', None)
-            if not request.path.startswith('/admin'):
-                SiteVisit.objects.create(path=request.path[:255], ip=ip, user=user if getattr(user, 'is_authenticated', False) else None)
+            from website import visits
+            visits.record(request)
         except Exception:
             pass
@@ -0,0 +1,331 @@
+"""
+Approximate nearest neighbour (ANN) cho semantic search của chatbot.
+
+Backend mặc định: IVF-PQ viết bằng NumPy (không cần faiss/hnswlib):
+- IVF: k-means chia không gian thành `nlist` cụm; query chỉ quét `nprobe` cụm gần nhất.
+- PQ: phần dư (vector - tâm cụm) được nén thành `m` byte (mỗi sub-vector 1 mã trong
+  256 tâm) → điểm xấp xỉ = q·tâm_cụm + Σ bảng tra LUT[sub, mã].
+- Re-rank: `rerank` ứng viên tốt nhất được chấm lại bằng tích vô hướng chính xác.
+
+Nút chỉnh recall/latency: nprobe (quét nhiều cụm hơn → recall cao, chậm hơn),
+rerank (nhiều ứng viên chấm lại hơn), nlist, m. Xem `manage.py benchmark_ann`.
+
+Backend là pluggable: mọi class có cùng giao diện (train/add/remove/search/save/load)
+đều dùng được qua setting RAG_ANN_BACKEND ('ivfpq', 'flat' hoặc dotted path).
+Vector đầu vào phải đã chuẩn hóa L2 (vector_store làm sẵn) → score = cosine.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _nearest(x, centroids, batch: int = 4096):
+    """Chỉ số tâm gần nhất (L2) cho từng hàng của x, tính theo batch để giới hạn RAM."""
+    cn = (centroids ** 2).sum(axis=1)
+    out = np.empty(x.shape[0], dtype=np.int32)
+    for s in range(0, x.shape[0], batch):
+        out[s:s + batch] = np.argmax(2.0 * (x[s:s + batch] @ centroids.T) - cn, axis=1)
+    return out
+
+
+def _kmeans(x, k: int, n_iter: int = 12, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n = x.shape[0]
+    k = max(1, min(k, n))
+    centroids = x[rng.choice(n, k, replace=False)].astype(np.float32, copy=True)
+    for _ in range(n_iter):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            # Cụm rỗng → lấy lại điểm ngẫu nhiên để không phí tâm
+            centroids[empty] = x[rng.choice(n, empty.size, replace=False)]
+    return centroids
+
+
+class _RowStore:
+    """Phần chung của các backend: id ↔ hàng, vector gốc (cho re-rank), đánh dấu xóa."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def n_dead(self) -> int:
+        return len(self.ids) - len(self.row_of)
+
+    def _append_rows(self, ids: Sequence[str], vectors) -> None:
+        start = len(self.ids)
+        self.ids.extend(ids)
+        for i, doc_id in enumerate(ids):
+            self.row_of[doc_id] = start + i
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+
+    def remove(self, ids) -> int:
+        """Xóa theo id (đánh dấu tombstone; compact() dọn hẳn)."""
+        removed = 0
+        for doc_id in ids:
+            row = self.row_of.pop(doc_id, None)
+            if row is not None:
+                self.alive[row] = False
+                removed += 1
+        if removed and self.n_dead > 0.3 * max(1, len(self.ids)):
+            self.compact()
+        return removed
+
+    def compact(self) -> None:
+        keep = np.flatnonzero(self.alive)
+        self.ids = [self.ids[i] for i in keep]
+        self.row_of = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.vectors = self.vectors[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self._compact_extra(keep)
+
+    def _compact_extra(self, keep) -> None:
+        pass
+
+    def sync(self, ids: Sequence[str], matrix) -> Tuple[int, int]:
+        """Đưa index về đúng tập (ids, matrix) hiện tại chỉ bằng add/remove delta.
+
+        Trả về (số vector thêm, số vector xóa). Doc đổi nội dung = xóa + thêm.
+        """
+        wanted = {doc_id: i for i, doc_id in enumerate(ids)}
+        stale = [doc_id for doc_id in self.row_of if doc_id not in wanted]
+        add_pos = []
+        for doc_id, i in wanted.items():
+            row = self.row_of.get(doc_id)
+            if row is None:
+                add_pos.append(i)
+            elif not np.array_equal(self.vectors[row], matrix[i]):
+                stale.append(doc_id)
+                add_pos.append(i)
+        self.remove(stale)
+        if add_pos:
+            self.add([ids[i] for i in add_pos], np.asarray(matrix[add_pos], dtype=np.float32))
+        return len(add_pos), len(stale)
+
+
+class FlatIndex(_RowStore):
+    """Backend tìm chính xác (brute force) – baseline cho benchmark và corpus nhỏ."""
+
+    name = 'flat'
+
+    def __init__(self, dim: int, **params):
+        super().__init__(dim)
+
+    def train(self, matrix) -> None:
+        pass
+
+    def needs_retrain(self) -> bool:
+        return False
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        self._append_rows(list(ids), np.asarray(vectors, dtype=np.float32))
+
+    def search(self, q, k: int = 5, **knobs) -> List[Tuple[float, str]]:
+        scores = self.vectors @ q
+        scores[~self.alive] = -np.inf
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[i]), self.ids[i]) for i in top]
+
+    def save(self, path: str) -> None:
+        keep = np.flatnonzero(self.alive)
+        np.savez(path, backend=np.array(self.name), ids=np.array([self.ids[i] for i in keep], dtype=str),
+                 vectors=self.vectors[keep])
+
+    @classmethod
+    def load(cls, data) -> 'FlatIndex':
+        idx = cls(int(data['vectors'].shape[1]))
+        idx.add(list(data['ids']), data['vectors'])
+        return idx
+
+
+class IVFPQIndex(_RowStore):
+    """IVF-PQ với re-rank chính xác; hỗ trợ thêm/xóa từng vector không cần train lại."""
+
+    name = 'ivfpq'
+
+    def __init__(self, dim: int, nlist: int | None = None, m: int = 16, nprobe: int = 8,
+                 rerank: int = 200, train_size: int = 20000, seed: int = 0):
+        super().__init__(dim)
+        self.nlist = nlist
+        # m phải chia hết dim → lấy ước lớn nhất không vượt quá m
+        self.m = max(d for d in range(1, max(1, min(m, dim)) + 1) if dim % d == 0)
+        self.dsub = dim // self.m
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None  # (nlist, dim)
+        self.codebooks = None  # (m, ks, dsub)
+        self.trained_n = 0
+        self.codes = np.zeros((0, self.m), dtype=np.uint8)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self._lists = None  # (order, bounds) – cache, dựng lại sau mỗi lần thêm/xóa
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, matrix) -> None:
+        x = np.asarray(matrix, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        if x.shape[0] > self.train_size:
+            x = x[rng.choice(x.shape[0], self.train_size, replace=False)]
+        nlist = self.nlist or max(1, int(4 * np.sqrt(matrix.shape[0])))
+        self.centroids = _kmeans(x, nlist, seed=self.seed)
+        self.nlist = self.centroids.shape[0]
+
+        residual = x - self.centroids[_nearest(x, self.centroids)]
+        ks = min(256, x.shape[0])
+        self.codebooks = np.stack([
+            _kmeans(residual[:, j * self.dsub:(j + 1) * self.dsub], ks, seed=self.seed + j)
+            for j in range(self.m)
+        ])
+        self.trained_n = matrix.shape[0]
+
+    def needs_retrain(self) -> bool:
+        """Corpus tăng/giảm quá xa so với lúc train → tâm cụm không còn đại diện tốt."""
+        n = len(self)
+        return not self.is_trained or n > 2 * self.trained_n or n < self.trained_n // 2
+
+    def _encode(self, vectors):
+        assign = _nearest(vectors, self.centroids)
+        residual = vectors - self.centroids[assign]
+        codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest(residual[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return assign, codes
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        assign, codes = self._encode(vectors)
+        self._append_rows(list(ids), vectors)
+        self.assign = np.concatenate([self.assign, assign])
+        self.codes = np.vstack([self.codes, codes])
+        self._lists = None
+
+    def remove(self, ids) -> int:
+        removed = super().remove(ids)
+        if removed:
+            self._lists = None
+        return removed
+
+    def _compact_extra(self, keep) -> None:
+        self.assign = self.assign[keep]
+        self.codes = self.codes[keep]
+        self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assign, kind='stable')
+            bounds = np.searchsorted(self.assign[order], np.arange(self.nlist + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(self, q, k: int = 5, nprobe: int | None = None, rerank: int | None = None) -> List[Tuple[float, str]]:
+        if len(self) == 0 or k <= 0:
+            return []
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        rerank = max(k, rerank or self.rerank)
+
+        coarse = self.centroids @ q
+        probe = np.argpartition(coarse, -nprobe)[-nprobe:]
+        order, bounds = self._inverted_lists()
+        rows = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probe])
+        rows = rows[self.alive[rows]]
+        if rows.size == 0:
+            return []
+
+        lut = np.einsum('jkd,jd->jk', self.codebooks, q.reshape(self.m, self.dsub))
+        approx = coarse[self.assign[rows]] + lut[np.arange(self.m), self.codes[rows]].sum(axis=1)
+        if rows.size > rerank:
+            rows = rows[np.argpartition(approx, -rerank)[-rerank:]]
+
+        exact = self.vectors[rows] @ q
+        k = min(k, rows.size)
+        top = np.argpartition(exact, -k)[-k:]
+        top = top[np.argsort(exact[top])[::-1]]
+        return [(float(exact[i]), self.ids[rows[i]]) for i in top]
+
+    def save(self, path: str) -> None:
+        self.compact()
+        np.savez(
+            path,
+            backend=np.array(self.name),
+            ids=np.array(self.ids, dtype=str),
+            vectors=self.vectors,
+            codes=self.codes,
+            assign=self.assign,
+            centroids=self.centroids,
+            codebooks=self.codebooks,
+            params=np.array([self.m, self.nprobe, self.rerank, self.train_size, self.seed, self.trained_n]),
+        )
+
+    @classmethod
+    def load(cls, data) -> 'IVFPQIndex':
+        m, nprobe, rerank, train_size, seed, trained_n = (int(v) for v in data['params'])
+        idx = cls(int(data['vectors'].shape[1]), nlist=int(data['centroids'].shape[0]), m=m,
+                  nprobe=nprobe, rerank=rerank, train_size=train_size, seed=seed)
+        idx.centroids = data['centroids']
+        idx.codebooks = data['codebooks']
+        idx.trained_n = trained_n
+        idx.ids = list(data['ids'])
+        idx.row_of = {doc_id: i for i, doc_id in enumerate(idx.ids)}
+        idx.vectors = data['vectors']
+        idx.alive = np.ones(len(idx.ids), dtype=bool)
+        idx.codes = data['codes']
+        idx.assign = data['assign']
+        return idx
+
+
+BACKENDS = {
+    FlatIndex.name: FlatIndex,
+    IVFPQIndex.name: IVFPQIndex,
+}
+
+
+def get_backend(name: str):
+    """Tên backend có sẵn hoặc dotted path tới class cùng giao diện (vd. wrapper hnswlib)."""
+    if name in BACKENDS:
+        return BACKENDS[name]
+    from django.utils.module_loading import import_string
+    return import_string(name)
+
+
+def create(dim: int, backend: str = 'ivfpq', **params):
+    return get_backend(backend)(dim, **params)
+
+
+def load(path: str):
+    with np.load(path, allow_pickle=False) as data:
+        return get_backend(str(data['backend'])).load(data)
+
+
+def build(ids: Sequence[str], matrix, backend: str = 'ivfpq', **params):
+    """Train + add toàn bộ (ids, matrix) vào 1 index mới."""
+    idx = create(matrix.shape[1], backend, **params)
+    idx.train(matrix)
+    idx.add(list(ids), matrix)
+    logger.info(f"🧭 Built {idx.name} ANN index: {len(idx)} vectors, dim={matrix.shape[1]}")
+    return idx
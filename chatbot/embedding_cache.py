@@ -0,0 +1,137 @@
+"""
+Cache embedding bền vững trên đĩa, định danh theo nội dung.
+
+Key = SHA-256(tên model + text đã chuẩn hóa) → cùng 1 đoạn text (dù ở process,
+worker hay lần build nào) chỉ encode 1 lần cho mỗi model. Vector lưu dạng blob
+float16 (mặc định, nhỏ gấp đôi) hoặc float32 trong 1 file SQLite (WAL, nhiều process
+đọc/ghi đồng thời được).
+
+Settings:
+    RAG_EMBEDDING_CACHE_PATH   đường dẫn file (mặc định chatbot/embedding_cache.sqlite3)
+    RAG_EMBEDDING_CACHE_DTYPE  'float16' | 'float32'
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), 'embedding_cache.sqlite3')
+_FORMATS = {'float16': 'e', 'float32': 'f'}
+
+_local = threading.local()
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa trước khi băm: Unicode NFC + gộp khoảng trắng (giữ nguyên hoa/thường)."""
+    s = unicodedata.normalize('NFC', text or '')
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    h = hashlib.sha256()
+    h.update(model_name.encode('utf-8'))
+    h.update(b'\x00')
+    h.update(normalize_text(text).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _connect():
+    path = _setting('RAG_EMBEDDING_CACHE_PATH', DEFAULT_PATH)
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, dtype TEXT NOT NULL,"
+            " dim INTEGER NOT NULL, vec BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        conns[path] = conn
+    return conn
+
+
+def _pack(vec: Sequence[float], dtype: str) -> bytes:
+    return struct.pack(f"<{len(vec)}{_FORMATS[dtype]}", *vec)
+
+
+def _unpack(blob: bytes, dtype: str, dim: int) -> List[float]:
+    return list(struct.unpack(f"<{dim}{_FORMATS[dtype]}", blob))
+
+
+def get_many(model_name: str, texts: Sequence[str]) -> Dict[int, List[float]]:
+    """{vị trí trong texts: embedding} cho các text đã có trong cache."""
+    if not texts:
+        return {}
+    keys = [cache_key(model_name, t) for t in texts]
+    found: Dict[str, List[float]] = {}
+    try:
+        conn = _connect()
+        unique = list(dict.fromkeys(keys))
+        for s in range(0, len(unique), 500):  # giới hạn số tham số của SQLite
+            chunk = unique[s:s + 500]
+            rows = conn.execute(
+                f"SELECT key, dtype, dim, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, dtype, dim, blob in rows:
+                found[key] = _unpack(blob, dtype, dim)
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding cache read failed: {e}")
+        return {}
+    return {i: found[k] for i, k in enumerate(keys) if k in found}
+
+
+def put_many(model_name: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+    dtype = _setting('RAG_EMBEDDING_CACHE_DTYPE', 'float16')
+    if dtype not in _FORMATS:
+        dtype = 'float32'
+    now = time.time()
+    rows = [
+        (cache_key(model_name, t), model_name, dtype, len(emb), _pack(emb, dtype), now)
+        for t, emb in zip(texts, embeddings)
+    ]
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", rows)
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding cache write failed: {e}")
+
+
+def get(model_name: str, text: str) -> List[float] | None:
+    return get_many(model_name, [text]).get(0)
+
+
+def put(model_name: str, text: str, embedding: Sequence[float]) -> None:
+    put_many(model_name, [text], [embedding])
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    try:
+        conn = _connect()
+        rows = conn.execute("SELECT model, COUNT(*), SUM(LENGTH(vec)) FROM embeddings GROUP BY model").fetchall()
+    except Exception:
+        return {}
+    return {model: {'count': count, 'bytes': size or 0} for model, count, size in rows}
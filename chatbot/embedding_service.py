@@ -8,9 +8,13 @@ Environment tweaks:
 - Suppress TF logs if accidentally imported.
 """
 
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from typing import List
 import logging
 import os
+import queue
+import threading
+import time
 
 # Prevent transformers from attempting to import TensorFlow (optional components)
 os.environ.setdefault("TRANSFORMERS_NO_TF", "1")
@@ -21,21 +25,33 @@ logger = logging.getLogger(__name__)
 _model = None
 _model_name = 'paraphrase-multilingual-mpnet-base-v2'  # 768-dim, good for Vietnamese
 _fallback_model_name = 'distiluse-base-multilingual-cased-v2'  # lighter fallback
+_active_model_name = None  # model thực sự đã load (primary hoặc fallback)
+BATCH_SIZE = 64
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
 
 
 def _load_model():
-    global _model
+    global _model, _active_model_name
     if _model is not None:
         return _model
     try:
         from sentence_transformers import SentenceTransformer
         try:
             _model = SentenceTransformer(_model_name)
+            _active_model_name = _model_name
             logger.info(f"✅ Loaded embedding model: {_model_name}")
         except Exception as primary_err:
             logger.warning(f"⚠️ Primary model failed ({_model_name}): {primary_err}. Trying fallback {_fallback_model_name}.")
             try:
                 _model = SentenceTransformer(_fallback_model_name)
+                _active_model_name = _fallback_model_name
                 logger.info(f"✅ Loaded fallback embedding model: {_fallback_model_name}")
             except Exception as fallback_err:
                 logger.error(f"❌ Failed to load fallback model: {fallback_err}")
@@ -51,27 +67,139 @@ def _load_model():
         return None
 
 
-def encode(texts: List[str]) -> List[List[float]] | None:
+def encode(texts: List[str], batch_size: int | None = None, persist: bool = True) -> List[List[float]] | None:
     """
     Encode list of texts to embeddings.
     Returns None if model not available.
+
+    Embedding đã tính được lấy từ embedding_cache (key = model + SHA của text);
+    chỉ các text chưa có mới được gửi cho model, theo batch `batch_size`
+    (mặc định RAG_EMBED_BATCH_SIZE / BATCH_SIZE). persist=False (câu hỏi chat) chỉ đọc
+    cache, không ghi thêm → file cache chỉ chứa text của corpus, không phình theo traffic.
     """
+    if not texts:
+        return []
+    from chatbot import embedding_cache
+
+    name = _active_model_name or _model_name
+    results = embedding_cache.get_many(name, texts)
+    if len(results) == len(texts):
+        return [results[i] for i in range(len(texts))]
+
     model = _load_model()
     if model is None:
         return None
+    if _active_model_name != name:
+        # Đang dùng model fallback → cache của model chính không dùng được
+        name = _active_model_name
+        results = embedding_cache.get_many(name, texts)
+
+    # Gộp text trùng nhau trong cùng 1 lần gọi
+    missing: dict = {}
+    for i, t in enumerate(texts):
+        if i not in results:
+            missing.setdefault(t, []).append(i)
+    pending = list(missing)
+    batch_size = batch_size or int(_setting('RAG_EMBED_BATCH_SIZE', BATCH_SIZE))
     try:
-        # encode returns numpy array, convert to list for JSON serialization
-        embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-        return [emb.tolist() for emb in embeddings]
+        for s in range(0, len(pending), batch_size):
+            batch = pending[s:s + batch_size]
+            # encode returns numpy array, convert to list for JSON serialization
+            embeddings = model.encode(batch, convert_to_numpy=True, show_progress_bar=False)
+            vectors = [emb.tolist() for emb in embeddings]
+            if persist:
+                embedding_cache.put_many(name, batch, vectors)
+            for t, vec in zip(batch, vectors):
+                for i in missing[t]:
+                    results[i] = vec
     except Exception as e:
         logger.error(f"❌ Embedding encode error: {e}")
         return None
+    if pending:
+        logger.info(f"🧮 Embedded {len(pending)} new texts ({len(texts) - sum(len(v) for v in missing.values())} cache hits)")
+    return [results[i] for i in range(len(texts))]
+
+
+class _MicroBatcher:
+    """Gom các encode_single đồng thời thành 1 lần model.encode.
+
+    Request đầu tiên mở "cửa sổ" tối đa RAG_EMBED_MAX_WAIT_MS; mọi request tới trong
+    cửa sổ (tối đa RAG_EMBED_MAX_BATCH) được encode chung 1 batch trên thread nền,
+    kết quả trả về từng caller qua Future. Khi tải thấp chỉ tốn thêm vài ms chờ.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple[str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        self._ensure_thread()
+        return fut
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='embed-microbatch', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            max_wait = float(_setting('RAG_EMBED_MAX_WAIT_MS', 5)) / 1000.0
+            max_batch = int(_setting('RAG_EMBED_MAX_BATCH', 32))
+            deadline = time.monotonic() + max_wait
+            while len(batch) < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                vectors = encode([text for text, _ in batch], persist=False)
+            except Exception as e:
+                logger.error(f"❌ Micro-batch encode error: {e}")
+                vectors = None
+            for i, (_, fut) in enumerate(batch):
+                fut.set_result(vectors[i] if vectors else None)
+
+
+_batcher = _MicroBatcher()
 
 
 def encode_single(text: str) -> List[float] | None:
-    """Encode single text to embedding vector."""
-    result = encode([text])
-    return result[0] if result else None
+    """Encode single text to embedding vector.
+
+    Cache hit trả về ngay; cache miss đi qua micro-batcher để các request chat đồng thời
+    dùng chung 1 forward pass (tắt bằng RAG_EMBED_MAX_WAIT_MS=0). Câu hỏi không được
+    ghi vào cache bền vững (encode(..., persist=False)).
+
+    Chờ batcher tối đa RAG_EMBED_TIMEOUT_S giây (lần đầu load model, model.encode bị
+    treo...) rồi trả None → _query_vectors fallback sang TF-IDF như khi không có model.
+    """
+    from chatbot import embedding_cache
+
+    cached = embedding_cache.get(_active_model_name or _model_name, text)
+    if cached is not None:
+        return cached
+    if float(_setting('RAG_EMBED_MAX_WAIT_MS', 5)) <= 0:
+        result = encode([text], persist=False)
+        return result[0] if result else None
+    timeout = float(_setting('RAG_EMBED_TIMEOUT_S', 10))
+    try:
+        return _batcher.submit(text).result(timeout=timeout)
+    except FutureTimeout:
+        logger.warning(f"⚠️ Embedding micro-batch quá {timeout}s → bỏ qua semantic search")
+        return None
 
 
 def get_embedding_dim() -> int:
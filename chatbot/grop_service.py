@@ -24,7 +24,7 @@ from .ai_context_builder import AIContextBuilder
 from .vietnamese_parser import (
     VietnameseNumberParser, ConversationMemory, TypoTolerance
 )
-from website.models import RentalPost, Province, FEATURE_CHOICES
+from website.models import RentalPost, Province, FEATURE_CHOICES, filter_by_features
 
 logger = logging.getLogger(__name__)
 
@@ -535,8 +535,7 @@ class GropChatbot:
                 if province:
                     base_qs = base_qs.filter(province=province)
                 feats = self._detect_features(message)
-                for f in feats:
-                    base_qs = base_qs.filter(features__contains=[f])
+                base_qs = filter_by_features(base_qs, feats)
                 category = self._detect_category(message)
                 qs = base_qs.filter(category=category) if category else base_qs
 
@@ -611,8 +610,7 @@ class GropChatbot:
                     base_qs = base_qs.filter(province=province)
                 # Áp dụng tiện ích nếu người dùng chỉ định (áp dụng cho cả fallback)
                 feats = self._detect_features(message)
-                for f in feats:
-                    base_qs = base_qs.filter(features__contains=[f])
+                base_qs = filter_by_features(base_qs, feats)
                 # Danh mục áp dụng chặt chẽ trước; nếu không có kết quả, sẽ nới lỏng
                 category = self._detect_category(message)
                 qs = base_qs.filter(category=category) if category else base_qs
@@ -1633,8 +1631,7 @@ class GropChatbot:
         # Nếu không có category nào → không filter (lấy tất cả)
 
         features = self._detect_features(message)
-        for f in features:
-            qs = qs.filter(features__contains=f)  # MultiSelectField: use string, not list
+        qs = filter_by_features(qs, features)  # 1 điều kiện bitwise trên features_mask
 
         # Apply price and area filters (unless skipped by specialized handlers)
         if not skip_area_price:
@@ -0,0 +1,93 @@
+"""
+Đo recall/latency của index ANN so với tìm kiếm chính xác (brute force).
+
+Ví dụ:
+    python manage.py benchmark_ann                       # dùng vector thật đã export/DB
+    python manage.py benchmark_ann --synthetic 50000 --dim 768 --nprobe 1,4,8,16,32
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Benchmark recall vs latency của ANN (IVF-PQ) so với exact search"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Sinh N vector ngẫu nhiên (có cụm) thay vì dùng vector thật')
+        parser.add_argument('--dim', type=int, default=768, help='Số chiều khi --synthetic')
+        parser.add_argument('--queries', type=int, default=200, help='Số query đo')
+        parser.add_argument('-k', type=int, default=10, help='Top-k để tính recall@k')
+        parser.add_argument('--backend', default='ivfpq', help="Backend ANN ('ivfpq', 'flat' hoặc dotted path)")
+        parser.add_argument('--nlist', type=int, default=None)
+        parser.add_argument('--m', type=int, default=16, help='Số sub-quantizer PQ')
+        parser.add_argument('--nprobe', default='1,2,4,8,16,32', help='Danh sách nprobe cần đo')
+        parser.add_argument('--rerank', type=int, default=200, help='Số ứng viên chấm lại chính xác')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+        except ImportError:
+            raise CommandError("Cần cài numpy để chạy benchmark")
+        from chatbot import ann_index, vector_store
+
+        rng = np.random.default_rng(options['seed'])
+        if options['synthetic']:
+            matrix = self._synthetic(np, rng, options['synthetic'], options['dim'])
+            ids = [str(i) for i in range(matrix.shape[0])]
+        else:
+            store = vector_store.get_store()
+            if store is None or len(store) == 0:
+                raise CommandError("Chưa có embedding nào; chạy build_rag_index hoặc dùng --synthetic N")
+            matrix = np.asarray(store.matrix, dtype=np.float32)
+            ids = [d['id'] for d in store.docs]
+
+        n, dim = matrix.shape
+        k = min(options['k'], n)
+        # Query = vector có sẵn + nhiễu (giống câu hỏi gần nghĩa với 1 tin đăng)
+        picks = rng.choice(n, min(options['queries'], n), replace=False)
+        queries = matrix[picks] + rng.normal(scale=0.05, size=(len(picks), dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        self.stdout.write(f"📐 Corpus: {n} vectors × {dim} dims, {len(queries)} queries, k={k}")
+
+        exact_ms = []
+        truth = []
+        for q in queries:
+            t0 = time.perf_counter()
+            scores = matrix @ q
+            top = np.argpartition(scores, -k)[-k:]
+            exact_ms.append((time.perf_counter() - t0) * 1000)
+            truth.append({ids[i] for i in top})
+
+        t0 = time.perf_counter()
+        index = ann_index.build(ids, matrix, options['backend'], nlist=options['nlist'], m=options['m'],
+                                rerank=options['rerank'], seed=options['seed'])
+        build_s = time.perf_counter() - t0
+        self.stdout.write(f"🧭 Built {options['backend']} index in {build_s:.2f}s"
+                          + (f" (nlist={index.nlist}, m={index.m})" if hasattr(index, 'nlist') else ""))
+
+        self.stdout.write(f"\n{'nprobe':>8} {'recall@k':>10} {'mean ms':>9} {'p95 ms':>9} {'speedup':>8}")
+        exact_mean = float(np.mean(exact_ms))
+        self.stdout.write(f"{'exact':>8} {1.0:>10.3f} {exact_mean:>9.3f} {np.percentile(exact_ms, 95):>9.3f} {1.0:>7.1f}x")
+        for nprobe in [int(x) for x in options['nprobe'].split(',') if x.strip()]:
+            lat = []
+            hit = 0
+            for q, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                got = index.search(q, k, nprobe=nprobe, rerank=options['rerank'])
+                lat.append((time.perf_counter() - t0) * 1000)
+                hit += len(expected & {doc_id for _, doc_id in got})
+            recall = hit / (len(queries) * k)
+            mean = float(np.mean(lat))
+            self.stdout.write(f"{nprobe:>8} {recall:>10.3f} {mean:>9.3f} {np.percentile(lat, 95):>9.3f} "
+                              f"{exact_mean / mean if mean else 0:>7.1f}x")
+
+    def _synthetic(self, np, rng, n, dim):
+        centers = rng.normal(size=(max(1, n // 200), dim))
+        matrix = centers[rng.integers(0, centers.shape[0], n)] + rng.normal(scale=0.6, size=(n, dim))
+        matrix = matrix.astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix
@@ -3,11 +3,11 @@ Management command to reload RAG index cache without restarting server.
 Usage: python manage.py reload_rag_cache
 """
 
+import os
+
 from django.core.management.base import BaseCommand
 from chatbot.performance_optimizer import LazyRAGLoader
-import chatbot.performance_optimizer as perf_opt
-import importlib
-import sys
+from chatbot import rag_index
 
 
 class Command(BaseCommand):
@@ -17,25 +17,21 @@ class Command(BaseCommand):
         self.stdout.write("🔄 Reloading RAG index cache...")
 
         try:
-            # Step 1: Reset global flag
-            perf_opt._RAG_INDEX_LOADED = False
-            self.stdout.write(self.style.SUCCESS("✅ Reset global flag"))
+            # Step 1: Bump mtime → mọi worker đang chạy tự load lại ở query kế tiếp
+            if os.path.exists(rag_index.INDEX_PATH):
+                rag_index.touch_index()
+                self.stdout.write(self.style.SUCCESS("✅ Bumped index version stamp (mtime)"))
+
+            # Step 2: Load lại bản thường trú trong process này
+            idx = rag_index.reload_index()
+            if idx is None:
+                self.stdout.write(self.style.WARNING("⚠️ Chưa có file index, chạy: python manage.py build_rag_index"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✅ Loaded new RAG index ({idx.n_docs} docs)"))
 
-            # Step 2: Clear instance cache
             loader = LazyRAGLoader.get_instance()
-            loader._rag_index = None
-            self.stdout.write(self.style.SUCCESS("✅ Cleared instance cache"))
-
-            # Step 3: Reload rag_index module
-            if 'chatbot.rag_index' in sys.modules:
-                importlib.reload(sys.modules['chatbot.rag_index'])
-                self.stdout.write(self.style.SUCCESS("✅ Reloaded rag_index module"))
-
-            # Step 4: Force load new index
-            loader.load_rag_index()
-            self.stdout.write(self.style.SUCCESS("✅ Loaded new RAG index"))
 
-            # Step 5: Test query
+            # Step 3: Test query
             test_results = loader.query("gói VIP", k=3)
             self.stdout.write(f"✅ Test query returned {len(test_results)} results")
 
@@ -4,7 +4,6 @@ Lazy loading and caching to speed up first response
 """
 
 import logging
-from django.core.cache import cache
 from functools import lru_cache
 import time
 
@@ -62,9 +61,10 @@ class LazyRAGLoader:
             except:
                 pass
 
-        # Load for first time
+        # Load for first time (parse file index vào bộ nhớ thường trú luôn)
         try:
             from chatbot import rag_index
+            rag_index.get_index()
             self._rag_index = rag_index
             _RAG_INDEX_LOADED = True
             logger.info("✅ RAG index loaded successfully")
@@ -87,22 +87,28 @@ class LazyRAGLoader:
 
 
 class EmbeddingCache:
-    """Cache for embedding queries to avoid recomputation"""
+    """Cache for embedding queries to avoid recomputation.
 
-    CACHE_PREFIX = "embedding:"
-    CACHE_TIMEOUT = 3600  # 1 hour
+    Dùng chung cache bền vững của embedding_service (key = model + SHA-256 của text),
+    nên hit được giữa các process/worker và giữa các lần khởi động.
+    """
+
+    @staticmethod
+    def _model_name() -> str:
+        from chatbot import embedding_service
+        return embedding_service._active_model_name or embedding_service._model_name
 
     @classmethod
     def get_cached_embedding(cls, text: str):
         """Get cached embedding for text"""
-        cache_key = f"{cls.CACHE_PREFIX}{hash(text)}"
-        return cache.get(cache_key)
+        from chatbot import embedding_cache
+        return embedding_cache.get(cls._model_name(), text)
 
     @classmethod
     def set_cached_embedding(cls, text: str, embedding):
         """Cache embedding for text"""
-        cache_key = f"{cls.CACHE_PREFIX}{hash(text)}"
-        cache.set(cache_key, embedding, cls.CACHE_TIMEOUT)
+        from chatbot import embedding_cache
+        embedding_cache.put(cls._model_name(), text, embedding)
 
 
 class FastResponseOptimizer:
@@ -0,0 +1,218 @@
+"""
+BM25F cho RAG index: postings theo field (title / body / metadata) + chấm điểm bằng NumPy.
+
+Lúc build (build_sections):
+- Mỗi doc có 3 field: title, body (toàn văn đã index) và metadata (tỉnh, quận, loại
+  phòng, tiện ích). tf̃ = Σ_field w_f · tf_f / (1 - b_f + b_f · len_f / avglen_f)
+- Impact của (term, doc) = idf · tf̃ / (k1 + tf̃) được tính sẵn → query chỉ còn cộng.
+- Các hệ số boost của _boost_score được lưu thành cột số: loại doc, cờ FAQ/giá/diện
+  tích, created_at dạng epoch và id tỉnh đã chuẩn hóa.
+
+Lúc query (score): cộng impact bằng np.bincount, boost bằng phép toán trên mảng chỉ
+với các doc ứng viên, top-k bằng argpartition — không parse datetime hay tokenize
+tiêu đề theo từng doc.
+
+Tham số chỉnh qua settings.RAG_BM25F (k1, weights, b); đổi tham số cần build lại index.
+"""
+from __future__ import annotations
+
+import math
+from array import array
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULTS = {
+    'k1': 1.2,
+    'weights': {'title': 2.5, 'body': 1.0, 'meta': 1.5},
+    'b': {'title': 0.3, 'body': 0.75, 'meta': 0.0},
+}
+
+KIND_CODES = {'md': 0, 'post': 1, 'vip': 2}
+FLAG_FAQ_TITLE = 1
+FLAG_PRICE = 2
+FLAG_AREA = 4
+
+
+def _params() -> Dict[str, Any]:
+    try:
+        from django.conf import settings
+        custom = getattr(settings, 'RAG_BM25F', None) or {}
+    except Exception:
+        custom = {}
+    return {
+        'k1': custom.get('k1', DEFAULTS['k1']),
+        'weights': {**DEFAULTS['weights'], **custom.get('weights', {})},
+        'b': {**DEFAULTS['b'], **custom.get('b', {})},
+    }
+
+
+def _count(tokens: List[str]) -> Dict[str, int]:
+    tf: Dict[str, int] = {}
+    for t in tokens:
+        tf[t] = tf.get(t, 0) + 1
+    return tf
+
+
+def _epoch(created_at: str | None) -> float:
+    if not created_at:
+        return math.nan
+    try:
+        dt = datetime.fromisoformat(created_at)
+    except ValueError:
+        return math.nan
+    # Giống _boost_score: datetime naive không so được với now(utc) → không boost
+    return dt.timestamp() if dt.tzinfo is not None else math.nan
+
+
+def build_sections(index: Dict[str, Any], tokenize: Callable[[str], List[str]],
+                   normalize: Callable[[str], str]) -> Dict[str, Any]:
+    """Sinh postings BM25F + cột số theo doc cho rag_store.write_binary (không cần NumPy)."""
+    params = _params()
+    k1, weights, b = params['k1'], params['weights'], params['b']
+    docs = index['docs']
+    n = len(docs)
+
+    fields: List[Tuple[Dict[str, int], Dict[str, int], Dict[str, int]]] = []
+    totals = {'title': 0, 'body': 0, 'meta': 0}
+    for d in docs:
+        meta = d.get('metadata') or {}
+        meta_text = ' '.join(str(x) for x in [meta.get('province'), meta.get('district'), meta.get('category')] if x)
+        meta_text += ' ' + ' '.join(str(f) for f in meta.get('features') or [])
+        title_tf = _count(tokenize(d.get('title') or ''))
+        meta_tf = _count(tokenize(meta_text))
+        fields.append((title_tf, d['tf'], meta_tf))
+        totals['title'] += sum(title_tf.values())
+        totals['body'] += d['len']
+        totals['meta'] += sum(meta_tf.values())
+    avg = {f: (totals[f] / n if n else 0.0) or 1.0 for f in totals}
+
+    df: Dict[str, int] = {}
+    for title_tf, body_tf, meta_tf in fields:
+        for t in set(title_tf) | set(body_tf) | set(meta_tf):
+            df[t] = df.get(t, 0) + 1
+    idf = {t: math.log(1.0 + (n - c + 0.5) / (c + 0.5)) for t, c in df.items()}
+
+    postings: Dict[str, Tuple[List[int], List[float], List[int]]] = {}
+    for doc_idx, (title_tf, body_tf, meta_tf) in enumerate(fields):
+        norms = {}
+        for name, tf in (('title', title_tf), ('body', body_tf), ('meta', meta_tf)):
+            length = sum(tf.values()) if name != 'body' else docs[doc_idx]['len']
+            norms[name] = 1.0 - b[name] + b[name] * length / avg[name]
+        for t in set(title_tf) | set(body_tf) | set(meta_tf):
+            tf_tilde = (weights['title'] * title_tf.get(t, 0) / norms['title']
+                        + weights['body'] * body_tf.get(t, 0) / norms['body']
+                        + weights['meta'] * meta_tf.get(t, 0) / norms['meta'])
+            p = postings.get(t)
+            if p is None:
+                p = postings[t] = ([], [], [])
+            p[0].append(doc_idx)
+            p[1].append(idf[t] * tf_tilde / (k1 + tf_tilde))
+            p[2].append(1 if t in title_tf else 0)
+
+    provinces: List[str] = []
+    prov_ids: Dict[str, int] = {}
+    doc_kind = array('B')
+    doc_flags = array('B')
+    doc_epoch = array('d')
+    doc_prov = array('i')
+    for d in docs:
+        meta = d.get('metadata') or {}
+        doc_kind.append(KIND_CODES.get(d['kind'], 0))
+        flags = 0
+        if d['kind'] == 'md' and 'FAQ' in (d.get('title') or '').upper():
+            flags |= FLAG_FAQ_TITLE
+        if meta.get('price'):
+            flags |= FLAG_PRICE
+        if meta.get('area'):
+            flags |= FLAG_AREA
+        doc_flags.append(flags)
+        doc_epoch.append(_epoch(d.get('created_at')))
+        prov = normalize(meta.get('province') or '').replace(' ', '')
+        if prov:
+            if prov not in prov_ids:
+                prov_ids[prov] = len(provinces)
+                provinces.append(prov)
+            doc_prov.append(prov_ids[prov])
+        else:
+            doc_prov.append(-1)
+
+    return {
+        'postings': postings,
+        'doc_kind': doc_kind,
+        'doc_flags': doc_flags,
+        'doc_epoch': doc_epoch,
+        'doc_prov': doc_prov,
+        'meta': {'k1': k1, 'weights': weights, 'b': b, 'provinces': provinces},
+    }
+
+
+def available(idx) -> bool:
+    return np is not None and getattr(idx, 'bm25', None) is not None
+
+
+def score(idx, terms: List[str], ctx: Dict[str, Any], k: int, now: float) -> List[Tuple[float, int]]:
+    """Top-k (điểm đã boost, doc_idx) theo BM25F; các boost giống hệt _boost_score."""
+    n = idx.n_stored
+    doc_parts, impact_parts = [], []
+    for t in terms:
+        p = idx.bm25_postings(t)
+        if p is not None:
+            doc_parts.append(np.frombuffer(p[0], dtype=np.uint32))
+            impact_parts.append(np.frombuffer(p[1], dtype=np.float32))
+    if not doc_parts:
+        return []
+    raw = np.bincount(np.concatenate(doc_parts), weights=np.concatenate(impact_parts), minlength=n)
+    cand = np.flatnonzero(raw > 0)
+    if cand.size == 0:
+        return []
+    scores = raw[cand]
+
+    kind = np.frombuffer(idx.column('doc_kind'), dtype=np.uint8)[cand]
+    flags = np.frombuffer(idx.column('doc_flags'), dtype=np.uint8)[cand]
+
+    # 1. Query type boosting
+    if ctx['is_faq_query']:
+        scores = np.where(kind == KIND_CODES['md'],
+                          scores * np.where(flags & FLAG_FAQ_TITLE, 4.0, 1.8), scores)
+    if ctx['is_vip_query'] and not ctx['is_search_query']:
+        scores = np.where(kind == KIND_CODES['vip'], scores * 3.0, scores)
+    if ctx['is_search_query']:
+        scores = np.where(kind == KIND_CODES['post'], scores * 1.3, scores)
+
+    # 2. Freshness boost: cột epoch, không parse datetime
+    epoch = np.frombuffer(idx.column('doc_epoch'), dtype=np.float64)[cand]
+    with np.errstate(invalid='ignore'):
+        age_days = np.floor((now - epoch) / 86400.0)
+        scores = scores * np.where(age_days <= 7, 1.5, np.where(age_days <= 30, 1.2, 1.0))
+
+    # 3. Metadata matching boost
+    if ctx['price_mentioned']:
+        scores = np.where(flags & FLAG_PRICE, scores * 1.15, scores)
+    if ctx['area_mentioned']:
+        scores = np.where(flags & FLAG_AREA, scores * 1.15, scores)
+    if ctx['mentioned_province']:
+        wanted = ctx['mentioned_province'].replace(' ', '')
+        ids = [i for i, p in enumerate(idx.bm25['provinces']) if wanted in p]
+        if ids:
+            prov = np.frombuffer(idx.column('doc_prov'), dtype=np.int32)[cand]
+            scores = np.where(np.isin(prov, ids), scores * 1.4, scores)
+
+    # 4. Title match bonus: đếm từ của câu hỏi có trong tiêu đề qua cờ bm_title
+    overlap = np.zeros(n, dtype=np.float64)
+    for w in ctx['query_words']:
+        p = idx.bm25_postings(w)
+        if p is not None:
+            docs = np.frombuffer(p[0], dtype=np.uint32)
+            in_title = np.frombuffer(p[2], dtype=np.uint8)
+            overlap[docs[in_title == 1]] += 1.0
+    scores = scores * np.minimum(1.0 + overlap[cand] * 0.15, 2.0)
+
+    k = min(k, cand.size)
+    top = np.argpartition(scores, -k)[-k:]
+    top = top[np.argsort(scores[top], kind='stable')[::-1]]
+    return [(float(scores[i]), int(cand[i])) for i in top]
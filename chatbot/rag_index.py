@@ -4,7 +4,10 @@ from __future__ import annotations
 import json
 import os
 import re
+import threading
+import time
 import unicodedata
+from contextlib import contextmanager
 from dataclasses import dataclass, asdict
 from typing import List, Dict, Any
 import logging
@@ -13,9 +16,21 @@ from django.utils import timezone
 from django.conf import settings
 from django.db import connection
 
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ còn lock trong process
+    fcntl = None
+
+from chatbot import rag_bm25, rag_store, vector_store
+
 logger = logging.getLogger(__name__)
 INDEX_PATH = os.path.join(os.path.dirname(__file__), 'rag_index.json')
 
+# Index thường trú trong process: parse 1 lần, dùng chung (read-only) cho mọi request.
+# Key = đường dẫn tuyệt đối; hot reload khi (mtime_ns, size) của file thay đổi.
+_RESIDENT_LOCK = threading.Lock()
+_RESIDENT: Dict[str, '_ResidentIndex'] = {}
+
 
 def _normalize(text: str) -> str:
     if not text:
@@ -52,6 +67,26 @@ class Doc:
             self.metadata = {}
 
 
+# Exclude files with dynamic VIP pricing info (will use database instead)
+_MD_EXCLUDED_FILES = {
+    'PAYMENT_FLOW.md',   # contains VIP prices; use DB
+    'FREE_VS_VIP.md',    # contains VIP prices; use DB
+}
+
+# Exclude entire subfolders that are developer/internal docs
+_MD_EXCLUDED_SUBDIR_NAMES = {
+    'chatbot',   # internal chatbot docs
+    'goiy_ai',   # internal AI docs
+    'setup',     # environment/setup guides
+    '.git',
+    '__pycache__',
+}
+
+
+def _markdown_root() -> str:
+    return os.path.join(settings.BASE_DIR, 'FILE MD')
+
+
 def _gather_markdown_docs() -> List[Doc]:
     """
     Collect user-facing Markdown docs only.
@@ -59,22 +94,7 @@ def _gather_markdown_docs() -> List[Doc]:
     - Exclude dynamic pricing documents; pricing comes from database.
     - Exclude internal setup/AI docs not meant for end users.
     """
-    root = os.path.join(settings.BASE_DIR, 'FILE MD')
-
-    # Exclude files with dynamic VIP pricing info (will use database instead)
-    EXCLUDED_FILES = {
-        'PAYMENT_FLOW.md',   # contains VIP prices; use DB
-        'FREE_VS_VIP.md',    # contains VIP prices; use DB
-    }
-
-    # Exclude entire subfolders that are developer/internal docs
-    EXCLUDED_SUBDIR_NAMES = {
-        'chatbot',   # internal chatbot docs
-        'goiy_ai',   # internal AI docs
-        'setup',     # environment/setup guides
-        '.git',
-        '__pycache__',
-    }
+    root = _markdown_root()
 
     docs: List[Doc] = []
     if not os.path.isdir(root):
@@ -82,45 +102,48 @@ def _gather_markdown_docs() -> List[Doc]:
 
     for dirpath, dirnames, filenames in os.walk(root):
         # Skip excluded subfolders by mutating dirnames in-place
-        dirnames[:] = [d for d in dirnames if d not in EXCLUDED_SUBDIR_NAMES]
+        dirnames[:] = [d for d in dirnames if d not in _MD_EXCLUDED_SUBDIR_NAMES]
 
         for fn in filenames:
             if not fn.lower().endswith(('.md', '.markdown')):
                 continue
 
-            if fn in EXCLUDED_FILES:
+            if fn in _MD_EXCLUDED_FILES:
                 logger.info(f"⏭️  Skipping {fn} (VIP data from database instead)")
                 continue
 
-            path = os.path.join(dirpath, fn)
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                rel = os.path.relpath(path, settings.BASE_DIR).replace('\\', '/')
-                title = os.path.splitext(os.path.basename(path))[0]
-
-                # Split FAQ.md into sections (each H3 question = 1 doc)
-                if 'FAQ' in title.upper():
-                    sections = _split_faq_sections(content, rel)
-                    docs.extend(sections)
-                else:
-                    # Regular MD file: index as single document
-                    toks = _tokenize(content)
-                    if not toks:
-                        continue
-                    docs.append(Doc(
-                        id=f"md:{rel}",
-                        kind='md',
-                        title=title,
-                        url=f"/docs/{rel}",
-                        text=content[:2000],  # cap text to 2k chars
-                        tokens=toks,
-                    ))
-            except Exception:
-                continue
+            docs.extend(_markdown_file_docs(os.path.join(dirpath, fn)))
     return docs
 
 
+def _markdown_file_docs(path: str) -> List[Doc]:
+    """Doc(s) của 1 file Markdown: FAQ tách theo từng câu hỏi, file thường = 1 doc."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception:
+        return []
+    rel = os.path.relpath(path, settings.BASE_DIR).replace('\\', '/')
+    title = os.path.splitext(os.path.basename(path))[0]
+
+    # Split FAQ.md into sections (each H3 question = 1 doc)
+    if 'FAQ' in title.upper():
+        return _split_faq_sections(content, rel)
+
+    # Regular MD file: index as single document
+    toks = _tokenize(content)
+    if not toks:
+        return []
+    return [Doc(
+        id=f"md:{rel}",
+        kind='md',
+        title=title,
+        url=f"/docs/{rel}",
+        text=content[:2000],  # cap text to 2k chars
+        tokens=toks,
+    )]
+
+
 def _split_faq_sections(content: str, rel_path: str) -> List[Doc]:
     """Split FAQ.md into sections by H2/H3 headings with smart chunking.
 
@@ -202,71 +225,82 @@ def _slugify(text: str) -> str:
     return s.strip('-')[:50]
 
 
-def _gather_posts() -> List[Doc]:
-    """Gather active rental posts with RICH METADATA for better ranking."""
+def _active_posts():
+    """Queryset các tin đang hiển thị (được index vào RAG)."""
     from website.models import RentalPost
     from django.utils import timezone
     from django.db.models import Q
     now = timezone.now()
-    posts = (RentalPost.objects
-             .filter(is_approved=True, is_deleted=False, is_rented=False)
-             .filter(Q(expired_at__isnull=True) | Q(expired_at__gt=now))
-             .select_related('province', 'district')
-             .only('id', 'title', 'description', 'address', 'province__name', 'district__name',
-                   'category', 'price', 'area', 'created_at', 'features'))
-    docs: List[Doc] = []
-    for p in posts:
-        title = p.title or 'Phòng trọ'
-        prov = getattr(p.province, 'name', '') or ''
-        dist = getattr(p.district, 'name', '') or ''
-        addr = ', '.join([a for a in [p.address, dist, prov] if a])
-
-        # Rich text with structured info for better matching
-        cat_label = ''
-        if hasattr(p, 'category') and p.category:
-            # Import here to avoid circular dependency
-            try:
-                from website.models import RentalPost as RP
-                cat_label = dict(RP.CATEGORY_CHOICES).get(p.category, p.category)
-            except Exception:
-                cat_label = p.category
-
-        text_parts = [
-            title,
-            f"Loại: {cat_label}" if cat_label else "",
-            f"Giá: {p.price} triệu/tháng" if p.price else "",
-            f"Diện tích: {p.area}m²" if p.area else "",
-            f"Địa chỉ: {addr}",
-            p.description or '',
-        ]
-        text = '\n'.join([t for t in text_parts if t])
+    return (RentalPost.objects
+            .filter(is_approved=True, is_deleted=False, is_rented=False)
+            .filter(Q(expired_at__isnull=True) | Q(expired_at__gt=now))
+            .select_related('province', 'district')
+            .only('id', 'title', 'description', 'address', 'province__name', 'district__name',
+                  'category', 'price', 'area', 'created_at', 'features'))
 
-        toks = _tokenize(text)
-        if not toks:
-            continue
 
-        # Build metadata for intelligent ranking
-        docs.append(Doc(
-            id=f"post:{p.id}",
-            kind='post',
-            title=title,
-            url=f"/post/{p.id}/",
-            text=text[:1500],  # Increased context
-            tokens=toks,
-            metadata={
-                'category': p.category if hasattr(p, 'category') else None,
-                'price': float(p.price) if p.price else None,
-                'area': float(p.area) if p.area else None,
-                'province': prov,
-                'district': dist,
-                'features': list(p.features) if hasattr(p, 'features') and p.features else [],
-            },
-            created_at=p.created_at.isoformat() if hasattr(p, 'created_at') and p.created_at else None,
-        ))
+def _gather_posts() -> List[Doc]:
+    """Gather active rental posts with RICH METADATA for better ranking."""
+    docs: List[Doc] = []
+    for p in _active_posts():
+        d = _post_doc(p)
+        if d is not None:
+            docs.append(d)
     logger.info(f"📦 Gathered {len(docs)} rental posts with rich metadata")
     return docs
 
 
+def _post_doc(p) -> Doc | None:
+    """Chuyển 1 RentalPost thành Doc (None nếu không có token nào)."""
+    title = p.title or 'Phòng trọ'
+    prov = getattr(p.province, 'name', '') or ''
+    dist = getattr(p.district, 'name', '') or ''
+    addr = ', '.join([a for a in [p.address, dist, prov] if a])
+
+    # Rich text with structured info for better matching
+    cat_label = ''
+    if hasattr(p, 'category') and p.category:
+        # Import here to avoid circular dependency
+        try:
+            from website.models import RentalPost as RP
+            cat_label = dict(RP.CATEGORY_CHOICES).get(p.category, p.category)
+        except Exception:
+            cat_label = p.category
+
+    text_parts = [
+        title,
+        f"Loại: {cat_label}" if cat_label else "",
+        f"Giá: {p.price} triệu/tháng" if p.price else "",
+        f"Diện tích: {p.area}m²" if p.area else "",
+        f"Địa chỉ: {addr}",
+        p.description or '',
+    ]
+    text = '\n'.join([t for t in text_parts if t])
+
+    toks = _tokenize(text)
+    if not toks:
+        return None
+
+    # Build metadata for intelligent ranking
+    return Doc(
+        id=f"post:{p.id}",
+        kind='post',
+        title=title,
+        url=f"/post/{p.id}/",
+        text=text[:1500],  # Increased context
+        tokens=toks,
+        metadata={
+            'category': p.category if hasattr(p, 'category') else None,
+            'price': float(p.price) if p.price else None,
+            'area': float(p.area) if p.area else None,
+            'province': prov,
+            'district': dist,
+            'features': list(p.features) if hasattr(p, 'features') and p.features else [],
+        },
+        created_at=p.created_at.isoformat() if hasattr(p, 'created_at') and p.created_at else None,
+    )
+
+
 def _gather_vip_configs() -> List[Doc]:
     """Gather VIP package configurations from database"""
     from website.models import VIPPackageConfig
@@ -337,18 +371,21 @@ Phù hợp cho: Chủ nhà muốn đăng tin nổi bật với màu {color_displ
     return docs
 
 
-def build_index(save_path: str | None = None, use_embeddings: bool = True) -> Dict[str, Any]:
+def build_index(save_path: str | None = None, use_embeddings: bool = True,
+                chunk_size: int | None = None, batch_size: int | None = None,
+                workers: int | None = None) -> Dict[str, Any]:
     """
     Build both TF-IDF index and vector embeddings with RICH METADATA.
 
     Improvements:
     1. Store metadata (category, price, area, created_at) for each doc
-    2. Incremental indexing support (TODO: future enhancement)
+    2. Incremental indexing: xem apply_changes()/enqueue_post() bên dưới
     3. Better logging and error handling
 
     Args:
         save_path: custom path for TF-IDF JSON index
         use_embeddings: if True, also build vector embeddings (requires sentence-transformers)
+        chunk_size, batch_size, workers: tham số pipeline embeddings (mặc định RAG_EMBED_*)
     """
     logger.info("🔨 Building RAG index...")
     docs = _gather_markdown_docs() + _gather_posts() + _gather_vip_configs()
@@ -363,83 +400,537 @@ def build_index(save_path: str | None = None, use_embeddings: bool = True) -> Di
             df[t] = df.get(t, 0) + 1
     n_docs = max(1, len(docs))
 
-    stored = []
-    for d in docs:
-        tf = {}
-        for t in d.tokens:
-            tf[t] = tf.get(t, 0) + 1
-
-        # Store with RICH METADATA for intelligent ranking
-        stored.append({
-            'id': d.id,
-            'kind': d.kind,
-            'title': d.title,
-            'url': d.url,
-            'text': d.text,
-            'len': len(d.tokens),
-            'tf': tf,
-            'metadata': d.metadata,  # NEW: rich metadata
-            'created_at': d.created_at,  # NEW: for freshness scoring
-        })
+    stored = [_stored_doc(d) for d in docs]
 
     index = {
         'n_docs': n_docs,
         'df': df,
         'docs': stored,
-        'built_at': timezone.now().isoformat() if 'timezone' in dir() else None,
-        'version': '2.0',  # Upgraded version with metadata
+        'built_at': timezone.now().isoformat(),
+        'version': '2.1',  # 2.1: thêm inverted-index postings + idf
     }
-
+    _attach_postings(index)
     dest = save_path or INDEX_PATH
+    with _index_write_lock(dest):
+        _save_index(index, dest)
+
+    # 2. Build vector embeddings (optional, requires sentence-transformers)
+    if use_embeddings:
+        index['embedding_stats'] = _build_vector_index(
+            docs, chunk_size=chunk_size, batch_size=batch_size, workers=workers)
+
+    return index
+
+
+def _stored_doc(d: Doc) -> Dict[str, Any]:
+    tf: Dict[str, int] = {}
+    for t in d.tokens:
+        tf[t] = tf.get(t, 0) + 1
+
+    # Store with RICH METADATA for intelligent ranking
+    return {
+        'id': d.id,
+        'kind': d.kind,
+        'title': d.title,
+        'url': d.url,
+        'text': d.text,
+        'len': len(d.tokens),
+        'tf': tf,
+        'metadata': d.metadata,  # NEW: rich metadata
+        'created_at': d.created_at,  # NEW: for freshness scoring
+    }
+
+
+def _save_index(index: Dict[str, Any], dest: str) -> None:
+    """Ghi JSON + bản nhị phân rồi swap bản thường trú của process này."""
     try:
-        with open(dest, 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
-        logger.info(f"✅ Saved TF-IDF index v2.0: {dest} ({n_docs} docs)")
+        # Ghi ra file tạm rồi os.replace → worker khác không bao giờ đọc phải file ghi dở.
+        # JSON (compact) chỉ còn là bản export/fallback; worker đọc bản nhị phân.
+        tmp = f"{dest}.tmp{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, dest)
+        logger.info(f"✅ Saved TF-IDF index v{index['version']}: {dest} "
+                    f"({index['n_docs']} docs, {len(index['postings'])} terms)")
     except Exception as e:
         logger.error(f"❌ Failed to save TF-IDF index: {e}")
 
-    # 2. Build vector embeddings (optional, requires sentence-transformers)
-    if use_embeddings:
-        _build_vector_index(docs)
+    resident = None
+    try:
+        bm25 = rag_bm25.build_sections(index, _tokenize, _normalize)
+        bin_path = rag_store.write_binary(index, rag_store.binary_path(dest), bm25=bm25)
+        resident = rag_store.BinaryIndex(bin_path)
+        logger.info(f"✅ Saved binary RAG index: {bin_path}")
+    except Exception as e:
+        logger.error(f"❌ Failed to save binary RAG index: {e}")
+    if resident is None and os.path.exists(dest):
+        resident = rag_store.DictIndex(index)
+    if resident is not None:
+        _publish_index(dest, resident)
+
+
+def _attach_postings(index: Dict[str, Any]) -> Dict[str, Any]:
+    """Sinh inverted index term → postings từ danh sách doc đã lưu.
 
+    postings[term] = {'docs': [doc_idx...], 'w': [tf/len...], 'max_w': max(w)}
+    idf[term] tính sẵn lúc build để query không phải tính lại.
+    Index cũ (v2.0, chưa có postings) được bổ sung ngay khi load.
+    """
+    df = index['df']
+    n_docs = index['n_docs']
+    postings: Dict[str, Dict[str, Any]] = {}
+    for doc_idx, d in enumerate(index['docs']):
+        dl = max(1, d['len'])
+        for t, c in d['tf'].items():
+            w = c / dl
+            p = postings.get(t)
+            if p is None:
+                p = postings[t] = {'docs': [], 'w': [], 'max_w': 0.0}
+            p['docs'].append(doc_idx)
+            p['w'].append(w)
+            if w > p['max_w']:
+                p['max_w'] = w
+    index['postings'] = postings
+    index['idf'] = {t: _idf(df, n_docs, t) for t in postings}
     return index
 
 
-def _build_vector_index(docs: List[Doc]):
-    """Build and store vector embeddings for all documents."""
+def _peak_rss_mb() -> float | None:
+    """Peak RSS của process (MB); None trên nền tảng không có module resource."""
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về bytes
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except Exception:
+        return None
+
+
+def _chunked(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _build_vector_index(docs, chunk_size: int | None = None, batch_size: int | None = None,
+                        workers: int | None = None) -> Dict[str, Any] | None:
+    """Build and store vector embeddings for all documents (streaming, bounded memory).
+
+    - Đọc docs theo chunk (RAG_EMBED_CHUNK_SIZE), encode (embedding_service tự chia batch
+      RAG_EMBED_BATCH_SIZE và bỏ qua text đã có trong cache), upsert ngay từng chunk.
+    - RAG_EMBED_WORKERS > 1: encode các chunk kế tiếp trong thread pool (tokenize + forward
+      của model nhả GIL) trong khi thread chính ghi DB; tối đa workers+1 chunk trong RAM.
+    - Không xóa bảng trước: row cũ được ghi đè tại chỗ, row không còn trong corpus chỉ bị
+      xóa ở cuối, rồi mới export vector store → search vẫn dùng bản cũ suốt quá trình build.
+
+    Trả về thống kê {'docs', 'seconds', 'docs_per_sec', 'peak_rss_mb', 'removed'}.
+    """
     try:
         from chatbot import embedding_service
         from chatbot.models import VectorDocument
     except ImportError:
         logger.warning("⚠️ Cannot import embedding_service or VectorDocument")
-        return
+        return None
+
+    chunk_size = chunk_size or int(getattr(settings, 'RAG_EMBED_CHUNK_SIZE', 256))
+    workers = workers or int(getattr(settings, 'RAG_EMBED_WORKERS', 1))
+    started = time.perf_counter()
+    seen_ids = set()
+    stored = 0
+
+    def _encode(chunk):
+        return chunk, embedding_service.encode([d.text for d in chunk], batch_size=batch_size)
+
+    def _upsert(chunk, embeddings) -> int:
+        rows = [
+            VectorDocument(
+                doc_id=doc.id,
+                kind=doc.kind,
+                title=doc.title,
+                url=doc.url,
+                text_snippet=doc.text[:400],
+                embedding_pgvector=vector_store.to_bytes(emb) if vector_store.is_available() else None,
+                embedding_json=json.dumps(emb),  # fallback storage
+            )
+            for doc, emb in zip(chunk, embeddings)
+        ]
+        VectorDocument.objects.bulk_create(
+            rows, batch_size=100, update_conflicts=True, unique_fields=['doc_id'],
+            update_fields=['kind', 'title', 'url', 'text_snippet', 'embedding_pgvector', 'embedding_json', 'updated_at'],
+        )
+        return len(rows)
+
+    chunks = _chunked(docs, chunk_size)
+    if workers > 1:
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+
+        def _results():
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rag-embed') as pool:
+                inflight = deque()
+                for chunk in chunks:
+                    inflight.append(pool.submit(_encode, chunk))
+                    if len(inflight) > workers:
+                        yield inflight.popleft().result()
+                while inflight:
+                    yield inflight.popleft().result()
+        results = _results()
+    else:
+        results = (_encode(chunk) for chunk in chunks)
+
+    for chunk, embeddings in results:
+        if embeddings is None:
+            logger.warning("⚠️ Embeddings not available (sentence-transformers not installed?) → giữ nguyên vector cũ")
+            return None
+        stored += _upsert(chunk, embeddings)
+        seen_ids.update(d.id for d in chunk)
+        elapsed = time.perf_counter() - started
+        logger.info(f"🧮 Embedded {stored} docs ({stored / elapsed if elapsed else 0:.1f} docs/s)")
+
+    # Commit: xóa doc không còn trong corpus rồi swap vector store cho mọi worker
+    removed = 0
+    stale_pks = [pk for pk, doc_id in VectorDocument.objects.values_list('pk', 'doc_id').iterator(chunk_size=2000)
+                 if doc_id not in seen_ids]
+    for s in range(0, len(stale_pks), 500):
+        removed += VectorDocument.objects.filter(pk__in=stale_pks[s:s + 500]).delete()[0]
+    vector_store.export_from_db()
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'docs': stored,
+        'removed': removed,
+        'seconds': round(elapsed, 2),
+        'docs_per_sec': round(stored / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+    logger.info(f"✅ Stored {stored} vector embeddings in DB, removed {removed} stale "
+                f"({stats['docs_per_sec']} docs/s, peak RSS {stats['peak_rss_mb']} MB)")
+    return stats
+
+
+# ===== Incremental indexing =====
+# Thay vì rebuild toàn bộ (gather lại mọi post + encode lại mọi embedding), mỗi thay đổi
+# nhỏ được áp dụng như 1 delta: bỏ đúng các doc bị ảnh hưởng, thêm bản mới, vá postings/df
+# của đúng các term liên quan rồi ghi lại index. Signal chỉ enqueue key, worker nền gom
+# các key trong vài giây và áp dụng 1 lần → request của admin/chủ nhà không phải chờ.
+#
+# Load → vá → ghi chạy trong file lock (<index>.lock) nên các process ghi lần lượt,
+# không process nào ghi đè delta của process khác.
+
+_WRITE_LOCK = threading.Lock()
+
+
+@contextmanager
+def _index_write_lock(dest: str):
+    """Serialize ghi index giữa các thread (threading.Lock) và các process (flock)."""
+    with _WRITE_LOCK:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{dest}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _posting_pos(doc_ids: List[int], doc_idx: int) -> int:
+    # Doc mới thêm / doc cuối nằm ở cuối postings → dò từ cuối lên
+    for i in range(len(doc_ids) - 1, -1, -1):
+        if doc_ids[i] == doc_idx:
+            return i
+    raise ValueError(doc_idx)
 
-    # Clear old embeddings
-    VectorDocument.objects.all().delete()
-    logger.info(f"🗑️ Cleared old vector embeddings")
 
-    # Encode all docs
-    texts = [d.text for d in docs]
-    embeddings = embedding_service.encode(texts)
+def _patch_postings(index: Dict[str, Any], remove: List[int], added: List[Dict[str, Any]]) -> set:
+    """Vá postings/df tại chỗ: chỉ đụng tới term của doc bị xóa/thêm (và doc bị dời chỗ).
 
-    if embeddings is None:
-        logger.warning("⚠️ Embeddings not available (sentence-transformers not installed?)")
+    Doc bị xóa được thay bằng doc cuối danh sách (swap-remove) nên chỉ postings của
+    doc cuối phải đổi doc_idx, không phải đánh số lại cả corpus. Trả về các term đã đổi.
+    """
+    docs = index['docs']
+    df = index['df']
+    postings = index['postings']
+    touched = set()
+
+    for doc_idx in sorted(remove, reverse=True):
+        d = docs[doc_idx]
+        for t in d['tf']:
+            p = postings[t]
+            pos = _posting_pos(p['docs'], doc_idx)
+            w = p['w'][pos]
+            p['docs'][pos] = p['docs'][-1]
+            p['w'][pos] = p['w'][-1]
+            p['docs'].pop()
+            p['w'].pop()
+            c = df.get(t, 0) - 1
+            if c > 0 and p['docs']:
+                df[t] = c
+                if w >= p['max_w']:
+                    p['max_w'] = max(p['w'])
+            else:
+                df.pop(t, None)
+                postings.pop(t, None)
+                index['idf'].pop(t, None)
+            touched.add(t)
+        last = len(docs) - 1
+        if doc_idx != last:
+            moved = docs[last]
+            for t in moved['tf']:
+                p = postings[t]
+                p['docs'][_posting_pos(p['docs'], last)] = doc_idx
+            docs[doc_idx] = moved
+        docs.pop()
+
+    for d in added:
+        doc_idx = len(docs)
+        docs.append(d)
+        dl = max(1, d['len'])
+        for t, c in d['tf'].items():
+            w = c / dl
+            p = postings.get(t)
+            if p is None:
+                p = postings[t] = {'docs': [], 'w': [], 'max_w': 0.0}
+            p['docs'].append(doc_idx)
+            p['w'].append(w)
+            if w > p['max_w']:
+                p['max_w'] = w
+            df[t] = df.get(t, 0) + 1
+            touched.add(t)
+    return touched
+
+
+def apply_changes(upserts: List[Doc] = (), delete_ids=(), delete_prefixes=(),
+                  save_path: str | None = None, use_embeddings: bool = True) -> Dict[str, Any] | None:
+    """Thêm/cập nhật/xóa từng doc trong index hiện có (không gather lại toàn bộ).
+
+    Args:
+        upserts: Doc mới hoặc đã sửa (doc cùng id bị thay thế)
+        delete_ids: id doc cần xóa (vd. 'post:12')
+        delete_prefixes: xóa mọi doc có id bắt đầu bằng prefix (vd. 'vip:')
+        save_path: đường dẫn index JSON (mặc định INDEX_PATH)
+        use_embeddings: cập nhật VectorDocument cho đúng các doc bị ảnh hưởng
+    """
+    dest = save_path or INDEX_PATH
+    upserts = list(upserts)
+    replace_ids = {d.id for d in upserts} | set(delete_ids)
+    prefixes = tuple(delete_prefixes)
+
+    with _index_write_lock(dest):
+        index = _load_index(dest)
+        if index is not None:
+            if index.get('postings') is None:
+                _attach_postings(index)  # index v2.0 cũ: sinh postings 1 lần
+            remove = [i for i, d in enumerate(index['docs'])
+                      if d['id'] in replace_ids or (prefixes and d['id'].startswith(prefixes))]
+            old_n = index['n_docs']
+            touched = _patch_postings(index, remove, [_stored_doc(d) for d in upserts])
+            index['n_docs'] = max(1, len(index['docs']))
+            index['built_at'] = timezone.now().isoformat()
+            index['version'] = '2.1'
+            # idf phụ thuộc n_docs: số doc đổi → tính lại idf mọi term (chỉ là phép log
+            # trên từ điển), còn không thì chỉ các term vừa đổi df
+            df, n_docs, idf = index['df'], index['n_docs'], index['idf']
+            for t in (index['postings'] if n_docs != old_n else touched & index['postings'].keys()):
+                idf[t] = _idf(df, n_docs, t)
+            _save_index(index, dest)
+    if index is None:
+        logger.info("ℹ️ No RAG index on disk yet → full build")
+        return build_index(dest, use_embeddings=use_embeddings)
+
+    logger.info(f"🔁 Incremental RAG update: -{len(remove)} +{len(upserts)} docs → {index['n_docs']} docs")
+    if use_embeddings:
+        _update_vector_index(upserts, replace_ids, prefixes)
+    return index
+
+
+def _update_vector_index(upserts: List[Doc], delete_ids, delete_prefixes) -> None:
+    """Xóa/encode lại embedding của đúng các doc bị ảnh hưởng."""
+    try:
+        from django.db.models import Q
+        from chatbot import embedding_service
+        from chatbot.models import VectorDocument
+    except ImportError:
         return
 
-    # Store in DB
-    vector_docs = []
-    for doc, emb in zip(docs, embeddings):
-        vector_docs.append(VectorDocument(
-            doc_id=doc.id,
-            kind=doc.kind,
-            title=doc.title,
-            url=doc.url,
-            text_snippet=doc.text[:400],
-            embedding_json=json.dumps(emb),  # fallback storage
-        ))
+    try:
+        if not VectorDocument.objects.exists():
+            # Chưa từng build embeddings (free tier) → không load model trong web process
+            return
+        cond = Q(doc_id__in=list(delete_ids))
+        for prefix in delete_prefixes:
+            cond |= Q(doc_id__startswith=prefix)
+        VectorDocument.objects.filter(cond).delete()
+
+        if not upserts:
+            vector_store.export_from_db()
+            return
+        embeddings = embedding_service.encode([d.text for d in upserts])
+        if embeddings is None:
+            return
+        VectorDocument.objects.bulk_create([
+            VectorDocument(
+                doc_id=doc.id,
+                kind=doc.kind,
+                title=doc.title,
+                url=doc.url,
+                text_snippet=doc.text[:400],
+                embedding_pgvector=vector_store.to_bytes(emb) if vector_store.is_available() else None,
+                embedding_json=json.dumps(emb),
+            )
+            for doc, emb in zip(upserts, embeddings)
+        ], batch_size=100)
+        vector_store.export_from_db()
+    except Exception as e:
+        logger.warning(f"⚠️ Incremental vector update failed: {e}")
+
+
+def _is_indexed_markdown(rel_path: str) -> bool:
+    parts = rel_path.replace('\\', '/').split('/')
+    if len(parts) < 2 or parts[0] != 'FILE MD':
+        return False
+    if any(p in _MD_EXCLUDED_SUBDIR_NAMES for p in parts[1:-1]):
+        return False
+    fn = parts[-1]
+    return fn.lower().endswith(('.md', '.markdown')) and fn not in _MD_EXCLUDED_FILES
+
+
+def update_documents(post_ids=(), vip_configs: bool = False, markdown=(),
+                     save_path: str | None = None, use_embeddings: bool = True) -> Dict[str, Any] | None:
+    """Đồng bộ lại index cho các post / bảng giá VIP / file Markdown chỉ định.
+
+    Post không còn hiển thị (chưa duyệt, đã xóa, đã cho thuê, hết hạn) bị gỡ khỏi index.
+    markdown: đường dẫn tương đối từ BASE_DIR, vd. 'FILE MD/FAQ.md'.
+    """
+    upserts: List[Doc] = []
+    delete_ids = set()
+    prefixes = set()
+
+    post_ids = list(post_ids)
+    if post_ids:
+        live = {p.id: p for p in _active_posts().filter(pk__in=post_ids)}
+        for pid in post_ids:
+            delete_ids.add(f"post:{pid}")
+            doc = _post_doc(live[pid]) if pid in live else None
+            if doc is not None:
+                upserts.append(doc)
+
+    if vip_configs:
+        prefixes.add('vip:')
+        upserts.extend(_gather_vip_configs())
+
+    for rel in markdown:
+        rel = rel.replace('\\', '/')
+        delete_ids.add(f"md:{rel}")
+        prefixes.add(f"md:{rel}#")
+        path = os.path.join(settings.BASE_DIR, rel)
+        if _is_indexed_markdown(rel) and os.path.isfile(path):
+            upserts.extend(_markdown_file_docs(path))
+
+    if not upserts and not delete_ids and not prefixes:
+        return None
+    return apply_changes(upserts, delete_ids, prefixes, save_path=save_path, use_embeddings=use_embeddings)
+
 
-    VectorDocument.objects.bulk_create(vector_docs, batch_size=100)
-    logger.info(f"✅ Stored {len(vector_docs)} vector embeddings in DB")
+def prune_inactive_posts(save_path: str | None = None, use_embeddings: bool = True) -> int:
+    """Gỡ khỏi index các post không còn hiển thị (hết hạn không phát signal nào).
+
+    Chạy định kỳ cùng check_expired_posts; trả về số post bị gỡ.
+    """
+    index = _load_index(save_path or INDEX_PATH)
+    if index is None:
+        return 0
+    indexed = {int(d['id'].split(':', 1)[1]) for d in index['docs'] if d['kind'] == 'post'}
+    if not indexed:
+        return 0
+    live = set(_active_posts().filter(pk__in=indexed).values_list('pk', flat=True))
+    stale = sorted(indexed - live)
+    if stale:
+        update_documents(post_ids=stale, save_path=save_path, use_embeddings=use_embeddings)
+    return len(stale)
+
+
+# Hàng đợi delta: key = ('post', pk) | ('vip', None) | ('md', rel_path); set → tự gộp trùng
+_QUEUE_LOCK = threading.Lock()
+_PENDING: set = set()
+_QUEUE_WAKE = threading.Event()
+_WORKER: threading.Thread | None = None
+
+
+def enqueue_post(post_id: int) -> None:
+    """Gọi từ signal RentalPost: index lại post sau khi transaction commit."""
+    _enqueue(('post', post_id))
+
+
+def enqueue_vip_configs() -> None:
+    """Gọi từ signal VIPPackageConfig: sinh lại các doc 'vip:*'."""
+    _enqueue(('vip', None))
+
+
+def enqueue_markdown(rel_path: str) -> None:
+    _enqueue(('md', rel_path))
+
+
+def _enqueue(key: tuple) -> None:
+    if not getattr(settings, 'RAG_AUTO_INDEX', True):
+        return
+    from django.db import transaction
+
+    def _push():
+        with _QUEUE_LOCK:
+            _PENDING.add(key)
+        _ensure_worker()
+        _QUEUE_WAKE.set()
+
+    # Chỉ đọc DB sau khi commit, nếu không worker có thể thấy dữ liệu cũ
+    transaction.on_commit(_push)
+
+
+def _ensure_worker() -> None:
+    global _WORKER
+    with _QUEUE_LOCK:
+        if _WORKER is not None and _WORKER.is_alive():
+            return
+        _WORKER = threading.Thread(target=_worker_loop, name='rag-index-updater', daemon=True)
+        _WORKER.start()
+
+
+def _worker_loop() -> None:
+    debounce = float(getattr(settings, 'RAG_INDEX_DEBOUNCE_SECONDS', 2.0))
+    while True:
+        _QUEUE_WAKE.wait()
+        # Gom các thay đổi dồn dập (vd. admin sửa nhiều tin liên tiếp) thành 1 lần ghi
+        time.sleep(debounce)
+        _QUEUE_WAKE.clear()
+        try:
+            flush_pending()
+        except Exception as e:
+            logger.error(f"❌ Incremental RAG update failed: {e}")
+        finally:
+            connection.close()
+
+
+def flush_pending(save_path: str | None = None) -> Dict[str, Any] | None:
+    """Áp dụng ngay mọi delta đang chờ (worker nền gọi; test/command cũng có thể gọi)."""
+    with _QUEUE_LOCK:
+        keys = set(_PENDING)
+        _PENDING.clear()
+    if not keys:
+        return None
+    return update_documents(
+        post_ids=sorted(k[1] for k in keys if k[0] == 'post'),
+        vip_configs=any(k[0] == 'vip' for k in keys),
+        markdown=sorted(k[1] for k in keys if k[0] == 'md'),
+        save_path=save_path,
+        use_embeddings=getattr(settings, 'RAG_INCREMENTAL_EMBEDDINGS', True),
+    )
 
 
 def _load_index(path: str | None = None) -> Dict[str, Any] | None:
@@ -453,6 +944,99 @@ def _load_index(path: str | None = None) -> Dict[str, Any] | None:
         return None
 
 
+@dataclass(frozen=True)
+class _ResidentIndex:
+    path: str
+    stamp: tuple  # ((mtime_ns, size) của .bin, (mtime_ns, size) của .json) lúc load
+    data: Any  # rag_store.BinaryIndex | rag_store.DictIndex
+
+
+def _file_stamp(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _index_stamp(src: str) -> tuple:
+    return (_file_stamp(rag_store.binary_path(src)), _file_stamp(src))
+
+
+def _open_index(src: str):
+    """Mở index: ưu tiên bản nhị phân (mmap), fallback sang JSON."""
+    bin_path = rag_store.binary_path(src)
+    if os.path.exists(bin_path):
+        try:
+            return rag_store.BinaryIndex(bin_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Cannot open binary RAG index {bin_path}: {e}. Falling back to JSON.")
+    data = _load_index(src)
+    if data is None:
+        return None
+    if data.get('postings') is None:
+        _attach_postings(data)
+    return rag_store.DictIndex(data)
+
+
+def _publish_index(path: str, data) -> None:
+    """Đưa index vừa build vào bộ nhớ thường trú (swap nguyên khối, không parse lại)."""
+    src = os.path.abspath(path)
+    stamp = _index_stamp(src)
+    with _RESIDENT_LOCK:
+        _RESIDENT[src] = _ResidentIndex(path=src, stamp=stamp, data=data)
+
+
+def get_index(path: str | None = None):
+    """Trả về index thường trú của process, chỉ load lại khi file trên đĩa đổi.
+
+    Mỗi query chỉ tốn vài lần os.stat thay vì json.load toàn bộ file. Khi
+    build_index/reload_rag_cache ghi phiên bản mới (mtime/size đổi), request kế
+    tiếp sẽ load bản mới và swap nguyên khối; request đang chạy vẫn giữ tham chiếu
+    tới bản cũ nên không bao giờ thấy index dở dang.
+
+    Bản nhị phân (.bin) được mmap nên các worker dùng chung page của OS; chỉ khi
+    chưa có .bin mới parse file JSON. Kết quả là rag_store.BinaryIndex hoặc
+    rag_store.DictIndex, dùng chung giữa các request → coi là read-only.
+    """
+    src = os.path.abspath(path or INDEX_PATH)
+    stamp = _index_stamp(src)
+    current = _RESIDENT.get(src)
+    if stamp == (None, None):
+        # File bị xóa: tiếp tục phục vụ bản đang có (nếu có)
+        return current.data if current else None
+    if current is not None and current.stamp == stamp:
+        return current.data
+
+    with _RESIDENT_LOCK:
+        current = _RESIDENT.get(src)
+        if current is not None and current.stamp == stamp:
+            return current.data
+        data = _open_index(src)
+        if data is None:
+            return current.data if current else None
+        _RESIDENT[src] = _ResidentIndex(path=src, stamp=stamp, data=data)
+        logger.info(f"📥 Loaded RAG index into memory: {src} ({data.n_docs} docs, "
+                    f"{type(data).__name__}, built_at={data.built_at})")
+        return data
+
+
+def reload_index(path: str | None = None):
+    """Bỏ bản thường trú hiện tại và load lại từ đĩa (dùng cho management command)."""
+    src = os.path.abspath(path or INDEX_PATH)
+    with _RESIDENT_LOCK:
+        _RESIDENT.pop(src, None)
+    return get_index(src)
+
+
+def touch_index(path: str | None = None) -> None:
+    """Bump mtime của các file index → mọi worker đang chạy tự load lại ở query kế tiếp."""
+    src = path or INDEX_PATH
+    for p in (src, rag_store.binary_path(src)):
+        if os.path.exists(p):
+            os.utime(p, None)
+
+
 def _idf(df: Dict[str, int], n_docs: int, term: str) -> float:
     import math
     return math.log((n_docs + 1) / (1 + df.get(term, 0))) + 1.0
@@ -559,38 +1143,14 @@ def query(text: str, k: int = 5, index_path: str | None = None, use_semantic: bo
     return results[:k]
 
 
-def _query_tfidf(text: str, k: int = 5, index_path: str | None = None, original_query: str = None) -> List[Dict[str, Any]]:
-    """ADVANCED TF-IDF retrieval with context-aware scoring.
-
-    Enhancements:
-    1. Query intent detection (FAQ vs search vs VIP)
-    2. Metadata-based boosting (price, area, location match)
-    3. Freshness boost for recent posts
-    4. Title matching bonus
-    """
-    idx = _load_index(index_path)
-    if idx is None:
-        # Try to build on the fly if DB is accessible
-        try:
-            with connection.cursor():
-                pass
-            idx = build_index(index_path, use_embeddings=False)
-        except Exception:
-            return []
-
-    q_tokens = _tokenize(text)
-    if not q_tokens:
-        return []
-
-    df = idx['df']
-    n_docs = idx['n_docs']
-    docs = idx['docs']
+# Trần trên của tích các hệ số boost trong _boost_score (FAQ 4.0 × fresh 1.5 × price 1.15
+# × area 1.15 × location 1.4 × title 2.0). Dùng cho max-score pruning: doc có điểm thô s
+# không bao giờ vượt quá s * _MAX_BOOST sau khi boost (mọi hệ số đều >= 1).
+_MAX_BOOST = 4.0 * 1.5 * 1.15 * 1.15 * 1.4 * 2.0
 
-    q_tf: Dict[str, int] = {}
-    for t in q_tokens:
-        q_tf[t] = q_tf.get(t, 0) + 1
 
-    # Detect query type for smart boosting
+def _query_context(text: str, original_query: str | None) -> Dict[str, Any]:
+    """Phân tích intent/metadata của câu hỏi 1 lần cho mỗi query (không lặp theo doc)."""
     query_to_analyze = original_query if original_query else text
     text_lower = query_to_analyze.lower()
 
@@ -603,7 +1163,6 @@ def _query_tfidf(text: str, k: int = 5, index_path: str | None = None, original_
     is_search_query = any(kw in text_lower for kw in ['tìm', 'phòng', 'thuê', 'nhà', 'trọ', 'căn hộ', 'có phòng'])
 
     # Extract context from query for metadata matching
-    import re
     price_mentioned = bool(re.search(r'\d+\s*(triệu|tr|trieu|vnd)', text_lower))
     area_mentioned = bool(re.search(r'\d+\s*(m2|m²|met)', text_lower))
 
@@ -616,146 +1175,204 @@ def _query_tfidf(text: str, k: int = 5, index_path: str | None = None, original_
             mentioned_province = prov
             break
 
-    scores: List[tuple[float, Dict[str, Any]]] = []
-    for d in docs:
-        dl = max(1, d['len'])
+    return {
+        'is_faq_query': is_faq_query,
+        'is_vip_query': is_vip_query,
+        'is_search_query': is_search_query,
+        'price_mentioned': price_mentioned,
+        'area_mentioned': area_mentioned,
+        'mentioned_province': mentioned_province,
+        'query_words': set(_tokenize(text_lower)),
+    }
 
-        # Base TF-IDF score
-        score = 0.0
-        for t, qf in q_tf.items():
-            if t not in d['tf']:
-                continue
-            idf = _idf(df, n_docs, t)
-            score += (d['tf'][t] / dl) * idf
 
-        if score <= 0:
+def _boost_score(score: float, d: Dict[str, Any], ctx: Dict[str, Any]) -> float:
+    """Áp các hệ số boost theo intent, độ mới, metadata và tiêu đề lên điểm thô."""
+    # 1. Query type boosting
+    if d['kind'] == 'md':
+        if ctx['is_faq_query'] and 'FAQ' in d['title'].upper():
+            score *= 4.0  # Strong boost for FAQ when user asks "how to"
+        elif ctx['is_faq_query']:
+            score *= 1.8
+    elif d['kind'] == 'vip':
+        if ctx['is_vip_query'] and not ctx['is_search_query']:
+            score *= 3.0  # Boost VIP docs when asking about pricing
+    elif d['kind'] == 'post':
+        if ctx['is_search_query']:
+            score *= 1.3  # Boost posts for search queries
+
+    # 2. Freshness boost (newer posts rank higher)
+    try:
+        if d.get('created_at'):
+            from datetime import datetime, timezone as tz
+            created = datetime.fromisoformat(d['created_at'])
+            age_days = (datetime.now(tz.utc) - created).days
+            if age_days <= 7:
+                score *= 1.5  # Fresh content
+            elif age_days <= 30:
+                score *= 1.2
+    except Exception:
+        pass
+
+    # 3. Metadata matching boost
+    metadata = d.get('metadata') or {}
+    if metadata:
+        # Price relevance
+        if ctx['price_mentioned'] and metadata.get('price'):
+            score *= 1.15
+
+        # Area relevance
+        if ctx['area_mentioned'] and metadata.get('area'):
+            score *= 1.15
+
+        # Location match
+        mentioned_province = ctx['mentioned_province']
+        if mentioned_province:
+            doc_prov = _normalize(metadata.get('province', ''))
+            if mentioned_province.replace(' ', '') in doc_prov.replace(' ', ''):
+                score *= 1.4  # Strong boost for location match
+
+    # 4. Title match bonus (exact words in title = more relevant)
+    title_words = set(_tokenize(d.get('title', '')))
+    overlap = len(ctx['query_words'] & title_words)
+    if overlap > 0:
+        title_boost = 1.0 + (overlap * 0.15)  # +15% per matching word
+        score *= min(title_boost, 2.0)  # Cap at 2x
+
+    return score
+
+
+def _accumulate_postings(idx, terms: List[str], k: int) -> Dict[int, float]:
+    """Tính điểm TF-IDF thô chỉ trên các doc chứa term của query (term-at-a-time).
+
+    Max-score pruning: xử lý term theo trần điểm (idf × max tf/len) giảm dần. Khi tổng
+    trần của các term còn lại (nhân _MAX_BOOST) đã nhỏ hơn điểm thô thứ k hiện có thì
+    doc chưa gặp không thể lọt top-k → chỉ cộng tiếp cho các doc đã có trong accumulator.
+    """
+    import heapq
+
+    plan = []
+    for t in terms:
+        p = idx.postings(t)
+        if p is None:
             continue
+        doc_ids, weights, max_w, term_idf = p
+        plan.append((term_idf * max_w, term_idf, doc_ids, weights))
+    plan.sort(key=lambda x: x[0], reverse=True)
+
+    remaining_ub = sum(x[0] for x in plan)
+    acc: Dict[int, float] = {}
+    admit_new = True
+    for ub, term_idf, doc_ids, weights in plan:
+        if admit_new and len(acc) >= k:
+            theta = heapq.nlargest(k, acc.values())[-1]
+            if remaining_ub * _MAX_BOOST < theta:
+                admit_new = False
+        for doc_idx, w in zip(doc_ids, weights):
+            cur = acc.get(doc_idx)
+            if cur is None:
+                if not admit_new:
+                    continue
+                cur = 0.0
+            acc[doc_idx] = cur + w * term_idf
+        remaining_ub -= ub
+    return acc
+
+
+def _query_tfidf(text: str, k: int = 5, index_path: str | None = None, original_query: str = None) -> List[Dict[str, Any]]:
+    """ADVANCED TF-IDF retrieval with context-aware scoring.
+
+    Enhancements:
+    1. Query intent detection (FAQ vs search vs VIP)
+    2. Metadata-based boosting (price, area, location match)
+    3. Freshness boost for recent posts
+    4. Title matching bonus
+    5. Inverted-index postings: chỉ chấm điểm doc chứa term của query, có early termination
+    6. settings.RAG_SCORING = 'bm25f': BM25F theo field + boost bằng phép toán mảng
+       (rag_bm25, cần NumPy và index nhị phân; thiếu thì tự quay về TF-IDF)
+    """
+    import heapq
 
-        # === INTELLIGENT BOOSTING ===
-
-        # 1. Query type boosting
-        if d['kind'] == 'md':
-            if is_faq_query and 'FAQ' in d['title'].upper():
-                score *= 4.0  # Strong boost for FAQ when user asks "how to"
-            elif is_faq_query:
-                score *= 1.8
-        elif d['kind'] == 'vip':
-            if is_vip_query and not is_search_query:
-                score *= 3.0  # Boost VIP docs when asking about pricing
-        elif d['kind'] == 'post':
-            if is_search_query:
-                score *= 1.3  # Boost posts for search queries
-
-        # 2. Freshness boost (newer posts rank higher)
+    idx = get_index(index_path)
+    if idx is None:
+        # Try to build on the fly if DB is accessible
         try:
-            if d.get('created_at'):
-                from datetime import datetime, timezone as tz
-                created = datetime.fromisoformat(d['created_at'])
-                age_days = (datetime.now(tz.utc) - created).days
-                if age_days <= 7:
-                    score *= 1.5  # Fresh content
-                elif age_days <= 30:
-                    score *= 1.2
+            with connection.cursor():
+                pass
+            idx = build_index(index_path, use_embeddings=False)
         except Exception:
-            pass
-
-        # 3. Metadata matching boost
-        metadata = d.get('metadata') or {}
-        if metadata:
-            # Price relevance
-            if price_mentioned and metadata.get('price'):
-                score *= 1.15
-
-            # Area relevance
-            if area_mentioned and metadata.get('area'):
-                score *= 1.15
-
-            # Location match
-            if mentioned_province:
-                doc_prov = _normalize(metadata.get('province', ''))
-                if mentioned_province.replace(' ', '') in doc_prov.replace(' ', ''):
-                    score *= 1.4  # Strong boost for location match
-
-        # 4. Title match bonus (exact words in title = more relevant)
-        title_lower = _normalize(d.get('title', ''))
-        query_words = set(_tokenize(text_lower))
-        title_words = set(_tokenize(title_lower))
-        overlap = len(query_words & title_words)
-        if overlap > 0:
-            title_boost = 1.0 + (overlap * 0.15)  # +15% per matching word
-            score *= min(title_boost, 2.0)  # Cap at 2x
-
-        scores.append((score, d))
-
-    scores.sort(key=lambda x: x[0], reverse=True)
+            return []
+
+    q_tokens = _tokenize(text)
+    if not q_tokens:
+        return []
+
+    q_terms = list(dict.fromkeys(q_tokens))
+    ctx = _query_context(text, original_query)
+
+    if getattr(settings, 'RAG_SCORING', 'tfidf') == 'bm25f' and rag_bm25.available(idx):
+        return _format_results(idx, rag_bm25.score(idx, q_terms, ctx, k, time.time()))
+
+    acc = _accumulate_postings(idx, q_terms, k)
+
+    # Boost theo thứ tự điểm thô giảm dần; dừng khi điểm thô × _MAX_BOOST không
+    # còn vượt được doc thứ k → khỏi tokenize tiêu đề/parse ngày cho phần đuôi.
+    top: List[tuple[float, int]] = []
+    for doc_idx, raw in sorted(acc.items(), key=lambda x: x[1], reverse=True):
+        if raw <= 0:
+            break
+        if len(top) >= k and raw * _MAX_BOOST <= top[0][0]:
+            break
+        boosted = _boost_score(raw, idx.doc(doc_idx), ctx)
+        if len(top) < k:
+            heapq.heappush(top, (boosted, doc_idx))
+        elif boosted > top[0][0]:
+            heapq.heapreplace(top, (boosted, doc_idx))
+    top.sort(key=lambda x: x[0], reverse=True)
+    return _format_results(idx, top)
+
 
+def _format_results(idx, top: List[tuple[float, int]]) -> List[Dict[str, Any]]:
     results = []
-    for s, d in scores[:k]:
+    for s, doc_idx in top:
+        d = idx.doc(doc_idx)
         results.append({
             'id': d['id'],
             'kind': d['kind'],
             'title': d['title'],
             'url': d['url'],
-            'snippet': d['text'][:400],
+            'snippet': idx.text(doc_idx)[:400],
             'score': s,
-            'metadata': d.get('metadata', {}),
+            # Copy: query() merge metadata vào kết quả, không được sửa index dùng chung
+            'metadata': dict(d.get('metadata') or {}),
         })
     return results
 
 
 def _query_vectors(text: str, k: int = 5) -> List[Dict[str, Any]]:
-    """Vector similarity search using embeddings."""
+    """Vector similarity search: 1 phép nhân ma trận-vector trên vector_store thường trú."""
     try:
         from chatbot import embedding_service
-        from chatbot.models import VectorDocument
     except ImportError:
         return []
 
+    store = vector_store.get_store()
+    if store is None or len(store) == 0:
+        return []
+
     # Encode query
     q_emb = embedding_service.encode_single(text)
     if q_emb is None:
         return []
 
-    # Get all vectors from DB
-    vector_docs = VectorDocument.objects.all()
-    if not vector_docs.exists():
-        return []
-
-    # Compute cosine similarity
-    scores: List[tuple[float, VectorDocument]] = []
-    for vd in vector_docs:
-        try:
-            doc_emb = json.loads(vd.embedding_json)
-            sim = _cosine_similarity(q_emb, doc_emb)
-            scores.append((sim, vd))
-        except Exception:
-            continue
-
-    scores.sort(key=lambda x: x[0], reverse=True)
-
     results = []
-    for sim, vd in scores[:k]:
+    for sim, d in store.search(q_emb, k):
         results.append({
-            'id': vd.doc_id,
-            'kind': vd.kind,
-            'title': vd.title,
-            'url': vd.url,
-            'snippet': vd.text_snippet,
+            'id': d['id'],
+            'kind': d['kind'],
+            'title': d['title'],
+            'url': d['url'],
+            'snippet': d['snippet'],
             'score': sim,
         })
     return results
-
-
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Compute cosine similarity between two vectors."""
-    if len(a) != len(b):
-        return 0.0
-
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = sum(x * x for x in a) ** 0.5
-    norm_b = sum(x * x for x in b) ** 0.5
-
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-
-    return dot / (norm_a * norm_b)
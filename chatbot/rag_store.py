@@ -0,0 +1,362 @@
+"""
+Định dạng nhị phân cho RAG index (load bằng mmap → mọi gunicorn worker dùng chung page).
+
+File <tên>.bin:
+    MAGIC (8 byte) | uint32 format version | uint32 độ dài header | header JSON | các section
+
+Các section (căn lề 8 byte; offset/độ dài ghi trong header['sections']):
+    vocab_off   uint32[n_terms+1]   term thứ i nằm trong vocab_blob[vocab_off[i]:vocab_off[i+1]]
+    vocab_blob  bytes               term UTF-8 đã sắp xếp tăng dần (tra bằng binary search)
+    df          uint32[n_terms]
+    idf         float64[n_terms]
+    max_w       float64[n_terms]    trần tf/len của từng term (cho max-score pruning)
+    post_off    uint32[n_terms+1]   postings của term i: [post_off[i], post_off[i+1])
+    post_doc    uint32[n_post]      id số nguyên của doc
+    post_tf     uint32[n_post]
+    post_w      float64[n_post]     tf/len tính sẵn
+    doc_len     uint32[n_docs]
+    meta_off    uint32[n_docs+1]    metadata từng doc (JSON nhỏ) trong meta_blob, decode khi cần
+    meta_blob   bytes
+    snip_off    uint64[n_docs+1]    vị trí text của doc trong file snippets
+
+    BM25F (v2, xem rag_bm25): postings trên hợp các field title/body/metadata
+    bm_off      uint32[n_terms+1]
+    bm_doc      uint32[n_bm]
+    bm_impact   float32[n_bm]       idf × tf̃/(k1+tf̃) tính sẵn (đã chuẩn hóa độ dài field)
+    bm_title    uint8[n_bm]         1 nếu term có trong tiêu đề (title-match bonus)
+    doc_kind    uint8[n_docs]       0=md, 1=post, 2=vip
+    doc_flags   uint8[n_docs]       bit0 tiêu đề FAQ, bit1 có giá, bit2 có diện tích
+    doc_epoch   float64[n_docs]     created_at dạng epoch giây (NaN nếu không có)
+    doc_prov    int32[n_docs]       chỉ số tỉnh trong header['bm25']['provinces'] (-1 nếu không có)
+
+File snippets (<tên>.<build_id>.snippets): text UTF-8 của các doc nối liền, mmap riêng.
+Mỗi lần build sinh file snippets tên mới, nên worker đang giữ bản .bin cũ vẫn đọc
+đúng snippets cũ cho tới khi swap sang bản mới.
+"""
+from __future__ import annotations
+
+import glob
+import json
+import mmap
+import os
+import sys
+import uuid
+from array import array
+from typing import Any, Dict, Iterator, List, Tuple
+
+MAGIC = b'PTRAGIX\x00'
+FORMAT_VERSION = 2
+
+# (tên section, typecode của array; None = bytes thô)
+_SECTIONS = [
+    ('vocab_off', 'I'),
+    ('vocab_blob', None),
+    ('df', 'I'),
+    ('idf', 'd'),
+    ('max_w', 'd'),
+    ('post_off', 'I'),
+    ('post_doc', 'I'),
+    ('post_tf', 'I'),
+    ('post_w', 'd'),
+    ('doc_len', 'I'),
+    ('meta_off', 'I'),
+    ('meta_blob', None),
+    ('snip_off', 'Q'),
+    ('bm_off', 'I'),
+    ('bm_doc', 'I'),
+    ('bm_impact', 'f'),
+    ('bm_title', 'B'),
+    ('doc_kind', 'B'),
+    ('doc_flags', 'B'),
+    ('doc_epoch', 'd'),
+    ('doc_prov', 'i'),
+]
+
+
+def binary_path(json_path: str) -> str:
+    """rag_index.json → rag_index.bin (cùng thư mục)."""
+    return os.path.splitext(json_path)[0] + '.bin'
+
+
+def _snippet_glob(bin_path: str) -> str:
+    return os.path.splitext(bin_path)[0] + '.*.snippets'
+
+
+def _pad8(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def write_binary(index: Dict[str, Any], bin_path: str, bm25: Dict[str, Any] | None = None) -> str:
+    """Ghi index (dict do build_index tạo, đã có postings) ra định dạng nhị phân.
+
+    bm25: kết quả rag_bm25.build_sections(); None → file không có phần BM25F.
+    Ghi file tạm rồi os.replace nên reader không bao giờ thấy file dở dang.
+    Trả về đường dẫn file .bin.
+    """
+    docs = index['docs']
+    postings = index['postings']
+    bm_postings = bm25['postings'] if bm25 else {}
+    terms = sorted(set(postings) | set(bm_postings))
+
+    vocab_off = array('I', [0])
+    vocab_parts: List[bytes] = []
+    df = array('I')
+    idf = array('d')
+    max_w = array('d')
+    post_off = array('I', [0])
+    post_doc = array('I')
+    post_tf = array('I')
+    post_w = array('d')
+    bm_off = array('I', [0])
+    bm_doc = array('I')
+    bm_impact = array('f')
+    bm_title = array('B')
+    for t in terms:
+        tb = t.encode('utf-8')
+        vocab_parts.append(tb)
+        vocab_off.append(vocab_off[-1] + len(tb))
+        p = postings.get(t)
+        if p is None:
+            # Term chỉ có trong title/metadata → không có postings TF-IDF
+            df.append(0)
+            idf.append(0.0)
+            max_w.append(0.0)
+        else:
+            df.append(index['df'].get(t, len(p['docs'])))
+            idf.append(index['idf'][t])
+            max_w.append(p['max_w'])
+            post_doc.extend(p['docs'])
+            post_w.extend(p['w'])
+            post_tf.extend(docs[i]['tf'][t] for i in p['docs'])
+        post_off.append(len(post_doc))
+        bp = bm_postings.get(t)
+        if bp is not None:
+            bm_doc.extend(bp[0])
+            bm_impact.extend(bp[1])
+            bm_title.extend(bp[2])
+        bm_off.append(len(bm_doc))
+
+    doc_len = array('I')
+    meta_off = array('I', [0])
+    meta_parts: List[bytes] = []
+    snip_off = array('Q', [0])
+    build_id = uuid.uuid4().hex[:12]
+    snippets_path = f"{os.path.splitext(bin_path)[0]}.{build_id}.snippets"
+    with open(snippets_path, 'wb') as sf:
+        for d in docs:
+            doc_len.append(d['len'])
+            meta = {
+                'id': d['id'],
+                'kind': d['kind'],
+                'title': d['title'],
+                'url': d['url'],
+                'len': d['len'],
+                'metadata': d.get('metadata') or {},
+                'created_at': d.get('created_at'),
+            }
+            mb = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            meta_parts.append(mb)
+            meta_off.append(meta_off[-1] + len(mb))
+            tb = (d.get('text') or '').encode('utf-8')
+            sf.write(tb)
+            snip_off.append(snip_off[-1] + len(tb))
+
+    payloads = {
+        'vocab_off': vocab_off.tobytes(),
+        'vocab_blob': b''.join(vocab_parts),
+        'df': df.tobytes(),
+        'idf': idf.tobytes(),
+        'max_w': max_w.tobytes(),
+        'post_off': post_off.tobytes(),
+        'post_doc': post_doc.tobytes(),
+        'post_tf': post_tf.tobytes(),
+        'post_w': post_w.tobytes(),
+        'doc_len': doc_len.tobytes(),
+        'meta_off': meta_off.tobytes(),
+        'meta_blob': b''.join(meta_parts),
+        'snip_off': snip_off.tobytes(),
+        'bm_off': bm_off.tobytes(),
+        'bm_doc': bm_doc.tobytes(),
+        'bm_impact': bm_impact.tobytes(),
+        'bm_title': bm_title.tobytes(),
+        'doc_kind': bm25['doc_kind'].tobytes() if bm25 else b'',
+        'doc_flags': bm25['doc_flags'].tobytes() if bm25 else b'',
+        'doc_epoch': bm25['doc_epoch'].tobytes() if bm25 else b'',
+        'doc_prov': bm25['doc_prov'].tobytes() if bm25 else b'',
+    }
+
+    # Offset tính từ đầu vùng dữ liệu (sau header), căn lề 8 byte
+    sections = {}
+    pos = 0
+    for name, _ in _SECTIONS:
+        length = len(payloads[name])
+        sections[name] = [pos, length]
+        pos += length + _pad8(length)
+
+    header = {
+        'n_docs': index['n_docs'],
+        'n_stored': len(docs),
+        'n_terms': len(terms),
+        'n_postings': len(post_doc),
+        'built_at': index.get('built_at'),
+        'index_version': index.get('version'),
+        'byteorder': sys.byteorder,
+        'snippets': os.path.basename(snippets_path),
+        'sections': sections,
+        'bm25': bm25['meta'] if bm25 else None,
+    }
+    hb = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    hb += b' ' * _pad8(len(MAGIC) + 8 + len(hb))
+
+    tmp = f"{bin_path}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(array('I', [FORMAT_VERSION, len(hb)]).tobytes())
+        f.write(hb)
+        for name, _ in _SECTIONS:
+            data = payloads[name]
+            f.write(data)
+            f.write(b'\x00' * _pad8(len(data)))
+    os.replace(tmp, bin_path)
+
+    # Dọn snippets của các bản build cũ. Worker nào còn mmap bản cũ vẫn đọc được
+    # (POSIX giữ inode tới khi unmap); trên Windows file đang map sẽ không xóa được → bỏ qua.
+    for old in glob.glob(_snippet_glob(bin_path)):
+        if os.path.abspath(old) != os.path.abspath(snippets_path):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return bin_path
+
+
+def _map_file(path: str):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BinaryIndex:
+    """Index nhị phân đọc qua mmap: không parse/copy dữ liệu vào heap của worker.
+
+    Postings, df/idf và độ dài doc là memoryview trỏ thẳng vào page của file;
+    metadata/text của doc chỉ được decode khi doc đó lọt vào danh sách ứng viên.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = _map_file(path)
+        mv = memoryview(self._mm)
+        if bytes(mv[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Not a RAG binary index: {path}")
+        version, hlen = array('I', bytes(mv[len(MAGIC):len(MAGIC) + 8]))
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported RAG binary index version {version} (expected {FORMAT_VERSION})")
+        base = len(MAGIC) + 8
+        header = json.loads(bytes(mv[base:base + hlen]).decode('utf-8'))
+        if header.get('byteorder') != sys.byteorder:
+            raise ValueError("RAG binary index was written with a different byte order")
+        data_start = base + hlen
+
+        self.header = header
+        self.n_docs = header['n_docs']
+        self.n_stored = header['n_stored']
+        self.n_terms = header['n_terms']
+        self.built_at = header.get('built_at')
+        self.version = header.get('index_version')
+
+        for name, typecode in _SECTIONS:
+            off, length = header['sections'][name]
+            view = mv[data_start + off:data_start + off + length]
+            setattr(self, '_' + name, view.cast(typecode) if typecode else view)
+
+        self._snip_mm = _map_file(os.path.join(os.path.dirname(path), header['snippets']))
+        self._snip = memoryview(self._snip_mm)
+        self.bm25 = header.get('bm25')  # tham số BM25F + bảng tỉnh, None nếu không có
+
+    def __len__(self) -> int:
+        return self.n_stored
+
+    def _term_id(self, term: str) -> int | None:
+        tb = term.encode('utf-8')
+        lo, hi = 0, self.n_terms
+        off = self._vocab_off
+        blob = self._vocab_blob
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(blob[off[mid]:off[mid + 1]]) < tb:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and bytes(blob[off[lo]:off[lo + 1]]) == tb:
+            return lo
+        return None
+
+    def postings(self, term: str) -> Tuple[Any, Any, float, float] | None:
+        """(doc ids, tf/len weights, max weight, idf) của term, hoặc None."""
+        tid = self._term_id(term)
+        if tid is None:
+            return None
+        a, b = self._post_off[tid], self._post_off[tid + 1]
+        if a == b:
+            return None
+        return self._post_doc[a:b], self._post_w[a:b], self._max_w[tid], self._idf[tid]
+
+    def bm25_postings(self, term: str) -> Tuple[Any, Any, Any] | None:
+        """(doc ids, impact, cờ có-trong-tiêu-đề) BM25F của term, hoặc None."""
+        if self.bm25 is None:
+            return None
+        tid = self._term_id(term)
+        if tid is None:
+            return None
+        a, b = self._bm_off[tid], self._bm_off[tid + 1]
+        if a == b:
+            return None
+        return self._bm_doc[a:b], self._bm_impact[a:b], self._bm_title[a:b]
+
+    def column(self, name: str):
+        """Cột số theo doc (doc_kind/doc_flags/doc_epoch/doc_prov) dạng memoryview."""
+        return getattr(self, '_' + name)
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        """Metadata của doc thứ i (dict mới mỗi lần gọi, không chứa text)."""
+        raw = bytes(self._meta_blob[self._meta_off[i]:self._meta_off[i + 1]])
+        return json.loads(raw.decode('utf-8'))
+
+    def text(self, i: int) -> str:
+        return bytes(self._snip[self._snip_off[i]:self._snip_off[i + 1]]).decode('utf-8')
+
+    def iter_terms(self) -> Iterator[Tuple[str, int]]:
+        """Duyệt (term, term_id) theo thứ tự từ điển."""
+        off = self._vocab_off
+        for tid in range(self.n_terms):
+            yield bytes(self._vocab_blob[off[tid]:off[tid + 1]]).decode('utf-8'), tid
+
+
+class DictIndex:
+    """Bọc index JSON (dict) với cùng giao diện như BinaryIndex."""
+
+    bm25 = None  # JSON fallback không có BM25F → luôn chấm TF-IDF
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.n_docs = data['n_docs']
+        self.n_stored = len(data['docs'])
+        self.built_at = data.get('built_at')
+        self.version = data.get('version')
+
+    def __len__(self) -> int:
+        return self.n_stored
+
+    def postings(self, term: str) -> Tuple[Any, Any, float, float] | None:
+        p = self.data['postings'].get(term)
+        if not p:
+            return None
+        return p['docs'], p['w'], p['max_w'], self.data['idf'][term]
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        return self.data['docs'][i]
+
+    def text(self, i: int) -> str:
+        return self.data['docs'][i].get('text') or ''
@@ -0,0 +1,408 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from website.models import RentalPost, Province, District, Ward
+from chatbot import rag_bm25, rag_index, rag_store, vector_store
+
+
+class RAGIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner_rag")
+        cls.prov = Province.objects.create(name="Hồ Chí Minh")
+        cls.dist = District.objects.create(name="Quận 3", province=cls.prov)
+        cls.ward = Ward.objects.create(name="Phường 1", district=cls.dist)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'rag_index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _mk(self, title, description="desc", price=5, area=20):
+        return RentalPost.objects.create(
+            user=self.owner,
+            title=title,
+            description=description,
+            price=price,
+            area=area,
+            province=self.prov,
+            district=self.dist,
+            ward=self.ward,
+            address="12 Đường B",
+            is_approved=True,
+            is_deleted=False,
+            category='phongtro',
+        )
+
+    def test_index_is_resident_and_hot_swapped(self):
+        self._mk("Phòng gần chợ Bến Thành")
+        built = rag_index.build_index(self.path, use_embeddings=False)
+
+        # build_index publishes the new version without re-parsing the file
+        first = rag_index.get_index(self.path)
+        self.assertEqual(first.n_docs, built['n_docs'])
+        self.assertIs(rag_index.get_index(self.path), first)
+
+        self._mk("Căn hộ ban công view sông")
+        rebuilt = rag_index.build_index(self.path, use_embeddings=False)
+        second = rag_index.get_index(self.path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.n_docs, rebuilt['n_docs'])
+
+        # Another process rewriting the file is picked up via the mtime/size stamp
+        rag_index._RESIDENT.pop(os.path.abspath(self.path), None)
+        loaded = rag_index.get_index(self.path)
+        self.assertEqual(loaded.n_docs, rebuilt['n_docs'])
+
+    def test_query_results_do_not_mutate_shared_index(self):
+        self._mk("Phòng trọ giá rẻ quận 3")
+        rag_index.build_index(self.path, use_embeddings=False)
+
+        results = rag_index.query("phòng trọ quận 3", k=3, index_path=self.path, use_semantic=False)
+        self.assertTrue(results)
+        results[0]['metadata']['injected'] = True
+
+        idx = rag_index.get_index(self.path)
+        self.assertFalse(any('injected' in (idx.doc(i).get('metadata') or {}) for i in range(len(idx))))
+
+    def test_binary_index_matches_json(self):
+        for i in range(6):
+            self._mk(f"Phòng trọ {i} gần chợ", description="ban công máy lạnh " * (i + 1))
+        built = rag_index.build_index(self.path, use_embeddings=False)
+
+        idx = rag_index.get_index(self.path)
+        self.assertIsInstance(idx, rag_store.BinaryIndex)
+        self.assertEqual(len(idx), len(built['docs']))
+        for i, d in enumerate(built['docs']):
+            self.assertEqual(idx.text(i), d['text'])
+            self.assertEqual(idx.doc(i)['id'], d['id'])
+            self.assertEqual(idx.doc(i)['metadata'], d['metadata'])
+        with_postings = [t for t, _ in idx.iter_terms() if idx.postings(t) is not None]
+        self.assertEqual(with_postings, sorted(built['postings']))
+        for term in with_postings:
+            docs, w, max_w, idf = idx.postings(term)
+            p = built['postings'][term]
+            self.assertEqual(list(docs), p['docs'])
+            self.assertEqual(list(w), p['w'])
+            self.assertEqual((max_w, idf), (p['max_w'], built['idf'][term]))
+        self.assertIsNone(idx.postings('khongtontai'))
+
+        text = "phòng trọ ban công gần chợ"
+        from_bin = rag_index._query_tfidf(text, k=5, index_path=self.path, original_query=text)
+        # Không có .bin → fallback sang JSON, kết quả phải y hệt
+        os.remove(rag_store.binary_path(self.path))
+        rag_index.reload_index(self.path)
+        self.assertIsInstance(rag_index.get_index(self.path), rag_store.DictIndex)
+        from_json = rag_index._query_tfidf(text, k=5, index_path=self.path, original_query=text)
+        self.assertEqual(from_bin, from_json)
+
+    def test_postings_topk_matches_full_scan(self):
+        for i in range(12):
+            self._mk(f"Phòng trọ số {i} gần đại học", description="phòng sạch sẽ " * (i + 1), price=3 + i)
+        idx = rag_index.build_index(self.path, use_embeddings=False)
+        self.assertIn('phong', idx['postings'])
+
+        text = "tìm phòng trọ gần đại học"
+        got = rag_index._query_tfidf(text, k=4, index_path=self.path, original_query=text)
+
+        # Brute force over every doc with the same scoring function
+        ctx = rag_index._query_context(text, text)
+        terms = set(rag_index._tokenize(text))
+        expected = []
+        for d in idx['docs']:
+            raw = sum((d['tf'][t] / max(1, d['len'])) * idx['idf'][t] for t in terms if t in d['tf'])
+            if raw > 0:
+                expected.append((rag_index._boost_score(raw, d, ctx), d['id']))
+        expected.sort(reverse=True)
+
+        self.assertEqual(
+            [round(r['score'], 9) for r in got],
+            [round(s, 9) for s, _ in expected[:4]],
+        )
+
+    def test_incremental_update_matches_full_rebuild(self):
+        keep = self._mk("Phòng trọ gần công viên", description="yên tĩnh thoáng mát")
+        gone = self._mk("Phòng trọ gần bến xe", description="tiện đi lại")
+        rag_index.build_index(self.path, use_embeddings=False)
+
+        keep.description = "yên tĩnh có ban công rộng"
+        keep.save()
+        gone.is_rented = True
+        gone.save()
+        added = self._mk("Căn hộ mini gần trường", description="có thang máy")
+        with mock.patch.object(rag_index, '_attach_postings') as attach:
+            rag_index.update_documents(post_ids=[keep.pk, gone.pk, added.pk],
+                                       save_path=self.path, use_embeddings=False)
+        attach.assert_not_called()  # chỉ vá postings của doc đổi, không sinh lại cả corpus
+
+        inc = rag_index._load_index(self.path)
+        full_path = os.path.join(self.tmpdir, 'full.json')
+        full = rag_index.build_index(full_path, use_embeddings=False)
+        self.assertEqual(inc['n_docs'], full['n_docs'])
+        self.assertEqual(inc['df'], full['df'])
+        self.assertEqual(sorted(d['id'] for d in inc['docs']), sorted(d['id'] for d in full['docs']))
+        self.assertNotIn(f"post:{gone.pk}", {d['id'] for d in inc['docs']})
+
+        def by_id(index):
+            ids = [d['id'] for d in index['docs']]
+            return {t: sorted((ids[i], round(w, 12)) for i, w in zip(p['docs'], p['w']))
+                    for t, p in index['postings'].items()}
+        self.assertEqual(by_id(inc), by_id(full))
+        self.assertEqual({t: round(v, 12) for t, v in inc['idf'].items()},
+                         {t: round(v, 12) for t, v in full['idf'].items()})
+        self.assertEqual({t: p['max_w'] for t, p in inc['postings'].items()},
+                         {t: p['max_w'] for t, p in full['postings'].items()})
+
+        text = "phòng có ban công"
+        self.assertEqual(
+            [r['id'] for r in rag_index._query_tfidf(text, k=3, index_path=self.path, original_query=text)],
+            [r['id'] for r in rag_index._query_tfidf(text, k=3, index_path=full_path, original_query=text)],
+        )
+
+    def test_enqueued_delta_waits_for_commit(self):
+        rag_index.build_index(self.path, use_embeddings=False)
+        with mock.patch.object(rag_index, '_ensure_worker'):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                post = self._mk("Phòng mới đăng gần chợ")
+                rag_index.enqueue_post(post.pk)
+            self.assertNotIn(('post', post.pk), rag_index._PENDING)
+            for cb in callbacks:
+                cb()
+        self.assertIn(('post', post.pk), rag_index._PENDING)
+
+        rag_index.flush_pending(save_path=self.path)
+        self.assertFalse(rag_index._PENDING)
+        idx = rag_index.get_index(self.path)
+        self.assertIn(f"post:{post.pk}", {idx.doc(i)['id'] for i in range(len(idx))})
+
+    def test_vector_store_topk_matches_brute_force(self):
+        import numpy as np
+        from chatbot.models import VectorDocument
+
+        rng = np.random.default_rng(7)
+        vecs = rng.normal(size=(40, 16)).astype(np.float32)
+        for i, v in enumerate(vecs):
+            VectorDocument.objects.create(
+                doc_id=f"post:{i}", kind='post', title=f"t{i}", url=f"/post/{i}/", text_snippet=f"s{i}",
+                # Nửa đầu lưu bytes float32, nửa sau chỉ có JSON (row cũ)
+                embedding_pgvector=vector_store.to_bytes(v) if i < 20 else None,
+                embedding_json=json.dumps(v.tolist()),
+            )
+
+        q = rng.normal(size=16)
+        unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+        sims = unit @ (q / np.linalg.norm(q))
+        expected = [f"post:{i}" for i in np.argsort(-sims)[:5]]
+
+        store = vector_store.load_from_db()
+        self.assertEqual([d['id'] for _, d in store.search(q, 5)], expected)
+
+        # Fallback DB (chưa có file export) trong request: tìm chính xác, không train ANN
+        vector_store._RESIDENT.pop('db', None)
+        with mock.patch.object(vector_store, 'attach_ann') as attach:
+            fallback = vector_store.get_store(os.path.join(self.tmpdir, 'missing.json'))
+        attach.assert_not_called()
+        self.assertIsNone(fallback.ann)
+        vector_store._RESIDENT.pop('db', None)
+
+        path = os.path.join(self.tmpdir, 'rag_vectors.json')
+        vector_store.export(store, path)
+        mapped = vector_store.get_store(path)
+        self.assertIsInstance(mapped.matrix, np.memmap)
+        got = mapped.search(q, 5)
+        self.assertEqual([d['id'] for _, d in got], expected)
+        self.assertAlmostEqual(got[0][0], float(sims.max()), places=5)
+        self.assertEqual(mapped.search(q[:8], 5), [])
+
+    def test_ann_index_incremental_and_transparent(self):
+        import numpy as np
+        from chatbot import ann_index
+
+        rng = np.random.default_rng(3)
+        centers = rng.normal(size=(20, 32))
+        vecs = (centers[rng.integers(0, 20, 1500)] + rng.normal(scale=0.3, size=(1500, 32))).astype(np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        ids = [f"post:{i}" for i in range(len(vecs))]
+
+        index = ann_index.build(ids, vecs, 'ivfpq', m=8, nprobe=8)
+        hits = 0
+        for i in range(0, 1500, 50):
+            exact = set(np.argsort(-(vecs @ vecs[i]))[:10])
+            hits += len({f"post:{j}" for j in exact} & {d for _, d in index.search(vecs[i], 10)})
+        self.assertGreaterEqual(hits / (30 * 10), 0.9)
+
+        # Xóa (tin hết hạn / đã cho thuê) và thêm (tin mới duyệt) không cần train lại
+        self.assertEqual(index.search(vecs[7], 1)[0][1], "post:7")
+        index.remove(["post:7"])
+        self.assertNotIn("post:7", {d for _, d in index.search(vecs[7], 10)})
+        index.add(["post:new"], vecs[7:8])
+        self.assertEqual(index.search(vecs[7], 1)[0][1], "post:new")
+
+        path = os.path.join(self.tmpdir, 'ann.npz')
+        index.save(path)
+        loaded = ann_index.load(path)
+        self.assertEqual(len(loaded), len(index))
+        self.assertEqual(loaded.search(vecs[3], 5), index.search(vecs[3], 5))
+
+        # Trên ngưỡng, VectorStore đi qua ANN mà kết quả vẫn khớp exact ở top-1
+        docs = [{'id': d, 'kind': 'post', 'title': d, 'url': '', 'snippet': ''} for d in ids]
+        store = vector_store.VectorStore(vecs, docs)
+        with self.settings(RAG_ANN_THRESHOLD=1000, RAG_ANN_M=8):
+            vector_store.attach_ann(store)
+        self.assertIsNotNone(store.ann)
+        self.assertEqual(store.search(vecs[42], 1)[0][1]['id'], store.search(vecs[42], 1, exact=True)[0][1]['id'])
+        added, removed = store.ann.sync(ids[:-5], vecs[:-5])
+        self.assertEqual((added, removed), (0, 5))
+        self.assertEqual(len(store.ann), len(ids) - 5)
+
+    def test_embedding_cache_only_encodes_misses(self):
+        import numpy as np
+        from chatbot import embedding_service, embedding_cache
+
+        calls = []
+
+        class FakeModel:
+            def encode(self, texts, **kwargs):
+                calls.append(list(texts))
+                return np.array([[len(t), 1.0, 0.5] for t in texts], dtype=np.float32)
+
+        cache_path = os.path.join(self.tmpdir, 'emb.sqlite3')
+        with self.settings(RAG_EMBEDDING_CACHE_PATH=cache_path, RAG_EMBED_BATCH_SIZE=2), \
+                mock.patch.object(embedding_service, '_model', FakeModel()), \
+                mock.patch.object(embedding_service, '_active_model_name', 'fake-model'):
+            first = embedding_service.encode(["a b", "cc", "ddd", "cc"])
+            self.assertEqual(calls, [["a b", "cc"], ["ddd"]])
+            self.assertEqual(first[1], first[3])
+
+            # Text trùng nội dung (khác khoảng trắng) → hit, chỉ text mới được encode
+            again = embedding_service.encode(["a  b ", "eeee"])
+            self.assertEqual(calls[-1], ["eeee"])
+            self.assertEqual(again[0], first[0])
+
+            # Kết nối mới (như process khác) vẫn đọc được cache từ đĩa
+            embedding_cache._local.conns = {}
+            self.assertEqual(embedding_cache.get('fake-model', 'ddd'), [3.0, 1.0, 0.5])
+            self.assertIsNone(embedding_cache.get('other-model', 'ddd'))
+
+    def test_streaming_vector_build_upserts_and_keeps_old_rows_on_failure(self):
+        from chatbot.models import VectorDocument
+
+        VectorDocument.objects.create(doc_id="post:999", kind='post', title="cũ", url="/post/999/",
+                                      text_snippet="cũ", embedding_json="[1, 0, 0]")
+        docs = [rag_index.Doc(id=f"md:{i}", kind='md', title=f"d{i}", url="", text=f"văn bản {i}", tokens=['x'])
+                for i in range(7)]
+
+        def fake_encode(texts, batch_size=None):
+            return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+        with mock.patch('chatbot.embedding_service.encode', side_effect=lambda texts, **kwargs: None):
+            self.assertIsNone(rag_index._build_vector_index(docs, chunk_size=3))
+        self.assertTrue(VectorDocument.objects.filter(doc_id="post:999").exists())
+
+        with mock.patch.object(vector_store, 'STORE_PATH', os.path.join(self.tmpdir, 'vec.json')):
+            for workers in (1, 3):
+                with mock.patch('chatbot.embedding_service.encode', side_effect=fake_encode) as enc:
+                    stats = rag_index._build_vector_index(docs, chunk_size=3, workers=workers)
+                self.assertEqual([len(c.args[0]) for c in enc.call_args_list], [3, 3, 1])
+                self.assertEqual(stats['docs'], 7)
+                self.assertEqual(sorted(VectorDocument.objects.values_list('doc_id', flat=True)),
+                                 sorted(d.id for d in docs))
+        self.assertEqual(stats['removed'], 0)
+        self.assertEqual(json.loads(VectorDocument.objects.get(doc_id="md:2").embedding_json), [9.0, 1.0, 0.0])
+
+    def test_encode_single_coalesces_concurrent_requests(self):
+        import threading
+        import numpy as np
+        from chatbot import embedding_service
+
+        calls = []
+
+        class FakeModel:
+            def encode(self, texts, **kwargs):
+                calls.append(len(texts))
+                return np.array([[float(len(t)), 2.0] for t in texts], dtype=np.float32)
+
+        results = {}
+        barrier = threading.Barrier(8)
+
+        def worker(i):
+            barrier.wait()
+            results[i] = embedding_service.encode_single("x" * (i + 1))
+
+        with self.settings(RAG_EMBEDDING_CACHE_PATH=os.path.join(self.tmpdir, 'emb.sqlite3'),
+                           RAG_EMBED_MAX_WAIT_MS=200, RAG_EMBED_MAX_BATCH=8), \
+                mock.patch.object(embedding_service, '_model', FakeModel()), \
+                mock.patch.object(embedding_service, '_active_model_name', 'fake-model'):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(results, {i: [float(i + 1), 2.0] for i in range(8)})
+            self.assertLess(len(calls), 8)
+            self.assertEqual(sum(calls), 8)
+
+            # Câu hỏi chat không được ghi vào cache bền vững (chỉ text của corpus)
+            from chatbot import embedding_cache
+            self.assertIsNone(embedding_cache.get('fake-model', "xxx"))
+            embedding_service.encode(["xxx"])  # corpus: ghi cache
+            self.assertEqual(embedding_service.encode_single("xxx"), [3.0, 2.0])
+            self.assertEqual(sum(calls), 9)
+
+    def test_encode_single_times_out_when_batcher_stalls(self):
+        import threading
+        from chatbot import embedding_service
+
+        release = threading.Event()
+
+        def stalled(texts, **kwargs):
+            release.wait(5)
+            return None
+
+        with self.settings(RAG_EMBEDDING_CACHE_PATH=os.path.join(self.tmpdir, 'emb.sqlite3'),
+                           RAG_EMBED_MAX_WAIT_MS=1, RAG_EMBED_TIMEOUT_S=0.05), \
+                mock.patch.object(embedding_service, 'encode', side_effect=stalled):
+            try:
+                self.assertIsNone(embedding_service.encode_single("model đang load"))
+            finally:
+                release.set()
+
+    def test_bm25f_boosts_match_reference_scoring(self):
+        import math
+
+        for i in range(10):
+            p = self._mk(f"Phòng trọ {i} Hồ Chí Minh" if i % 2 else f"Căn hộ {i}",
+                         description="phòng trọ gần chợ " * (i % 3 + 1), price=2 + i, area=15 + i)
+            if i % 3 == 0:
+                RentalPost.objects.filter(pk=p.pk).update(
+                    created_at=p.created_at - timezone.timedelta(days=10 * i))
+        built = rag_index.build_index(self.path, use_embeddings=False)
+        idx = rag_index.get_index(self.path)
+        self.assertTrue(rag_bm25.available(idx))
+
+        text = "tìm phòng trọ 3 triệu 20m2 ở hcm"
+        with self.settings(RAG_SCORING='bm25f'):
+            got = rag_index._query_tfidf(text, k=4, index_path=self.path, original_query=text)
+
+        # Tham chiếu: impact BM25F (theo postings) × _boost_score từng doc bằng Python
+        ctx = rag_index._query_context(text, text)
+        raw = {}
+        for t in set(rag_index._tokenize(text)):
+            p = idx.bm25_postings(t)
+            if p:
+                for d, imp in zip(p[0], p[1]):
+                    raw[d] = raw.get(d, 0.0) + imp
+        expected = sorted(((rag_index._boost_score(v, built['docs'][d], ctx), built['docs'][d]['id'])
+                           for d, v in raw.items()), reverse=True)[:4]
+        self.assertEqual([r['id'] for r in got], [i for _, i in expected])
+        for r, (s, _) in zip(got, expected):
+            self.assertTrue(math.isclose(r['score'], s, rel_tol=1e-5))
@@ -0,0 +1,319 @@
+"""
+Vector store cho semantic search: toàn bộ embedding nằm trong 1 ma trận float32 liền
+mạch, đã chuẩn hóa L2 → cosine similarity của mọi doc = 1 phép nhân ma trận-vector,
+top-k lấy bằng argpartition (không sort cả mảng).
+
+Nguồn dữ liệu (theo thứ tự ưu tiên):
+1. File export: rag_vectors.json (metadata + tên file ma trận) + rag_vectors.<build>.npy,
+   load bằng mmap → các worker dùng chung page của OS. Hot reload khi mtime/size đổi.
+2. Bảng VectorDocument: đọc bytes float32 trong embedding_pgvector (fallback
+   embedding_json cho các row cũ), giữ trong RAM tối đa VECTOR_DB_TTL giây; chỉ tìm
+   chính xác, không có ANN (index ANN chỉ build khi export file).
+
+Giống rag_index, mỗi lần export sinh file .npy tên mới nên worker đang giữ bản cũ
+vẫn đọc đúng dữ liệu cũ cho tới khi swap.
+"""
+from __future__ import annotations
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+
+try:
+    import numpy as np
+except ImportError:  # free tier: không cài numpy → semantic search tắt
+    np = None
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.path.join(os.path.dirname(__file__), 'rag_vectors.json')
+VECTOR_DB_TTL = 300  # giây; chỉ dùng khi chưa có file export
+
+_LOCK = threading.Lock()
+_RESIDENT: Dict[str, tuple] = {}  # key → (stamp, VectorStore)
+
+
+def is_available() -> bool:
+    return np is not None
+
+
+def to_bytes(embedding) -> bytes:
+    """Embedding → bytes float32 để lưu vào VectorDocument.embedding_pgvector."""
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def _ann_params() -> Dict[str, Any]:
+    """Nút chỉnh ANN từ settings (RAG_ANN_*); None = để backend tự chọn."""
+    params = {
+        'nlist': _setting('RAG_ANN_NLIST', None),
+        'm': _setting('RAG_ANN_M', 16),
+        'nprobe': _setting('RAG_ANN_NPROBE', 8),
+        'rerank': _setting('RAG_ANN_RERANK', 200),
+    }
+    return {k: v for k, v in params.items() if v is not None}
+
+
+class VectorStore:
+    """Ma trận embedding (n × dim, float32, đã chuẩn hóa) + metadata từng hàng.
+
+    Khi corpus vượt RAG_ANN_THRESHOLD, `ann` là index ANN (ann_index) và search()
+    đi qua nó; dưới ngưỡng (hoặc exact=True) thì quét toàn bộ ma trận.
+    """
+
+    def __init__(self, matrix, docs: List[Dict[str, Any]], ann=None):
+        self.matrix = matrix
+        self.docs = docs
+        self.ann = ann
+        self._row_of = None
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def search(self, query_embedding, k: int = 5, exact: bool = False) -> List[tuple]:
+        """Top-k (score, doc_meta) theo cosine similarity, score giảm dần."""
+        n = len(self.docs)
+        if n == 0 or k <= 0:
+            return []
+        q = np.asarray(query_embedding, dtype=np.float32)
+        if q.shape != (self.dim,):
+            logger.warning(f"⚠️ Query embedding dim {q.shape} != store dim {self.dim} (model changed?)")
+            return []
+        norm = float(np.linalg.norm(q))
+        if norm == 0.0:
+            return []
+        q = q / norm
+
+        if self.ann is not None and not exact:
+            if self._row_of is None:
+                self._row_of = {d['id']: i for i, d in enumerate(self.docs)}
+            hits = self.ann.search(q, k, nprobe=_setting('RAG_ANN_NPROBE', None),
+                                   rerank=_setting('RAG_ANN_RERANK', None))
+            return [(score, self.docs[self._row_of[doc_id]]) for score, doc_id in hits
+                    if doc_id in self._row_of]
+
+        scores = self.matrix @ q
+        k = min(k, n)
+        if k < n:
+            top = np.argpartition(scores, n - k)[n - k:]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[i]), self.docs[i]) for i in top]
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def _decode_row(blob, embedding_json):
+    if blob:
+        return np.frombuffer(bytes(blob), dtype=np.float32)
+    if embedding_json:
+        return np.asarray(json.loads(embedding_json), dtype=np.float32)
+    return None
+
+
+def attach_ann(store: VectorStore, previous=None) -> VectorStore:
+    """Gắn index ANN cho store nếu corpus đủ lớn.
+
+    Có `previous` (index của lần export trước) thì chỉ add/remove phần chênh lệch
+    (post mới duyệt, post hết hạn/đã cho thuê...) thay vì train lại; chỉ train lại khi
+    corpus thay đổi quá xa so với lúc train.
+    """
+    threshold = _setting('RAG_ANN_THRESHOLD', 5000)
+    if len(store) < threshold:
+        store.ann = None
+        return store
+    from chatbot import ann_index
+
+    ids = [d['id'] for d in store.docs]
+    if previous is not None and previous.dim == store.dim:
+        added, removed = previous.sync(ids, store.matrix)
+        if not previous.needs_retrain():
+            logger.info(f"🧭 ANN index updated incrementally (+{added} / -{removed})")
+            store.ann = previous
+            return store
+    store.ann = ann_index.build(ids, store.matrix, _setting('RAG_ANN_BACKEND', 'ivfpq'), **_ann_params())
+    return store
+
+
+def load_from_db() -> VectorStore | None:
+    """Đọc toàn bộ VectorDocument thành 1 ma trận (1 query, không tạo model instance)."""
+    from chatbot.models import VectorDocument
+
+    rows = (VectorDocument.objects
+            .order_by('id')
+            .values_list('doc_id', 'kind', 'title', 'url', 'text_snippet',
+                         'embedding_pgvector', 'embedding_json'))
+    docs: List[Dict[str, Any]] = []
+    vectors = []
+    dim = None
+    for doc_id, kind, title, url, snippet, blob, emb_json in rows.iterator(chunk_size=500):
+        try:
+            vec = _decode_row(blob, emb_json)
+        except Exception:
+            continue
+        if vec is None or (dim is not None and vec.shape[0] != dim):
+            continue
+        dim = vec.shape[0]
+        vectors.append(vec)
+        docs.append({'id': doc_id, 'kind': kind, 'title': title, 'url': url, 'snippet': snippet})
+
+    if not vectors:
+        return None
+    matrix = _normalize_rows(np.vstack(vectors).astype(np.float32, copy=False))
+    return VectorStore(matrix, docs)
+
+
+def export(store: VectorStore, path: str | None = None) -> str:
+    """Ghi store ra file (.npy + JSON metadata) để các worker mmap dùng chung."""
+    dest = path or STORE_PATH
+    base = os.path.splitext(dest)[0]
+    npy_name = f"{os.path.basename(base)}.{uuid.uuid4().hex[:12]}.npy"
+    npy_path = os.path.join(os.path.dirname(dest), npy_name)
+    np.save(npy_path, np.ascontiguousarray(store.matrix, dtype=np.float32))
+    meta = {'matrix': npy_name, 'dim': store.dim, 'docs': store.docs}
+    if store.ann is not None:
+        meta['ann'] = npy_name[:-len('.npy')] + '.ann.npz'
+        store.ann.save(os.path.join(os.path.dirname(dest), meta['ann']))
+
+    tmp = f"{dest}.tmp{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, dest)
+
+    # Dọn file của các lần export trước (worker đang mmap vẫn giữ inode trên POSIX)
+    for old in glob.glob(f"{base}.*.npy") + glob.glob(f"{base}.*.ann.npz"):
+        if os.path.basename(old) not in (npy_name, meta.get('ann')):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    with _LOCK:
+        _RESIDENT.pop(os.path.abspath(dest), None)
+    return dest
+
+
+def export_from_db(path: str | None = None) -> VectorStore | None:
+    """Dựng lại file export từ VectorDocument (gọi sau khi build/cập nhật embeddings)."""
+    if np is None:
+        return None
+    store = load_from_db()
+    dest = path or STORE_PATH
+    if store is None:
+        base = os.path.splitext(dest)[0]
+        for p in [dest] + glob.glob(f"{base}.*.npy") + glob.glob(f"{base}.*.ann.npz"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        with _LOCK:
+            _RESIDENT.pop(os.path.abspath(dest), None)
+            _RESIDENT.pop('db', None)
+        return None
+    try:
+        attach_ann(store, previous=_load_previous_ann(dest))
+    except Exception as e:
+        logger.warning(f"⚠️ Cannot build ANN index, using exact search: {e}")
+        store.ann = None
+    try:
+        export(store, dest)
+        logger.info(f"✅ Exported {len(store)} vectors (dim={store.dim}) → {dest}")
+    except Exception as e:
+        logger.warning(f"⚠️ Cannot export vector store: {e}")
+    with _LOCK:
+        _RESIDENT.pop('db', None)
+    return store
+
+
+def _load_previous_ann(path: str):
+    """Index ANN của lần export trước (bản riêng, không đụng bản worker đang dùng)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if not meta.get('ann'):
+            return None
+        from chatbot import ann_index
+        return ann_index.load(os.path.join(os.path.dirname(path), meta['ann']))
+    except Exception:
+        return None
+
+
+def _load_file(path: str) -> VectorStore:
+    with open(path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    folder = os.path.dirname(path)
+    matrix = np.load(os.path.join(folder, meta['matrix']), mmap_mode='r')
+    if matrix.shape[0] != len(meta['docs']):
+        raise ValueError("vector matrix rows do not match metadata")
+    ann = None
+    if meta.get('ann'):
+        from chatbot import ann_index
+        ann = ann_index.load(os.path.join(folder, meta['ann']))
+    return VectorStore(matrix, meta['docs'], ann=ann)
+
+
+def _file_stamp(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_store(path: str | None = None) -> VectorStore | None:
+    """Store thường trú của process (None nếu không có numpy hoặc chưa có embedding nào)."""
+    if np is None:
+        return None
+    src = os.path.abspath(path or STORE_PATH)
+    stamp = _file_stamp(src)
+    if stamp is not None:
+        cached = _RESIDENT.get(src)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with _LOCK:
+            cached = _RESIDENT.get(src)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+            try:
+                store = _load_file(src)
+                _RESIDENT[src] = (stamp, store)
+                logger.info(f"📥 Loaded vector store: {src} ({len(store)} vectors)")
+                return store
+            except Exception as e:
+                logger.warning(f"⚠️ Cannot load vector store file {src}: {e}. Falling back to DB.")
+
+    # Chưa có file export → đọc từ DB, cache theo TTL
+    now = time.monotonic()
+    cached = _RESIDENT.get('db')
+    if cached is not None and now - cached[0] < VECTOR_DB_TTL:
+        return cached[1]
+    with _LOCK:
+        cached = _RESIDENT.get('db')
+        if cached is not None and now - cached[0] < VECTOR_DB_TTL:
+            return cached[1]
+        # Tìm chính xác (brute-force): không train ANN trong request đang giữ _LOCK —
+        # ANN chỉ được build lúc export (build_rag_index / export_from_db)
+        store = load_from_db()
+        _RESIDENT['db'] = (now, store)
+        return store
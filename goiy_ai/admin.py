@@ -2,7 +2,7 @@
 Django Admin cho hệ thống gợi ý AI
 """
 from django.contrib import admin
-from .models import PostView, SearchHistory, UserInteraction, RecommendationLog
+from .models import PostView, SearchHistory, UserInteraction, RecommendationLog, PrecomputedRecommendation
 
 
 @admin.register(PostView)
@@ -63,3 +63,18 @@ class RecommendationLogAdmin(admin.ModelAdmin):
 
     def has_add_permission(self, request):
         return False
+
+
+@admin.register(PrecomputedRecommendation)
+class PrecomputedRecommendationAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'key', 'post_count', 'algorithm', 'computed_at', 'expires_at')
+    list_filter = ('scope', 'algorithm')
+    search_fields = ('key',)
+    ordering = ('scope', 'key')
+
+    def post_count(self, obj):
+        return len(obj.post_ids)
+    post_count.short_description = 'Số bài gợi ý'
+
+    def has_add_permission(self, request):
+        return False
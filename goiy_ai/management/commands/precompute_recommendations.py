@@ -0,0 +1,107 @@
+"""
+Django Management Command: Tính sẵn top-N gợi ý cho user / cohort phiên ẩn danh / bài tương tự
+Chạy định kỳ (ví dụ: sau train_cf_model, mỗi vài giờ): python manage.py precompute_recommendations
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Tính sẵn danh sách gợi ý top-N (user, cohort phiên ẩn danh, bài tương tự) cho serving'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scope',
+            choices=['all', 'user', 'cohort', 'post'],
+            default='all',
+            help='Loại danh sách cần tính (default: all)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='User có tương tác/tìm kiếm trong N ngày gần nhất được tính (default: 30)'
+        )
+        parser.add_argument(
+            '--cohort-days',
+            type=int,
+            default=1,
+            help='Cohort của phiên ẩn danh trong N ngày gần nhất (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        from goiy_ai.ml_models import precomputed
+
+        scope = options['scope']
+        started = time.monotonic()
+
+        purged = precomputed.purge_expired()
+        if purged:
+            self.stdout.write(f"🧹 Đã xóa {purged} danh sách hết hạn")
+
+        if scope in ('all', 'user'):
+            self._users(precomputed, options['days'])
+        if scope in ('all', 'cohort'):
+            self._cohorts(precomputed, options['cohort_days'])
+        if scope in ('all', 'post'):
+            self._posts(precomputed)
+
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Hoàn tất sau {time.monotonic() - started:.1f}s"))
+
+    def _users(self, precomputed, days):
+        from django.contrib.auth.models import User
+        from goiy_ai.ml_models import registry
+        from goiy_ai.models import SearchHistory, UserInteraction
+
+        cutoff = timezone.now() - timedelta(days=days)
+        user_ids = set(UserInteraction.objects.filter(
+            user__isnull=False, created_at__gte=cutoff
+        ).values_list('user_id', flat=True).distinct())
+        user_ids |= set(SearchHistory.objects.filter(
+            user__isnull=False, searched_at__gte=cutoff
+        ).values_list('user_id', flat=True).distinct())
+
+        self.stdout.write(self.style.WARNING(f"👤 Tính gợi ý cho {len(user_ids)} user..."))
+        recommender = registry.get_recommender()
+        users = list(User.objects.filter(id__in=user_ids).order_by('id'))
+        done = 0
+        # Phần CF của cả khối user tính bằng 1 phép nhân ma trận (ALSRecommender.batch_recommend)
+        for start in range(0, len(users), 500):
+            batch = users[start:start + 500]
+            try:
+                lists = recommender.batch_recommendations(batch, limit=precomputed.top_n())
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"❌ Users #{batch[0].id}..#{batch[-1].id}: {e}"))
+                continue
+            for user_id, post_ids in lists.items():
+                precomputed.store('user', user_id, post_ids, algorithm='hybrid')
+                done += 1
+        self.stdout.write(f"   → {done} danh sách")
+
+    def _cohorts(self, precomputed, days):
+        keys = precomputed.active_cohorts(days=days)
+        self.stdout.write(self.style.WARNING(f"👥 Tính gợi ý cho {len(keys)} cohort phiên ẩn danh..."))
+        for key in keys:
+            try:
+                precomputed.store('cohort', key, precomputed.compute_cohort(key), algorithm='cohort_popular')
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"❌ Cohort {key}: {e}"))
+
+    def _posts(self, precomputed):
+        from goiy_ai.ml_models.content_based import ContentBasedRecommender
+
+        content = ContentBasedRecommender()
+        active = content._get_active_posts()
+        self.stdout.write(self.style.WARNING(f"🏠 Tính bài tương tự cho {active.count()} bài..."))
+        done = 0
+        for post in active.iterator(chunk_size=500):
+            try:
+                recs = content._recommend_similar_posts(post, active, precomputed.top_n())
+                precomputed.store('post', post.id, [p.id for p in recs], algorithm='content_similar')
+                done += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"❌ Bài #{post.id}: {e}"))
+        self.stdout.write(f"   → {done} danh sách")
@@ -110,7 +110,9 @@ class Command(BaseCommand):
                 output_path = os.path.join(models_dir, 'cf_als_model.pkl')
 
             self.stdout.write(self.style.WARNING(f'\nBước 3: Lưu model...'))
-            recommender.save_model(output_path)
+            # Ghi nguyên tử → các worker đang chạy tự hot-swap sang model mới
+            from goiy_ai.ml_models import registry
+            output_path = registry.publish(recommender, output_path)
 
             # Thành công
             self.stdout.write(self.style.SUCCESS('\n' + '='*60))
@@ -121,9 +123,8 @@ class Command(BaseCommand):
             # Hướng dẫn sử dụng
             self.stdout.write(self.style.WARNING('📖 Cách sử dụng model:'))
             self.stdout.write('   1. Trong code Python:')
-            self.stdout.write('      from goiy_ai.ml_models.cf_als import ALSRecommender')
-            self.stdout.write(f'      recommender = ALSRecommender(model_path="{output_path}")')
-            self.stdout.write('      posts = recommender.get_recommendations(user=request.user, limit=10)')
+            self.stdout.write('      from goiy_ai.ml_models import registry')
+            self.stdout.write('      posts = registry.get_recommender().get_recommendations(user=request.user, limit=10)')
             self.stdout.write('')
             self.stdout.write('   2. Tích hợp vào Hybrid:')
             self.stdout.write('      Xem file goiy_ai/ml_models/hybrid.py\n')
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goiy_ai', '0002_searchhistory_ip_address_searchhistory_search_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('user', 'Người dùng'), ('cohort', 'Nhóm phiên ẩn danh'), ('post', 'Bài tương tự')], max_length=10)),
+                ('key', models.CharField(help_text='user_id / mã cohort / post_id', max_length=64)),
+                ('post_ids', models.JSONField(default=list, help_text='ID bài gợi ý theo thứ tự ưu tiên')),
+                ('algorithm', models.CharField(blank=True, max_length=50)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Gợi ý tính sẵn',
+                'verbose_name_plural': 'Gợi ý tính sẵn',
+                'unique_together': {('scope', 'key')},
+            },
+        ),
+    ]
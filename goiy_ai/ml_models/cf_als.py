@@ -4,6 +4,9 @@ Collaborative Filtering với ALS (Alternating Least Squares)
 """
 import os
 import pickle
+import time
+from array import array
+
 import numpy as np
 from scipy.sparse import csr_matrix
 from datetime import timedelta
@@ -25,67 +28,95 @@ class ALSRecommender:
         self.item_mapping = {}  # post_id -> matrix_index
         self.reverse_item_mapping = {}  # matrix_index -> post_id
         self.user_item_matrix = None
+        self.matrix_built_at = None  # mốc đọc tương tác của user_item_matrix (fold-in chỉ cộng tương tác sau mốc này)
+        self.alpha = 40.0  # confidence weight lúc train (fold-in dùng lại)
+        # user_id → (monotonic ts, user factors | None, item đã tương tác); do incremental ghi
+        self.folded = {}
+        self._live_mask = None  # (monotonic ts, bool vector) — xem live_item_mask()
 
         if model_path and os.path.exists(model_path):
             self.load_model(model_path)
 
-    def build_interaction_matrix(self, days=90):
+    def build_interaction_matrix(self, days=90, chunk_size=None):
         """
         Xây ma trận user×item từ UserInteraction
 
+        Đọc 1 lượt bằng values_list(...).iterator() (không dựng object ORM), sắp theo
+        user nên chỉ cần cộng dồn các cặp (user, item) trùng của user hiện tại rồi ghi
+        thẳng vào buffer CSR (array indptr/indices/data) — không cần count() hay đọc 2 lần.
+
         Returns:
             user_item_matrix: sparse CSR matrix shape (n_users, n_items)
         """
         from goiy_ai.models import UserInteraction
 
-        cutoff = timezone.now() - timedelta(days=days)
-        interactions = UserInteraction.objects.filter(
+        chunk_size = chunk_size or getattr(settings, 'AI_CF_BUILD_CHUNK_SIZE', 5000)
+        built_at = timezone.now()
+        cutoff = built_at - timedelta(days=days)
+        rows = UserInteraction.objects.filter(
             created_at__gte=cutoff,
             user__isnull=False  # Chỉ lấy user đã đăng nhập
         ).exclude(
             interaction_type='unsave'
-        ).select_related('user', 'post')
-
-        print(f"📊 Đang xây ma trận từ {interactions.count()} interactions...")
-
-        # Collect unique users & items
-        users = set()
-        items = set()
-        for inter in interactions:
-            users.add(inter.user_id)
-            items.add(inter.post_id)
-
-        # Build mappings
-        self.user_mapping = {uid: idx for idx, uid in enumerate(sorted(users))}
-        self.item_mapping = {iid: idx for idx, iid in enumerate(sorted(items))}
+        ).order_by('user_id').values_list('user_id', 'post_id', 'interaction_type')
+
+        print("📊 Đang xây ma trận từ interactions (streaming)...")
+
+        # Dùng weight (view=1, save=3, contact=5, request=8)
+        weights = UserInteraction.WEIGHT_MAP
+        user_ids = array('q')
+        indptr = array('q', [0])
+        indices = array('i')  # slot của item theo thứ tự gặp, đổi sang thứ tự post_id ở cuối
+        data = array('f')
+        item_slots = {}  # post_id -> slot
+        current_user, current_items = None, {}
+        n_rows = 0
+
+        for uid, post_id, itype in rows.iterator(chunk_size=chunk_size):
+            n_rows += 1
+            if uid != current_user:
+                if current_items:
+                    user_ids.append(current_user)
+                    indices.extend(current_items.keys())
+                    data.extend(current_items.values())
+                    indptr.append(len(indices))
+                current_user, current_items = uid, {}
+            slot = item_slots.get(post_id)
+            if slot is None:
+                slot = item_slots[post_id] = len(item_slots)
+            current_items[slot] = current_items.get(slot, 0.0) + weights.get(itype, 1.0)
+        if current_items:
+            user_ids.append(current_user)
+            indices.extend(current_items.keys())
+            data.extend(current_items.values())
+            indptr.append(len(indices))
+
+        n_users = len(user_ids)
+        n_items = len(item_slots)
+
+        # Build mappings (item theo post_id tăng dần như trước)
+        post_ids = np.fromiter(item_slots.keys(), dtype=np.int64, count=n_items)
+        order = np.argsort(post_ids, kind='stable')
+        slot_to_idx = np.empty(n_items, dtype=np.int32)
+        slot_to_idx[order] = np.arange(n_items, dtype=np.int32)
+
+        self.user_mapping = {int(uid): idx for idx, uid in enumerate(user_ids)}
+        self.item_mapping = {int(pid): idx for idx, pid in enumerate(post_ids[order])}
         self.reverse_item_mapping = {idx: iid for iid, idx in self.item_mapping.items()}
 
-        print(f"   Users: {len(users)}, Items: {len(items)}")
-
-        # Build sparse matrix
-        row_ind = []
-        col_ind = []
-        data = []
-
-        for inter in interactions:
-            u_idx = self.user_mapping.get(inter.user_id)
-            i_idx = self.item_mapping.get(inter.post_id)
-            if u_idx is not None and i_idx is not None:
-                row_ind.append(u_idx)
-                col_ind.append(i_idx)
-                # Dùng weight (view=1, save=3, contact=5, request=8)
-                data.append(inter.weight)
-
-        n_users = len(self.user_mapping)
-        n_items = len(self.item_mapping)
+        print(f"   Interactions: {n_rows}, Users: {n_users}, Items: {n_items}")
 
         self.user_item_matrix = csr_matrix(
-            (data, (row_ind, col_ind)),
+            (np.frombuffer(data, dtype=np.float32),
+             slot_to_idx[np.frombuffer(indices, dtype=np.int32)],
+             np.frombuffer(indptr, dtype=np.int64)),
             shape=(n_users, n_items),
-            dtype=np.float32
         )
+        self.user_item_matrix.sort_indices()
+        self.matrix_built_at = built_at
 
-        print(f"✅ Ma trận: {self.user_item_matrix.shape}, density: {self.user_item_matrix.nnz / (n_users * n_items):.4%}")
+        density = self.user_item_matrix.nnz / (n_users * n_items) if n_users and n_items else 0.0
+        print(f"✅ Ma trận: {self.user_item_matrix.shape}, density: {density:.4%}")
         return self.user_item_matrix
 
     def train(self, factors=64, regularization=0.01, iterations=20, alpha=40):
@@ -126,15 +157,16 @@ class ALSRecommender:
             random_state=42
         )
 
-        # ALS expects item×user matrix (transpose của user×item)
-        item_user_matrix = self.user_item_matrix.T.tocsr()
-
+        # implicit >= 0.5 nhận ma trận user×item (bản cũ mới cần transpose item×user);
+        # truyền nhầm chiều thì user_factors/item_factors bị đảo
         # Apply confidence scaling: C = 1 + alpha * R
-        confidence_matrix = item_user_matrix.copy()
+        confidence_matrix = self.user_item_matrix.tocsr().copy()
         confidence_matrix.data = 1.0 + alpha * confidence_matrix.data
 
         # Train
         self.model.fit(confidence_matrix, show_progress=True)
+        self.alpha = alpha
+        self.folded = {}
 
         print("✅ Huấn luyện hoàn tất!")
 
@@ -152,165 +184,147 @@ class ALSRecommender:
         if not uid:
             return []
 
-        u_idx = self.user_mapping.get(uid)
-        if u_idx is None:
+        if uid not in self.user_mapping and self.folded.get(uid, (0, None))[1] is None:
             # Cold start: user mới
             return self._cold_start_recommendations(limit)
 
-        # Recommend
-        item_indices, scores = self.model.recommend(
-            userid=u_idx,
-            user_items=self.user_item_matrix[u_idx],
-            N=limit * 2,  # Lấy nhiều để filter
-            filter_already_liked_items=filter_interacted,
-            recalculate_user=True  # Tính vector user từ dữ liệu hiện tại để tránh lỗi chỉ số
-        )
-
-        # Convert indices → post_ids
-        post_ids = [
-            self.reverse_item_mapping[idx]
-            for idx in item_indices
-            if idx in self.reverse_item_mapping
-        ]
-
-        # Fetch active posts
-        from website.models import RentalPost
-        from django.db.models import Q
-
-        now = timezone.now()
-        posts = RentalPost.objects.filter(
-            id__in=post_ids,
-            is_approved=True,
-            is_rented=False
-        ).filter(
-            Q(expired_at__isnull=True) | Q(expired_at__gt=now)
-        )
+        post_ids = self.batch_recommend([uid], k=limit, filter_interacted=filter_interacted).get(uid, [])
+        return self._posts_in_order(post_ids, limit)
 
-        # Preserve order
-        posts_dict = {p.id: p for p in posts}
-        result = [posts_dict[pid] for pid in post_ids if pid in posts_dict]
-
-        return result[:limit]
-
-    def recommend_on_demand_24h(self, user=None, user_id=None, limit=10, filter_interacted=True):
-        """Cố gắng lấy gợi ý CF an toàn cho 1 user.
+    def serve_recommendations(self, user=None, user_id=None, limit=10, filter_interacted=True):
+        """Gợi ý CF cho request: chỉ đọc model, không bao giờ train.
 
         Quy trình:
-        1) Thử dùng model đang load (nếu có). Nếu thành công → trả về.
-        2) Nếu lỗi/chưa đủ dữ liệu hoặc user không có trong mapping →
-           xây lại ma trận từ 24 giờ gần nhất và huấn luyện nhanh trong bộ nhớ,
-           sau đó thử recommend lần nữa.
-        3) Nếu vẫn lỗi hoặc dữ liệu quá ít → trả về [] để layer Hybrid fallback.
+        1) User đã được fold-in nền (incremental) hoặc có trong lần train →
+           batch_recommend cho 1 user (1 phép nhân ma trận-vector + mask).
+        2) Còn lại (user mới, model lệch catalog, lỗi...) → lên lịch fold-in nền cho
+           user và trả [] để layer Hybrid fallback Content-based.
         """
-        try:
-            recs = self.get_recommendations(
-                user=user,
-                user_id=user_id,
-                limit=limit,
-                filter_interacted=filter_interacted,
-            )
-            # Nếu có kết quả, trả luôn
-            if recs:
-                return recs
-        except Exception as e:
-            # Tiếp tục thử on-demand
-            print(f"⚠️  CF recommend lỗi (model hiện tại): {e}. Thử train on-demand 24h...")
+        from goiy_ai.ml_models import incremental
 
-        # On-demand rebuild 24h
-        try:
-            # Xây ma trận 24h
-            matrix = self.build_interaction_matrix(days=1)
-            # Kiểm tra dữ liệu tối thiểu
-            if matrix.nnz < 10 or matrix.shape[0] < 2 or matrix.shape[1] < 2:
-                print("⚠️  CF on-demand: dữ liệu 24h quá ít, bỏ qua CF")
-                return []
-
-            # Huấn luyện nhanh để giảm độ trễ
-            self.train(factors=16, regularization=0.05, iterations=8, alpha=40)
-
-            # Thử recommend lại bằng cách tính user vector trực tiếp để tránh lệch chỉ số
-            recs = self._recommend_from_user_row(
-                target_user=user,
-                limit=limit,
-                filter_interacted=filter_interacted,
-            )
-            if recs:
-                return recs
-            # Nếu không xây được hàng user phù hợp → trả [] để Hybrid fallback
-            print("⚠️  CF on-demand: không tạo được user-row phù hợp, bỏ qua CF")
-            return []
-        except Exception as e:
-            print(f"⚠️  CF on-demand cũng lỗi: {e}. Sẽ fallback sang Content-based")
-            return []
-
-    def _recommend_from_user_row(self, target_user, limit=10, filter_interacted=True):
-        """Tạo 1 hàng ma trận cho user từ DB (24h) dựa trên item_mapping hiện tại
-        và gọi recommend(recalculate_user=True) với userid giả lập để tránh phụ thuộc index.
-        """
-        if self.model is None or not self.item_mapping:
-            return []
-
-        # Lấy interactions 24h của user
-        from goiy_ai.models import UserInteraction
-        from django.utils import timezone
-        from datetime import timedelta
-
-        cutoff = timezone.now() - timedelta(days=1)
-        interactions = UserInteraction.objects.filter(
-            user=target_user,
-            created_at__gte=cutoff
-        ).exclude(interaction_type='unsave')
-
-        if not interactions.exists():
-            return []
-
-        # Xây CSR row (1, n_items) dùng item_mapping hiện tại
-        n_items = len(self.item_mapping)
-        cols = []
-        data = []
-        for inter in interactions:
-            i_idx = self.item_mapping.get(inter.post_id)
-            if i_idx is not None:
-                cols.append(i_idx)
-                data.append(float(inter.weight))
-
-        if not cols:
+        uid = user.id if user else user_id
+        if not uid or self.model is None:
             return []
 
-        from scipy.sparse import csr_matrix
-        user_row = csr_matrix((data, ([0]*len(cols), cols)), shape=(1, n_items), dtype=np.float32)
+        entry = self.folded.get(uid)
+        ttl = getattr(settings, 'AI_CF_FOLDIN_TTL', 300)
+        if entry is None or time.monotonic() - entry[0] > ttl:
+            incremental.schedule(uid)
 
         try:
-            item_indices, scores = self.model.recommend(
-                userid=0,  # userid giả lập, không dùng khi recalculate_user=True
-                user_items=user_row,
-                N=limit * 2,
-                filter_already_liked_items=filter_interacted,
-                recalculate_user=True,
-            )
-        except Exception:
-            return []
+            post_ids = self.batch_recommend([uid], k=limit, filter_interacted=filter_interacted).get(uid)
+            if post_ids:
+                return self._posts_in_order(post_ids, limit)
+        except Exception as e:
+            print(f"⚠️  CF recommend lỗi: {e}. Fallback sang Content-based")
+        return []
 
-        post_ids = [
-            self.reverse_item_mapping[idx]
-            for idx in item_indices
-            if idx in self.reverse_item_mapping
-        ]
+    def live_item_mask(self):
+        """Vector bool theo item index: bài còn hiển thị (duyệt, chưa thuê, chưa xóa, còn hạn).
+
+        1 query lấy id bài đang hiển thị, giữ lại AI_CF_LIVE_MASK_TTL giây.
+        """
+        cached = self._live_mask
+        if cached is not None and time.monotonic() - cached[0] < getattr(settings, 'AI_CF_LIVE_MASK_TTL', 60):
+            return cached[1]
 
         from website.models import RentalPost
         from django.db.models import Q
-        now = timezone.now()
-        posts = RentalPost.objects.filter(
-            id__in=post_ids,
+
+        n_items = np.asarray(self.model.item_factors).shape[0]
+        mask = np.zeros(n_items, dtype=bool)
+        live_ids = RentalPost.objects.filter(
             is_approved=True,
-            is_rented=False
+            is_rented=False,
+            is_deleted=False
         ).filter(
-            Q(expired_at__isnull=True) | Q(expired_at__gt=now)
-        )
+            Q(expired_at__isnull=True) | Q(expired_at__gt=timezone.now())
+        ).values_list('id', flat=True)
+        for pid in live_ids.iterator(chunk_size=5000):
+            i_idx = self.item_mapping.get(pid)
+            if i_idx is not None and i_idx < n_items:
+                mask[i_idx] = True
+        self._live_mask = (time.monotonic(), mask)
+        return mask
+
+    def _user_vectors(self, user_ids):
+        """Factors + item đã tương tác của từng user (ưu tiên bản fold-in mới hơn bản train)."""
+        folded = self.folded
+        user_factors = np.asarray(self.model.user_factors)
+        matrix = self.user_item_matrix
+        found, vectors, liked = [], [], []
+        for uid in user_ids:
+            entry = folded.get(uid)
+            if entry is not None and entry[1] is not None:
+                found.append(uid)
+                vectors.append(entry[1])
+                liked.append(entry[2])
+                continue
+            u_idx = self.user_mapping.get(uid)
+            if u_idx is not None and u_idx < user_factors.shape[0]:
+                found.append(uid)
+                vectors.append(user_factors[u_idx])
+                if matrix is not None and u_idx < matrix.shape[0]:
+                    liked.append(matrix.indices[matrix.indptr[u_idx]:matrix.indptr[u_idx + 1]])
+                else:
+                    liked.append(np.empty(0, dtype=np.int32))
+        return found, vectors, liked
+
+    def batch_recommend(self, user_ids, k=10, filter_interacted=True, live_mask=None, chunk_size=None):
+        """Top-k post_id cho nhiều user cùng lúc.
+
+        Điểm = user_factors @ item_factors.T theo từng khối AI_CF_BATCH_CHUNK user; item đã
+        tương tác (CSR) và bài không còn hiển thị (live_item_mask) bị gán -inf; top-k bằng
+        argpartition theo hàng. User không có factors (chưa train, chưa fold-in) bị bỏ qua.
 
-        posts_dict = {p.id: p for p in posts}
-        result = [posts_dict[pid] for pid in post_ids if pid in posts_dict]
-        return result[:limit]
+        Returns:
+            {user_id: [post_id, ...]} (điểm giảm dần)
+        """
+        if self.model is None:
+            raise ValueError("Model chưa được train/load.")
+        found, vectors, liked = self._user_vectors(user_ids)
+        if not found:
+            return {}
+
+        item_factors = np.asarray(self.model.item_factors, dtype=np.float32)
+        n_items = item_factors.shape[0]
+        dead = ~(self.live_item_mask() if live_mask is None else live_mask)
+        k = min(k, n_items)
+        if k <= 0:
+            return {}
+        chunk_size = chunk_size or getattr(settings, 'AI_CF_BATCH_CHUNK', 1024)
+
+        result = {}
+        for start in range(0, len(found), chunk_size):
+            users = found[start:start + chunk_size]
+            scores = np.vstack(vectors[start:start + chunk_size]).astype(np.float32) @ item_factors.T
+            scores[:, dead] = -np.inf
+            if filter_interacted:
+                cols = liked[start:start + chunk_size]
+                lengths = [len(c) for c in cols]
+                if sum(lengths):
+                    rows = np.repeat(np.arange(len(users)), lengths)
+                    scores[rows, np.concatenate(cols).astype(np.int64)] = -np.inf
+
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for r, uid in enumerate(users):
+                result[uid] = [
+                    self.reverse_item_mapping[int(idx)]
+                    for idx, score in zip(top[r], top_scores[r])
+                    if np.isfinite(score) and int(idx) in self.reverse_item_mapping
+                ]
+        return result
+
+    def _posts_in_order(self, post_ids, limit):
+        """RentalPost theo đúng thứ tự post_ids (liveness đã lọc bằng live_item_mask)."""
+        from website.models import RentalPost
+
+        posts = RentalPost.objects.in_bulk(post_ids[:limit])
+        return [posts[pid] for pid in post_ids[:limit] if pid in posts]
 
     def _cold_start_recommendations(self, limit):
         """Gợi ý cho user mới (chưa có trong ma trận)"""
@@ -378,7 +392,9 @@ class ALSRecommender:
             'user_mapping': self.user_mapping,
             'item_mapping': self.item_mapping,
             'reverse_item_mapping': self.reverse_item_mapping,
-            'user_item_matrix': self.user_item_matrix
+            'user_item_matrix': self.user_item_matrix,
+            'alpha': self.alpha,
+            'matrix_built_at': self.matrix_built_at,
         }
 
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
@@ -400,6 +416,19 @@ class ALSRecommender:
         self.item_mapping = data['item_mapping']
         self.reverse_item_mapping = data['reverse_item_mapping']
         self.user_item_matrix = data['user_item_matrix']
+        self.alpha = data.get('alpha', 40.0)
+        self.matrix_built_at = data.get('matrix_built_at')
+        self.folded = {}
+        self._live_mask = None
+
+        # Artifact cũ được fit trên ma trận item×user → factors bị đảo chiều
+        n_users, n_items = len(self.user_mapping), len(self.item_mapping)
+        if (n_users != n_items
+                and self.model.user_factors.shape[0] == n_items
+                and self.model.item_factors.shape[0] == n_users):
+            self.model.user_factors, self.model.item_factors = (
+                self.model.item_factors, self.model.user_factors)
+            self.model._XtX = self.model._YtY = None
 
         print(f"📂 Đã load model: {filepath}")
         print(f"   Users: {len(self.user_mapping)}, Items: {len(self.item_mapping)}")
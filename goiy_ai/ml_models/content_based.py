@@ -2,6 +2,8 @@
 Content-Based Filtering - Gợi ý dựa trên nội dung
 Phân tích đặc điểm bài đăng: giá, diện tích, vị trí, features
 """
+import threading
+
 import numpy as np
 from django.db.models import Q
 from datetime import timedelta
@@ -21,6 +23,16 @@ class ContentBasedRecommender:
 
     def __init__(self):
         self.scaler = StandardScaler()
+        # Instance dùng chung giữa các request (registry) → context riêng theo thread
+        self._local = threading.local()
+
+    @property
+    def current_context(self):
+        return getattr(self._local, 'context', {})
+
+    @current_context.setter
+    def current_context(self, value):
+        self._local.context = value
 
     def get_recommendations(self, user=None, post_id=None, limit=10, context=None):
         """
@@ -86,7 +98,55 @@ class ContentBasedRecommender:
         """
         Tìm các bài tương tự với target_post
         CHIẾN LƯỢC: Ưu tiên cùng địa điểm trước (1-2 bài), sau đó lọc theo giá/diện tích/đặc điểm
+
+        Chấm điểm trên ma trận đặc trưng (feature_matrix) thay vì gọi _calculate_similarity
+        cho từng bài; lỗi thì quay về cách tính từng cặp bên dưới.
         """
+        try:
+            return self._recommend_similar_posts_vectorized(target_post, candidate_posts, limit)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning(f"⚠️ Feature matrix lỗi, tính từng cặp: {e}")
+            return self._recommend_similar_posts_pairwise(target_post, candidate_posts, limit)
+
+    def _recommend_similar_posts_vectorized(self, target_post, candidate_posts, limit):
+        """Cùng chiến lược với bản từng cặp, nhưng điểm của mọi ứng viên tính 1 lần bằng NumPy."""
+        from goiy_ai.ml_models import feature_matrix
+
+        matrix = feature_matrix.get_matrix()
+        candidate_ids = candidate_posts.exclude(id=target_post.id).values_list('id', flat=True)
+        rows = matrix.rows_for(candidate_ids)
+        if rows.size == 0:
+            return []
+
+        target = matrix.target_vector(target_post)
+        scores = matrix.similarity_scores(target, rows)
+        picked = np.zeros(rows.size, dtype=bool)
+        chosen = []
+
+        # BƯỚC 1: Bài CÙNG ĐỊA ĐIỂM: tối đa 2 bài, ưu tiên cùng district
+        if target_post.province_id:
+            same_location = matrix.province[rows] == target['province']
+            if target_post.district_id:
+                idx = np.flatnonzero(same_location & (matrix.district[rows] == target['district']))
+                chosen.extend(idx[feature_matrix.top_k(scores[idx], 2)])
+                picked[chosen] = True
+            if len(chosen) < 2:
+                idx = np.flatnonzero(same_location & ~picked)
+                chosen.extend(idx[feature_matrix.top_k(scores[idx], 2 - len(chosen))])
+                picked[chosen] = True
+
+        # BƯỚC 2-3: Phần còn lại theo điểm (giá/diện tích/đặc điểm), top-k bằng argpartition
+        if len(chosen) < limit:
+            idx = np.flatnonzero(~picked)
+            chosen.extend(idx[feature_matrix.top_k(scores[idx], limit - len(chosen))])
+
+        post_ids = [int(pid) for pid in matrix.ids[rows[np.asarray(chosen, dtype=np.int64)]]]
+        posts = candidate_posts.in_bulk(post_ids)
+        return [posts[pid] for pid in post_ids if pid in posts][:limit]
+
+    def _recommend_similar_posts_pairwise(self, target_post, candidate_posts, limit):
+        """Bản tính từng cặp bằng _calculate_similarity (dự phòng khi ma trận lỗi)."""
         candidates = candidate_posts.exclude(id=target_post.id)
 
         if not candidates.exists():
@@ -0,0 +1,215 @@
+"""
+Ma trận đặc trưng bài đăng cho Content-based: mỗi bài đang hiển thị = 1 hàng NumPy.
+
+Cột: mã loại phòng (so sánh bằng nhau = tích vô hướng của one-hot), id tỉnh / quận /
+phường (-1 nếu trống), log giá, diện tích, bitmask tiện ích (cột features_mask) và hạn
+đăng (epoch). similarity_scores() tính điểm của 1 bài so với toàn bộ ứng viên bằng vài
+phép toán trên mảng, cho đúng điểm như ContentBasedRecommender._calculate_similarity:
+
+    |p2 - p1| / p1 == |expm1(log p2 - log p1)|    (p2 = 0 → log = -inf → tỉ lệ 1)
+    số tiện ích chung == popcount(mask1 & mask2)
+
+Ma trận thường trú trong process, làm mới tăng dần: mỗi AI_FEATURE_MATRIX_REFRESH_SECONDS
+chỉ đọc các bài có updated_at mới hơn lần trước (upsert / gỡ hàng), và dựng lại toàn bộ
+mỗi AI_FEATURE_MATRIX_REBUILD_SECONDS (bắt các thay đổi qua queryset.update()).
+Bài hết hạn bị loại lúc query bằng cột hạn đăng, không cần dựng lại.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from website.models import features_to_mask
+
+_FIELDS = ('id', 'category', 'province_id', 'district_id', 'ward_id', 'price', 'area',
+           'features_mask', 'expired_at', 'updated_at')
+
+# Giá là số nguyên nên tỉ lệ hay rơi đúng ngưỡng (2tr vs 2tr4 = 0.2): chừa sai số log/exp
+_EPS = 1e-9
+
+_LOCK = threading.Lock()
+_RESIDENT = None
+
+
+def _category_codes():
+    from website.models import RentalPost
+    return {key: i for i, (key, _) in enumerate(RentalPost.CATEGORY_CHOICES)}
+
+
+def _popcount(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    as_bytes = np.ascontiguousarray(x, dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+def _log_price(price):
+    price = float(price or 0)
+    return math.log(price) if price > 0 else -math.inf
+
+
+class PostFeatureMatrix:
+    """Cột NumPy song song, hàng i ↔ bài ids[i]."""
+
+    def __init__(self, rows):
+        codes = _category_codes()
+        n = len(rows)
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        self.category = np.fromiter((codes.get(r[1], -1) for r in rows), dtype=np.int16, count=n)
+        self.province = np.fromiter((r[2] if r[2] is not None else -1 for r in rows), dtype=np.int64, count=n)
+        self.district = np.fromiter((r[3] if r[3] is not None else -1 for r in rows), dtype=np.int64, count=n)
+        self.ward = np.fromiter((r[4] if r[4] is not None else -1 for r in rows), dtype=np.int64, count=n)
+        self.log_price = np.fromiter((_log_price(r[5]) for r in rows), dtype=np.float64, count=n)
+        self.area = np.fromiter((float(r[6] or 0) for r in rows), dtype=np.float64, count=n)
+        self.features = np.fromiter((r[7] or 0 for r in rows), dtype=np.uint64, count=n)
+        self.expires = np.fromiter((r[8].timestamp() if r[8] else math.inf for r in rows),
+                                   dtype=np.float64, count=n)
+        self.row_of = {int(pid): i for i, pid in enumerate(self.ids)}
+        self.watermark = max((r[9] for r in rows if r[9] is not None), default=None)
+        self.built_at = time.monotonic()
+        self.refreshed_at = self.built_at
+
+    def __len__(self):
+        return len(self.ids)
+
+    def target_vector(self, post):
+        """Đặc trưng của 1 bài (kể cả bài không còn trong ma trận)."""
+        row = self.row_of.get(post.id)
+        if row is not None:
+            return {name: getattr(self, name)[row] for name in
+                    ('category', 'province', 'district', 'ward', 'log_price', 'area', 'features')}
+        return {
+            'category': _category_codes().get(post.category, -1),
+            'province': post.province_id if post.province_id is not None else -1,
+            'district': post.district_id if post.district_id is not None else -1,
+            'ward': post.ward_id if post.ward_id is not None else -1,
+            'log_price': _log_price(post.price),
+            'area': float(post.area or 0),
+            'features': features_to_mask(post.features),
+        }
+
+    def rows_for(self, post_ids, now=None):
+        """Chỉ số hàng của các bài trong post_ids còn hạn đăng."""
+        ids = np.fromiter(post_ids, dtype=np.int64)
+        rows = np.flatnonzero(np.isin(self.ids, ids))
+        now_ts = (now or timezone.now()).timestamp()
+        return rows[self.expires[rows] > now_ts]
+
+    def similarity_scores(self, target, rows):
+        """Điểm tương đồng của target với các hàng `rows` (giống _calculate_similarity)."""
+        score = np.where(self.category[rows] == target['category'], 2.5, 0.0)
+
+        # Vị trí: so id như bản gốc (None == None cũng tính là trùng)
+        same_prov = self.province[rows] == target['province']
+        same_dist = same_prov & (self.district[rows] == target['district'])
+        same_ward = same_dist & (self.ward[rows] == target['ward'])
+        score += 4.0 * same_prov + 3.0 * same_dist + 2.0 * same_ward
+
+        if np.isfinite(target['log_price']):
+            with np.errstate(invalid='ignore', over='ignore'):
+                ratio = np.abs(np.expm1(self.log_price[rows] - target['log_price']))
+            score += np.select([ratio <= 0.2 + _EPS, ratio <= 0.3 + _EPS, ratio <= 0.5 + _EPS],
+                               [2.5, 1.5, 0.8], 0.0)
+
+        if target['area'] > 0:
+            ratio = np.abs(self.area[rows] - target['area']) / target['area']
+            score += np.select([ratio <= 0.2, ratio <= 0.3, ratio <= 0.5], [1.5, 1.0, 0.5], 0.0)
+
+        if target['features']:
+            common = _popcount(self.features[rows] & np.uint64(target['features']))
+            score += common * 0.6
+        return score
+
+    def upsert(self, rows, live_ids):
+        """Trả về ma trận mới đã thay/gỡ các hàng thay đổi (bản cũ giữ nguyên cho request đang đọc)."""
+        changed = {r[0] for r in rows}
+        keep = [i for i, pid in enumerate(self.ids) if int(pid) not in changed]
+        fresh = PostFeatureMatrix([r for r in rows if r[0] in live_ids])
+        merged = PostFeatureMatrix.__new__(PostFeatureMatrix)
+        for name in ('ids', 'category', 'province', 'district', 'ward', 'log_price', 'area', 'features', 'expires'):
+            setattr(merged, name, np.concatenate([getattr(self, name)[keep], getattr(fresh, name)]))
+        merged.row_of = {int(pid): i for i, pid in enumerate(merged.ids)}
+        marks = [m for m in (self.watermark, fresh.watermark,
+                             max((r[9] for r in rows if r[9] is not None), default=None)) if m is not None]
+        merged.watermark = max(marks) if marks else None
+        merged.built_at = self.built_at
+        merged.refreshed_at = time.monotonic()
+        return merged
+
+
+def _live_queryset():
+    from website.models import RentalPost
+
+    return RentalPost.objects.filter(
+        is_approved=True,
+        is_deleted=False,
+        is_rented=False
+    ).filter(
+        Q(expired_at__isnull=True) | Q(expired_at__gt=timezone.now())
+    )
+
+
+def build():
+    rows = list(_live_queryset().order_by().values_list(*_FIELDS).iterator(chunk_size=2000))
+    return PostFeatureMatrix(rows)
+
+
+def _refresh(matrix):
+    """Đọc các bài sửa sau watermark (kể cả bài vừa bị ẩn) và cập nhật ma trận."""
+    from website.models import RentalPost
+
+    if matrix.watermark is None:
+        return build()
+    rows = list(RentalPost.objects.filter(updated_at__gte=matrix.watermark)
+                .order_by().values_list(*_FIELDS))
+    if not rows:
+        matrix.refreshed_at = time.monotonic()
+        return matrix
+    live_ids = set(_live_queryset().filter(id__in=[r[0] for r in rows]).values_list('id', flat=True))
+    return matrix.upsert(rows, live_ids)
+
+
+def get_matrix():
+    """Ma trận thường trú của process (tự làm mới tăng dần theo chu kỳ)."""
+    global _RESIDENT
+    now = time.monotonic()
+    refresh_every = getattr(settings, 'AI_FEATURE_MATRIX_REFRESH_SECONDS', 60)
+    rebuild_every = getattr(settings, 'AI_FEATURE_MATRIX_REBUILD_SECONDS', 3600)
+    matrix = _RESIDENT
+    if matrix is not None and now - matrix.refreshed_at < refresh_every and now - matrix.built_at < rebuild_every:
+        return matrix
+    with _LOCK:
+        matrix = _RESIDENT
+        if matrix is None or now - matrix.built_at >= rebuild_every:
+            _RESIDENT = build()
+        elif now - matrix.refreshed_at >= refresh_every:
+            _RESIDENT = _refresh(matrix)
+        return _RESIDENT
+
+
+def invalidate(post_id=None):
+    """Làm mới ở lần đọc kế tiếp (post_id=None → dựng lại toàn bộ)."""
+    global _RESIDENT
+    with _LOCK:
+        if _RESIDENT is None:
+            return
+        if post_id is None:
+            _RESIDENT = None
+        else:
+            _RESIDENT.refreshed_at = -math.inf
+
+
+def top_k(scores, k):
+    """Chỉ số của k điểm cao nhất (giảm dần, ổn định) bằng argpartition."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(-scores[idx], kind='stable')]
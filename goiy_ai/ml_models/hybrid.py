@@ -2,7 +2,6 @@
 Hybrid Recommender - Kết hợp Collaborative Filtering + Content-based
 ĐÂY LÀ HỆ THỐNG HYBRID (ML + HEURISTIC)
 """
-import os
 from django.conf import settings
 
 
@@ -16,51 +15,42 @@ class HybridRecommender:
     Weight: 50% CF + 50% Content-based (có thể điều chỉnh)
     """
 
-    def __init__(self, cf_model_path=None, cf_weight=0.5, content_weight=0.5):
+    def __init__(self, cf_model_path=None, cf_weight=0.5, content_weight=0.5, cf_recommender=None):
         """
         Args:
             cf_model_path: đường dẫn model CF (ALS). Nếu None, dùng default path
             cf_weight: trọng số cho CF (default 0.6)
             content_weight: trọng số cho Content-based (default 0.4)
+            cf_recommender: ALSRecommender có sẵn (bỏ qua registry, dùng cho test/script)
+
+        Không load model ở đây: CF model lấy từ registry (load 1 lần / process, tự
+        hot-swap khi train_cf_model publish file mới). Dùng registry.get_recommender()
+        để lấy instance dùng chung thay vì tạo mới mỗi request.
         """
         self.cf_weight = cf_weight
         self.content_weight = content_weight
 
-    # Initialize Content-based recommender
+        # Initialize Content-based recommender
         from goiy_ai.ml_models.content_based import ContentBasedRecommender
         self.content_recommender = ContentBasedRecommender()
 
-        # Initialize CF recommender (ALS)
-        from goiy_ai.ml_models.cf_als import ALSRecommender
-
-        if cf_model_path is None:
-            # Default path
-            cf_model_path = os.path.join(
-                settings.BASE_DIR,
-                'goiy_ai',
-                'ml_models',
-                'trained_models',
-                'cf_als_model.pkl'
-            )
+        self.cf_model_path = cf_model_path
+        self._cf_override = cf_recommender
 
+    @property
+    def cf_recommender(self):
+        """ALSRecommender hiện hành (None → chỉ dùng Content-based)."""
+        if self._cf_override is not None:
+            return self._cf_override
         # Nếu cấu hình yêu cầu chỉ dùng Content-based → tắt CF hoàn toàn
         if getattr(settings, 'AI_FORCE_CONTENT_ONLY', False):
-            self.cf_recommender = None
-            # print("Hybrid: AI_FORCE_CONTENT_ONLY=True -> chi dung Content-based")
-            return
+            return None
+        from goiy_ai.ml_models import registry
+        return registry.get_cf_model(self.cf_model_path)
 
-        # Load CF model nếu có
-        self.cf_recommender = None
-        if os.path.exists(cf_model_path):
-            try:
-                self.cf_recommender = ALSRecommender(model_path=cf_model_path)
-                print(f"✅ Hybrid: Đã load CF model từ {cf_model_path}")
-            except Exception as e:
-                print(f"⚠️  Hybrid: Không load được CF model: {e}")
-                print(f"   Sẽ chỉ dùng Content-based")
-        else:
-            print(f"⚠️  Hybrid: Không tìm thấy CF model tại {cf_model_path}")
-            print(f"   Sẽ chỉ dùng Content-based")
+    @cf_recommender.setter
+    def cf_recommender(self, value):
+        self._cf_override = value
 
     def get_recommendations(self, user=None, post_id=None, limit=10, context=None):
         """
@@ -76,7 +66,8 @@ class HybridRecommender:
             List[RentalPost]
         """
         # Nếu không có CF model, fallback sang Content-based
-        if self.cf_recommender is None:
+        cf_recommender = self.cf_recommender
+        if cf_recommender is None:
             return self.content_recommender.get_recommendations(
                 user=user,
                 post_id=post_id,
@@ -103,16 +94,17 @@ class HybridRecommender:
             )
 
         # HYBRID: Trộn CF + Content-based
-        return self._hybrid_recommendations(user, limit, context)
+        return self._hybrid_recommendations(user, limit, context, cf_recommender)
 
-    def _hybrid_recommendations(self, user, limit, context):
+    def _hybrid_recommendations(self, user, limit, context, cf_recommender=None):
         """
         Trộn kết quả từ CF và Content-based
         """
-        # 1. Lấy CF recommendations
+        # 1. Lấy CF recommendations (giữ 1 tham chiếu cho cả request dù registry có swap)
+        cf_recommender = cf_recommender or self.cf_recommender
         try:
-            # Dùng đường an toàn: nếu model hiện tại lỗi sẽ train on-demand 24h
-            cf_posts = self.cf_recommender.recommend_on_demand_24h(
+            # Chỉ đọc model (fold-in nền cho user mới), không train trong request
+            cf_posts = cf_recommender.serve_recommendations(
                 user=user,
                 limit=limit * 3,  # Lấy nhiều hơn để trộn
                 filter_interacted=True,
@@ -128,6 +120,10 @@ class HybridRecommender:
             context=context
         )
 
+        return self._blend(cf_posts, content_posts, limit)
+
+    def _blend(self, cf_posts, content_posts, limit):
+        """Trộn 2 danh sách theo cf_weight (không trùng bài)."""
         # 3. Nếu một trong hai rỗng, dùng cái còn lại
         if not cf_posts:
             return content_posts[:limit]
@@ -163,6 +159,33 @@ class HybridRecommender:
 
         return result[:limit]
 
+    def batch_recommendations(self, users, limit=10):
+        """Gợi ý hybrid cho nhiều user (job precompute): phần CF tính 1 lần cho cả lô.
+
+        Returns:
+            {user_id: [post_id, ...]}
+        """
+        from website.models import RentalPost
+
+        cf_recommender = self.cf_recommender
+        cf_ids = {}
+        if cf_recommender is not None:
+            try:
+                cf_ids = cf_recommender.batch_recommend([u.id for u in users], k=limit * 3)
+            except Exception as e:
+                print(f"⚠️  CF batch error: {e}, fallback sang Content-based")
+        cf_posts_by_id = RentalPost.objects.in_bulk({pid for ids in cf_ids.values() for pid in ids})
+
+        result = {}
+        for user in users:
+            cf_posts = [cf_posts_by_id[pid] for pid in cf_ids.get(user.id, []) if pid in cf_posts_by_id]
+            content_posts = self.content_recommender.get_recommendations(
+                user=user,
+                limit=limit * 3 if cf_posts else limit
+            )
+            result[user.id] = [p.id for p in self._blend(cf_posts, content_posts, limit)]
+        return result
+
     def adjust_weights(self, cf_weight, content_weight):
         """
         Điều chỉnh trọng số động
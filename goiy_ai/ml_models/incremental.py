@@ -0,0 +1,162 @@
+"""
+Incremental training chạy nền cho CF (ALS): fold-in tương tác gần đây vào user factors.
+
+Request không bao giờ train ALS nữa. Khi serving gặp user chưa có factors (user mới
+sau lần train, hoặc factors đã cũ hơn AI_CF_FOLDIN_TTL) thì chỉ gọi schedule(user_id)
+rồi fallback Content-based; thread nền gom các user đang chờ (debounce), đọc tương tác
+AI_CF_FOLDIN_DAYS ngày gần nhất (chỉ phần sau lúc build ma trận train) bằng 1 query,
+cộng vào hàng của user trong ma trận train (nếu có) và giải least-squares cho cả lô
+với item_factors cố định (model.recalculate_user — không sửa model dùng chung).
+
+Kết quả gắn vào ALSRecommender đang chạy (cf_model.folded, copy-on-write): request sau
+chỉ còn 1 phép nhân item_factors @ user_vector. Model mới publish (registry hot-swap)
+bắt đầu với folded rỗng vì factors cũ thuộc không gian item khác.
+
+Settings:
+    AI_CF_INCREMENTAL              bật/tắt thread nền (mặc định True)
+    AI_CF_FOLDIN_DAYS              số ngày tương tác dùng để fold-in (mặc định 1)
+    AI_CF_FOLDIN_TTL               giây trước khi fold-in lại 1 user (mặc định 300)
+    AI_CF_FOLDIN_DEBOUNCE_SECONDS  gom yêu cầu trong khoảng này (mặc định 2)
+    AI_CF_FOLDIN_MAX_USERS         số user giữ factors tối đa / model (mặc định 50000)
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from scipy.sparse import csr_matrix
+
+_QUEUE_LOCK = threading.Lock()
+_PENDING = set()
+_QUEUE_WAKE = threading.Event()
+_WORKER = None
+
+
+def schedule(user_id):
+    """Đưa user vào hàng đợi fold-in (không chặn request)."""
+    if not user_id or not getattr(settings, 'AI_CF_INCREMENTAL', True):
+        return
+    with _QUEUE_LOCK:
+        _PENDING.add(user_id)
+    _ensure_worker()
+    _QUEUE_WAKE.set()
+
+
+def _ensure_worker():
+    global _WORKER
+    with _QUEUE_LOCK:
+        if _WORKER is not None and _WORKER.is_alive():
+            return
+        _WORKER = threading.Thread(target=_worker_loop, name='cf-foldin', daemon=True)
+        _WORKER.start()
+
+
+def _worker_loop():
+    from django.db import close_old_connections
+
+    while True:
+        _QUEUE_WAKE.wait()
+        time.sleep(getattr(settings, 'AI_CF_FOLDIN_DEBOUNCE_SECONDS', 2))
+        _QUEUE_WAKE.clear()
+        try:
+            flush_pending()
+        except Exception as e:
+            print(f"⚠️  CF fold-in lỗi: {e}")
+        finally:
+            close_old_connections()
+
+
+def flush_pending(cf_model=None):
+    """Fold-in toàn bộ user đang chờ ngay lập tức (worker nền / test / command)."""
+    with _QUEUE_LOCK:
+        user_ids = list(_PENDING)
+        _PENDING.clear()
+    if not user_ids:
+        return 0
+    if cf_model is None:
+        from goiy_ai.ml_models import registry
+        cf_model = registry.get_cf_model()
+    if cf_model is None:
+        return 0
+    return fold_in(cf_model, user_ids)
+
+
+def fold_in(cf_model, user_ids):
+    """Tính user factors từ tương tác gần đây cho 1 lô user, gắn vào cf_model.folded.
+
+    Returns: số user có factors mới.
+    """
+    from goiy_ai.models import UserInteraction
+
+    model = cf_model.model
+    if model is None or not cf_model.item_mapping or not user_ids:
+        return 0
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'AI_CF_FOLDIN_DAYS', 1))
+    matrix = cf_model.user_item_matrix
+    built_at = getattr(cf_model, 'matrix_built_at', None)
+    recent = {'created_at__gte': cutoff}
+    if matrix is not None and built_at is not None and built_at > cutoff:
+        # Tương tác trước mốc build đã nằm trong hàng của ma trận train → không cộng 2 lần
+        recent = {'created_at__gt': built_at}
+    rows = (UserInteraction.objects
+            .filter(user_id__in=user_ids, **recent)
+            .exclude(interaction_type='unsave')
+            .values_list('user_id', 'post_id', 'interaction_type'))
+
+    # Cộng dồn trọng số theo (user, item) — item chưa có trong model thì bỏ qua
+    weights = UserInteraction.WEIGHT_MAP
+    per_user = {}
+    for uid, post_id, itype in rows.iterator(chunk_size=2000):
+        i_idx = cf_model.item_mapping.get(post_id)
+        if i_idx is None:
+            continue
+        items = per_user.setdefault(uid, {})
+        items[i_idx] = items.get(i_idx, 0.0) + weights.get(itype, 1.0)
+
+    # User đã có trong lần train: fold-in trên hàng của ma trận train + tương tác mới,
+    # không để vài tương tác gần đây thay thế toàn bộ lịch sử (và danh sách item đã xem)
+    if matrix is not None:
+        for uid, items in per_user.items():
+            u_idx = cf_model.user_mapping.get(uid)
+            if u_idx is None or u_idx >= matrix.shape[0]:
+                continue
+            start, end = matrix.indptr[u_idx], matrix.indptr[u_idx + 1]
+            for i_idx, value in zip(matrix.indices[start:end], matrix.data[start:end]):
+                items[int(i_idx)] = items.get(int(i_idx), 0.0) + float(value)
+
+    now = time.monotonic()
+    folded = dict(cf_model.folded)
+    if per_user:
+        uids = list(per_user)
+        indptr, indices, data = [0], [], []
+        for uid in uids:
+            items = per_user[uid]
+            indices.extend(items.keys())
+            data.extend(items.values())
+            indptr.append(len(indices))
+        # Cùng phép biến đổi confidence như lúc train: C = 1 + alpha·R
+        confidence = 1.0 + cf_model.alpha * np.asarray(data, dtype=np.float32)
+        user_items = csr_matrix(
+            (confidence, np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(uids), len(cf_model.item_mapping)),
+        )
+        factors = model.recalculate_user(np.arange(len(uids)), user_items)
+        for row, uid in enumerate(uids):
+            folded.pop(uid, None)
+            folded[uid] = (now, np.asarray(factors[row], dtype=np.float32),
+                           np.asarray(user_items[row].indices, dtype=np.int64))
+
+    # User không còn tương tác hợp lệ → đánh dấu để serving không schedule lại liên tục
+    for uid in user_ids:
+        if uid not in per_user:
+            folded.pop(uid, None)
+            folded[uid] = (now, None, None)
+
+    limit = getattr(settings, 'AI_CF_FOLDIN_MAX_USERS', 50000)
+    while len(folded) > limit:
+        folded.pop(next(iter(folded)))
+    cf_model.folded = folded  # swap nguyên tử, request đang đọc bản cũ không bị ảnh hưởng
+    return len(per_user)
@@ -0,0 +1,240 @@
+"""
+Gợi ý tính sẵn (top-N) cho serving.
+
+Job offline (manage.py precompute_recommendations) ghi vào PrecomputedRecommendation:
+- user:<user_id>      gợi ý Hybrid cho từng user hoạt động gần đây
+- cohort:<mã>         phiên ẩn danh gom theo (tỉnh, loại phòng) hay xem nhất; 'popular' nếu chưa có gì
+- post:<post_id>      bài tương tự cho từng bài đang hiển thị
+
+Request (get_recommendations_view, carousel trang chủ) chỉ còn: tra 1 dòng theo key +
+lọc bài còn hiển thị (1 query). Key chưa có / hết hạn → tính trực tiếp 1 lần như cũ
+rồi ghi lại (write-through) để các request sau dùng.
+
+Bài hết hạn / đã cho thuê được gỡ khỏi các danh sách bằng invalidate_posts()
+(job expired_posts của website/scheduler.py, check_expired_posts, admin mark_rented);
+signal RentalPost chỉ xóa danh sách "tương tự" của chính bài đó (drop_similar).
+
+Settings:
+    AI_PRECOMPUTED_TOP_N       số bài lưu mỗi danh sách (mặc định 30, dư để lọc liveness)
+    AI_PRECOMPUTED_TTL_HOURS   thời gian sống của 1 danh sách (mặc định 6)
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+COHORT_CACHE_SECONDS = 600
+POPULAR_COHORT = 'popular'
+
+
+def top_n():
+    return getattr(settings, 'AI_PRECOMPUTED_TOP_N', 30)
+
+
+def ttl():
+    return timedelta(hours=getattr(settings, 'AI_PRECOMPUTED_TTL_HOURS', 6))
+
+
+def _live_filter(qs, now=None):
+    now = now or timezone.now()
+    return qs.filter(
+        is_approved=True,
+        is_rented=False,
+        is_deleted=False
+    ).filter(
+        Q(expired_at__isnull=True) | Q(expired_at__gt=now)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Cohort cho phiên ẩn danh
+# ---------------------------------------------------------------------------
+
+def make_cohort_key(province_id, category):
+    if not province_id and not category:
+        return POPULAR_COHORT
+    return f"p{province_id or 0}-{category or 'all'}"
+
+
+def parse_cohort_key(key):
+    if key == POPULAR_COHORT:
+        return None, None
+    province, category = key[1:].split('-', 1)
+    return (int(province) or None), (None if category == 'all' else category)
+
+
+def cohort_for_session(session_id):
+    """(tỉnh, loại phòng) session xem nhiều nhất trong 24h → mã cohort (cache 10 phút)."""
+    if not session_id:
+        return POPULAR_COHORT
+    cache_key = f"goiy_ai:cohort:{session_id}"
+    key = cache.get(cache_key)
+    if key is not None:
+        return key
+
+    from goiy_ai.models import UserInteraction
+    top = (UserInteraction.objects
+           .filter(session_id=session_id, created_at__gte=timezone.now() - timedelta(hours=24))
+           .values('post__province_id', 'post__category')
+           .annotate(n=Count('id'))
+           .order_by('-n')
+           .first())
+    key = make_cohort_key(top['post__province_id'], top['post__category']) if top else POPULAR_COHORT
+    cache.set(cache_key, key, COHORT_CACHE_SECONDS)
+    return key
+
+
+# ---------------------------------------------------------------------------
+# Đọc / ghi bảng
+# ---------------------------------------------------------------------------
+
+def store(scope, key, post_ids, algorithm=''):
+    from goiy_ai.models import PrecomputedRecommendation
+
+    PrecomputedRecommendation.objects.update_or_create(
+        scope=scope,
+        key=str(key),
+        defaults={
+            'post_ids': [int(pid) for pid in post_ids][:top_n()],
+            'algorithm': algorithm,
+            'expires_at': timezone.now() + ttl(),
+        },
+    )
+
+
+def lookup(scope, key, limit):
+    """Danh sách bài (còn hiển thị, đúng thứ tự) hoặc None nếu chưa có / hết hạn."""
+    from goiy_ai.models import PrecomputedRecommendation
+    from website.models import RentalPost
+
+    now = timezone.now()
+    row = (PrecomputedRecommendation.objects
+           .filter(scope=scope, key=str(key), expires_at__gt=now)
+           .values_list('post_ids', flat=True)
+           .first())
+    if row is None:
+        return None
+    posts = {p.id: p for p in _live_filter(RentalPost.objects.filter(id__in=row), now)}
+    return [posts[pid] for pid in row if pid in posts][:limit]
+
+
+def recommend(user=None, session_id=None, post_id=None, limit=10):
+    """Gợi ý cho request: tra bảng tính sẵn, miss thì tính trực tiếp rồi ghi lại.
+
+    Returns: (List[RentalPost], tên thuật toán để log)
+    """
+    if post_id:
+        scope, key = 'post', str(post_id)
+    elif user is not None and user.is_authenticated:
+        scope, key = 'user', str(user.id)
+    else:
+        scope, key = 'cohort', cohort_for_session(session_id)
+
+    posts = lookup(scope, key, limit)
+    if posts is not None:
+        return posts, f'precomputed_{scope}'
+
+    try:
+        if scope == 'cohort':
+            post_ids = compute_cohort(key)
+        else:
+            from goiy_ai.ml_models import registry
+            recs = registry.get_recommender().get_recommendations(
+                user=user if scope == 'user' else None,
+                post_id=post_id,
+                limit=top_n(),
+                context={'session_id': session_id},
+            )
+            post_ids = [p.id for p in recs]
+        store(scope, key, post_ids, algorithm='live')
+    except Exception as e:
+        print(f"⚠️  Precomputed: không tính được {scope}:{key}: {e}")
+        return [], f'precomputed_{scope}'
+    return lookup(scope, key, limit) or [], f'live_{scope}'
+
+
+# ---------------------------------------------------------------------------
+# Tính danh sách (dùng trong job offline và khi miss)
+# ---------------------------------------------------------------------------
+
+def compute_cohort(key):
+    """Bài phổ biến trong (tỉnh, loại phòng) của cohort, bù thêm bài phổ biến toàn hệ thống."""
+    from goiy_ai.ml_models.content_based import ContentBasedRecommender
+
+    content = ContentBasedRecommender()
+    active = content._get_active_posts()
+    n = top_n()
+    province_id, category = parse_cohort_key(key)
+    posts = []
+    if province_id or category:
+        scoped = active
+        if province_id:
+            scoped = scoped.filter(province_id=province_id)
+        if category:
+            scoped = scoped.filter(category=category)
+        posts = content._get_popular_posts(scoped, n)
+    if len(posts) < n:
+        seen = {p.id for p in posts}
+        posts += [p for p in content._get_popular_posts(active, n) if p.id not in seen]
+    return [p.id for p in posts[:n]]
+
+
+def active_cohorts(days=1):
+    """Các mã cohort của phiên ẩn danh có tương tác trong `days` ngày gần nhất."""
+    from goiy_ai.models import UserInteraction
+
+    rows = (UserInteraction.objects
+            .filter(user__isnull=True, created_at__gte=timezone.now() - timedelta(days=days))
+            .values_list('post__province_id', 'post__category')
+            .distinct())
+    keys = {make_cohort_key(province_id, category) for province_id, category in rows}
+    keys.add(POPULAR_COHORT)
+    return sorted(keys)
+
+
+def drop_similar(post_ids):
+    """Xóa danh sách "tương tự" của chính các bài (1 DELETE theo key — dùng được trong request)."""
+    from goiy_ai.models import PrecomputedRecommendation
+
+    keys = [str(int(pid)) for pid in post_ids if pid]
+    if not keys:
+        return 0
+    deleted, _ = PrecomputedRecommendation.objects.filter(scope='post', key__in=keys).delete()
+    return deleted
+
+
+def invalidate_posts(post_ids):
+    """Gỡ bài hết hạn / đã cho thuê khỏi mọi danh sách tính sẵn.
+
+    Xóa danh sách "tương tự" của chính các bài đó và bỏ ID khỏi danh sách khác — quét
+    toàn bảng nên chỉ chạy ở job nền / command / action admin, không chạy mỗi lần lưu tin
+    (lookup() vốn đã lọc bài không còn hiển thị).
+    Returns: số dòng bị sửa/xóa.
+    """
+    from goiy_ai.models import PrecomputedRecommendation
+
+    dead = {int(pid) for pid in post_ids if pid}
+    if not dead:
+        return 0
+    deleted = drop_similar(dead)
+
+    changed = []
+    rows = (PrecomputedRecommendation.objects
+            .filter(expires_at__gt=timezone.now())
+            .only('id', 'post_ids'))
+    for row in rows.iterator(chunk_size=1000):
+        if dead.intersection(row.post_ids):
+            row.post_ids = [pid for pid in row.post_ids if pid not in dead]
+            changed.append(row)
+    if changed:
+        PrecomputedRecommendation.objects.bulk_update(changed, ['post_ids'], batch_size=500)
+    return deleted + len(changed)
+
+
+def purge_expired():
+    from goiy_ai.models import PrecomputedRecommendation
+
+    deleted, _ = PrecomputedRecommendation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,94 @@
+"""
+Registry dùng chung cho hệ thống gợi ý trong 1 process.
+
+- get_cf_model(): model ALS (cf_als_model.pkl) load 1 lần / process, giữ làm tham chiếu
+  chỉ-đọc cho mọi request. Mỗi lần gọi chỉ stat file (mtime/size); khi train_cf_model
+  publish artifact mới thì load bản mới rồi swap tham chiếu → request đang chạy vẫn dùng
+  trọn bản cũ, request sau dùng bản mới (không cần restart worker).
+- get_recommender(): 1 HybridRecommender duy nhất / process (thay vì tạo mới mỗi page view).
+- publish(): ghi artifact nguyên tử (file tạm + os.replace) để worker không bao giờ đọc
+  phải file pickle ghi dở.
+"""
+import os
+import threading
+
+from django.conf import settings
+
+_LOCK = threading.Lock()
+_RESIDENT = {}  # path → (stamp, ALSRecommender | None)
+_RECOMMENDER = None
+
+
+def default_model_path():
+    return getattr(settings, 'AI_CF_MODEL_PATH', None) or os.path.join(
+        settings.BASE_DIR, 'goiy_ai', 'ml_models', 'trained_models', 'cf_als_model.pkl'
+    )
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_cf_model(path=None):
+    """ALSRecommender thường trú của process (None nếu chưa có model / load lỗi)."""
+    src = os.path.abspath(path or default_model_path())
+    stamp = _file_stamp(src)
+    cached = _RESIDENT.get(src)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _LOCK:
+        cached = _RESIDENT.get(src)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        model = None
+        if stamp is None:
+            print(f"⚠️  Recommender: Không tìm thấy CF model tại {src} → chỉ dùng Content-based")
+        else:
+            try:
+                from goiy_ai.ml_models.cf_als import ALSRecommender
+                model = ALSRecommender(model_path=src)
+                print(f"✅ Recommender: Đã load CF model từ {src}")
+            except Exception as e:
+                print(f"⚠️  Recommender: Không load được CF model: {e}")
+                # Giữ bản đang chạy nếu file mới bị lỗi
+                if cached is not None and cached[1] is not None:
+                    model = cached[1]
+        _RESIDENT[src] = (stamp, model)
+        return model
+
+
+def get_recommender():
+    """HybridRecommender dùng chung cho cả process (CF model tự hot-swap bên trong)."""
+    global _RECOMMENDER
+    if _RECOMMENDER is None:
+        with _LOCK:
+            if _RECOMMENDER is None:
+                from goiy_ai.ml_models.hybrid import HybridRecommender
+                _RECOMMENDER = HybridRecommender()
+    return _RECOMMENDER
+
+
+def publish(cf_model, path=None):
+    """Lưu model vừa train và swap ngay trong process hiện tại.
+
+    Các process khác nhận bản mới ở request kế tiếp nhờ mtime/size của file đổi.
+    """
+    dest = os.path.abspath(path or default_model_path())
+    tmp = f"{dest}.tmp{os.getpid()}"
+    cf_model.save_model(tmp)
+    os.replace(tmp, dest)
+    with _LOCK:
+        _RESIDENT[dest] = (_file_stamp(dest), cf_model)
+    return dest
+
+
+def reset():
+    """Bỏ toàn bộ state thường trú (test / sau khi đổi settings)."""
+    global _RECOMMENDER
+    with _LOCK:
+        _RESIDENT.clear()
+        _RECOMMENDER = None
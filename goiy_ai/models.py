@@ -103,18 +103,19 @@ class UserInteraction(models.Model):
         return f"{user_str} - {self.get_interaction_type_display()} - {self.post.title[:30]}"
 
     # Trọng số cho từng loại tương tác (dùng cho tính toán điểm)
+    WEIGHT_MAP = {
+        'view': 1.0,
+        'save': 3.0,
+        'unsave': -2.0,
+        'contact': 5.0,
+        'request': 8.0,
+        'share': 4.0,
+    }
+
     @property
     def weight(self):
         """Trọng số của tương tác này"""
-        WEIGHT_MAP = {
-            'view': 1.0,
-            'save': 3.0,
-            'unsave': -2.0,
-            'contact': 5.0,
-            'request': 8.0,
-            'share': 4.0,
-        }
-        return WEIGHT_MAP.get(self.interaction_type, 1.0)
+        return self.WEIGHT_MAP.get(self.interaction_type, 1.0)
 
 
 class RecommendationLog(models.Model):
@@ -137,3 +138,30 @@ class RecommendationLog(models.Model):
     def __str__(self):
         user_str = self.user.username if self.user else self.session_id[:8]
         return f"Gợi ý cho {user_str} lúc {self.created_at.strftime('%d/%m %H:%M')}"
+
+
+class PrecomputedRecommendation(models.Model):
+    """Danh sách top-N gợi ý tính sẵn offline (precompute_recommendations).
+
+    Request chỉ tra 1 dòng theo (scope, key) rồi lọc bài còn hiển thị.
+    """
+    SCOPES = [
+        ('user', 'Người dùng'),
+        ('cohort', 'Nhóm phiên ẩn danh'),
+        ('post', 'Bài tương tự'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    key = models.CharField(max_length=64, help_text="user_id / mã cohort / post_id")
+    post_ids = models.JSONField(default=list, help_text="ID bài gợi ý theo thứ tự ưu tiên")
+    algorithm = models.CharField(max_length=50, blank=True)
+    computed_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('scope', 'key')
+        verbose_name = "Gợi ý tính sẵn"
+        verbose_name_plural = "Gợi ý tính sẵn"
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({len(self.post_ids)} bài)"
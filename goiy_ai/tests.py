@@ -0,0 +1,327 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from goiy_ai import tracking
+from goiy_ai.ml_models import feature_matrix, incremental, precomputed, registry
+from goiy_ai.ml_models.content_based import ContentBasedRecommender
+from goiy_ai.ml_models.cf_als import ALSRecommender
+from goiy_ai.models import PostView, PrecomputedRecommendation, UserInteraction
+from website.models import RentalPost, Province, District, Ward
+
+
+def _fake_model(version):
+    rec = ALSRecommender()
+    rec.model = {'version': version}
+    rec.user_mapping = {1: 0}
+    rec.item_mapping = {10: 0}
+    rec.reverse_item_mapping = {0: 10}
+    return rec
+
+
+class RecommenderRegistryTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cf_als_model.pkl')
+        registry.reset()
+
+    def tearDown(self):
+        registry.reset()
+        self.tmp.cleanup()
+
+    def test_loads_once_and_hot_swaps_on_publish(self):
+        self.assertIsNone(registry.get_cf_model(self.path))
+
+        registry.publish(_fake_model(1), self.path)
+        registry.reset()  # giả lập worker khác: chỉ thấy file
+        first = registry.get_cf_model(self.path)
+        self.assertEqual(first.model, {'version': 1})
+        self.assertIs(registry.get_cf_model(self.path), first)
+
+        # train_cf_model ở process khác ghi file mới → request sau dùng bản mới
+        other = _fake_model(2)
+        other.save_model(self.path)
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        second = registry.get_cf_model(self.path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.model, {'version': 2})
+        self.assertFalse([f for f in os.listdir(self.tmp.name) if '.tmp' in f])
+
+    def test_shared_recommender_uses_registry_model(self):
+        with override_settings(AI_CF_MODEL_PATH=self.path, AI_FORCE_CONTENT_ONLY=False):
+            registry.publish(_fake_model(3), self.path)
+            hybrid = registry.get_recommender()
+            self.assertIs(registry.get_recommender(), hybrid)
+            self.assertEqual(hybrid.cf_recommender.model, {'version': 3})
+            with override_settings(AI_FORCE_CONTENT_ONLY=True):
+                self.assertIsNone(hybrid.cf_recommender)
+
+
+class IncrementalFoldInTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="owner_cf")
+        prov = Province.objects.create(name="Hà Nội")
+        dist = District.objects.create(name="Cầu Giấy", province=prov)
+        ward = Ward.objects.create(name="Dịch Vọng", district=dist)
+        cls.posts = [
+            RentalPost.objects.create(
+                user=owner, title=f"Phòng {i}", description="desc", price=3 + i, area=20,
+                province=prov, district=dist, ward=ward, address="1 Xuân Thủy",
+                is_approved=True, is_deleted=False, category='phongtro',
+            )
+            for i in range(6)
+        ]
+        cls.users = [User.objects.create(username=f"cf_user_{i}") for i in range(4)]
+        for i, user in enumerate(cls.users):
+            for post in cls.posts[i:i + 3]:
+                UserInteraction.objects.create(user=user, post=post, interaction_type='view')
+                UserInteraction.objects.create(user=user, post=post, interaction_type='save')
+
+    def test_streaming_matrix_aggregates_duplicates_in_one_query(self):
+        UserInteraction.objects.create(user=self.users[0], post=self.posts[0], interaction_type='unsave')
+        cf = ALSRecommender()
+        with self.assertNumQueries(1):
+            matrix = cf.build_interaction_matrix(days=1, chunk_size=3)
+
+        self.assertEqual(matrix.shape, (4, 6))
+        self.assertEqual(list(cf.item_mapping), sorted(p.id for p in self.posts))
+        self.assertEqual(list(cf.user_mapping), [u.id for u in self.users])
+        self.assertTrue(matrix.has_sorted_indices)
+        dense = matrix.toarray()
+        for i, user in enumerate(self.users):
+            for post in self.posts:
+                expected = 4.0 if post in self.posts[i:i + 3] else 0.0  # view + save
+                self.assertEqual(dense[cf.user_mapping[user.id], cf.item_mapping[post.id]], expected)
+
+        UserInteraction.objects.all().delete()
+        self.assertEqual(ALSRecommender().build_interaction_matrix(days=1).shape, (0, 0))
+
+    def test_serving_never_trains_and_folds_in_new_users_in_background(self):
+        cf = ALSRecommender()
+        cf.build_interaction_matrix(days=1)
+        cf.train(factors=4, iterations=3)
+        trained_factors = cf.model.user_factors.copy()
+
+        newbie = User.objects.create(username="cf_newbie")
+        UserInteraction.objects.create(user=newbie, post=self.posts[0], interaction_type='contact')
+        UserInteraction.objects.create(user=newbie, post=self.posts[1], interaction_type='save')
+
+        with mock.patch.object(incremental, '_ensure_worker'), \
+                mock.patch.object(cf, 'train', side_effect=AssertionError("train in request")):
+            # User mới: không train, trả [] để Hybrid fallback và lên lịch fold-in
+            self.assertEqual(cf.serve_recommendations(user=newbie, limit=3), [])
+            self.assertIn(newbie.id, incremental._PENDING)
+
+            self.assertEqual(incremental.flush_pending(cf), 1)
+            recs = cf.serve_recommendations(user=newbie, limit=3)
+
+        self.assertTrue(recs)
+        self.assertFalse({self.posts[0].id, self.posts[1].id} & {p.id for p in recs})
+
+        # User đã train + 1 tương tác mới: fold-in giữ lịch sử train, item cũ vẫn bị lọc
+        trained = self.users[0]
+        UserInteraction.objects.create(user=trained, post=self.posts[4], interaction_type='view')
+        with mock.patch.object(cf.model, 'recalculate_user', wraps=cf.model.recalculate_user) as solve:
+            incremental.fold_in(cf, [trained.id])
+        # Tương tác trước lúc build ma trận chỉ được tính 1 lần (view + save = 4)
+        row = solve.call_args[0][1][0]
+        confidence = dict(zip(row.indices.tolist(), row.data.tolist()))
+        self.assertEqual(confidence[cf.item_mapping[self.posts[0].id]], 1.0 + cf.alpha * 4)
+        self.assertEqual(confidence[cf.item_mapping[self.posts[4].id]], 1.0 + cf.alpha * 1)
+        _, _, liked = cf._user_vectors([trained.id])
+        self.assertEqual(
+            set(liked[0].tolist()),
+            {cf.item_mapping[p.id] for p in self.posts[0:3] + [self.posts[4]]},
+        )
+        self.assertFalse({p.id for p in self.posts[0:3] + [self.posts[4]]}
+                         & set(cf.batch_recommend([trained.id], k=3)[trained.id]))
+
+        # Batch: cùng kết quả với từng user, bỏ item đã tương tác và bài không còn hiển thị
+        users = [u.id for u in self.users] + [newbie.id]
+        batch = cf.batch_recommend(users, k=3, chunk_size=2)
+        self.assertEqual(batch[newbie.id], [p.id for p in recs])
+        for user in self.users:
+            interacted = set(UserInteraction.objects.filter(user=user).values_list('post_id', flat=True))
+            self.assertFalse(interacted & set(batch[user.id]))
+            self.assertEqual(cf.batch_recommend([user.id], k=3)[user.id], batch[user.id])
+
+        rented = self.posts[5]
+        RentalPost.objects.filter(id=rented.id).update(is_rented=True)
+        cf._live_mask = None
+        self.assertFalse(any(rented.id in ids for ids in cf.batch_recommend(users, k=6).values()))
+        # Model dùng chung không bị sửa
+        self.assertEqual(cf.model.user_factors.shape, trained_factors.shape)
+        self.assertTrue((cf.model.user_factors == trained_factors).all())
+
+
+class PrecomputedRecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner_pre")
+        prov = Province.objects.create(name="Đà Nẵng")
+        dist = District.objects.create(name="Hải Châu", province=prov)
+        ward = Ward.objects.create(name="Thạch Thang", district=dist)
+        cls.posts = [
+            RentalPost.objects.create(
+                user=cls.owner, title=f"Phòng Đà Nẵng {i}", description="desc", price=2 + i, area=18 + i,
+                province=prov, district=dist, ward=ward, address="2 Bạch Đằng",
+                is_approved=True, is_deleted=False, category='phongtro',
+            )
+            for i in range(5)
+        ]
+        for post in cls.posts[:2]:
+            UserInteraction.objects.create(session_id='anon-1', post=post, interaction_type='view')
+
+    def setUp(self):
+        feature_matrix.invalidate()
+
+    def test_batch_job_fills_table_and_serving_filters_liveness(self):
+        call_command('precompute_recommendations', stdout=open(os.devnull, 'w'))
+
+        target = self.posts[0]
+        similar = PrecomputedRecommendation.objects.get(scope='post', key=str(target.id))
+        self.assertEqual(sorted(similar.post_ids), sorted(p.id for p in self.posts[1:]))
+        cohort = precomputed.cohort_for_session('anon-1')
+        self.assertTrue(PrecomputedRecommendation.objects.filter(scope='cohort', key=cohort).exists())
+
+        # Hit: 1 dòng + 1 query lọc bài còn hiển thị
+        with self.assertNumQueries(2):
+            posts, algorithm = precomputed.recommend(post_id=target.id, limit=3)
+        self.assertEqual(algorithm, 'precomputed_post')
+        self.assertEqual([p.id for p in posts], similar.post_ids[:3])
+
+        # Bài đã cho thuê bị lọc ngay cả trước khi invalidate, rồi bị gỡ khỏi mọi danh sách
+        rented = RentalPost.objects.get(id=similar.post_ids[0])
+        RentalPost.objects.filter(id=rented.id).update(is_rented=True)
+        posts, _ = precomputed.recommend(post_id=target.id, limit=10)
+        self.assertNotIn(rented.id, [p.id for p in posts])
+
+        self.assertGreaterEqual(precomputed.invalidate_posts([rented.id]), 1)
+        for row in PrecomputedRecommendation.objects.all():
+            self.assertNotIn(rented.id, row.post_ids)
+        self.assertFalse(PrecomputedRecommendation.objects.filter(scope='post', key=str(rented.id)).exists())
+
+    def test_miss_is_computed_once_and_written_through(self):
+        posts, algorithm = precomputed.recommend(session_id='anon-1', limit=3)
+        self.assertEqual(algorithm, 'live_cohort')
+        self.assertTrue(posts)
+        posts_again, algorithm = precomputed.recommend(session_id='anon-1', limit=3)
+        self.assertEqual(algorithm, 'precomputed_cohort')
+        self.assertEqual([p.id for p in posts_again], [p.id for p in posts])
+
+
+class TrackingBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="owner_track")
+        prov = Province.objects.create(name="Huế")
+        cls.post = RentalPost.objects.create(
+            user=owner, title="Phòng track", description="desc", price=2, area=18,
+            province=prov, address="1 Lê Lợi", is_approved=True, category='phongtro',
+        )
+        cls.viewer = User.objects.create(username="viewer_track")
+
+    def setUp(self):
+        tracking.flush()
+        patcher = mock.patch.object(tracking, '_ensure_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_events_are_buffered_and_bulk_inserted(self):
+        before = tracking.stats()
+        self.client.force_login(self.viewer)
+        with self.assertNumQueries(0):
+            tracking.track_interaction(mock.Mock(user=self.viewer, META={}, session=mock.Mock(session_key='s1')),
+                                       self.post.id, 'contact')
+        self.client.post(f'/goiy-ai/track/view/{self.post.id}/', data='{"duration": 12}',
+                         content_type='application/json')
+        self.client.post(f'/goiy-ai/track/save/{self.post.id}/')
+        self.client.post('/goiy-ai/track/save/999999/')
+        self.assertFalse(UserInteraction.objects.exists())
+        self.assertEqual(tracking.stats()['buffered'], 5)
+
+        # 1 SELECT lọc bài tồn tại + 1 INSERT mỗi model
+        with self.assertNumQueries(3):
+            self.assertEqual(tracking.flush(), 4)
+        self.assertEqual(PostView.objects.get().duration, 12)
+        self.assertEqual(sorted(UserInteraction.objects.values_list('interaction_type', flat=True)),
+                         ['contact', 'save', 'view'])
+        self.assertEqual(set(UserInteraction.objects.values_list('user_id', flat=True)), {self.viewer.id})
+        after = tracking.stats()
+        self.assertEqual(after['flushed'] - before['flushed'], 4)
+        self.assertEqual(after['dropped'] - before['dropped'], 1)
+        self.assertEqual(after['buffered'], 0)
+
+    @override_settings(AI_TRACKING_BUFFER_SIZE=2)
+    def test_full_buffer_drops_oldest_events(self):
+        before = tracking.stats()['dropped']
+        for itype in ('view', 'save', 'contact'):
+            tracking.enqueue(tracking.INTERACTION, {'post_id': self.post.id, 'interaction_type': itype})
+        self.assertEqual(tracking.stats()['dropped'] - before, 1)
+        tracking.flush()
+        self.assertEqual(sorted(UserInteraction.objects.values_list('interaction_type', flat=True)),
+                         ['contact', 'save'])
+
+
+class FeatureMatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username="owner_fm")
+        cls.provs = [Province.objects.create(name=n) for n in ("Huế", "Cần Thơ")]
+        cls.dists = [District.objects.create(name=f"Quận {i}", province=cls.provs[i % 2]) for i in range(3)]
+        features = ['co_may_lanh', 'co_gac', 'co_tu_lanh', 'co_may_giat']
+        cls.posts = []
+        for i in range(24):
+            dist = cls.dists[i % 3]
+            cls.posts.append(RentalPost.objects.create(
+                user=owner, title=f"Phòng {i}", description="desc",
+                price=[2000000, 2400000, 2600000, 3000000, 0][i % 5], area=15 + (i % 7) * 3,
+                province=dist.province, district=dist, address="3 Lê Lợi",
+                category=['phongtro', 'canho', 'canho_mini'][i % 3],
+                features=features[:i % 5], is_approved=True, is_deleted=False,
+            ))
+
+    def setUp(self):
+        feature_matrix.invalidate()
+
+    def test_vectorized_scores_match_pairwise(self):
+        content = ContentBasedRecommender()
+        matrix = feature_matrix.get_matrix()
+        self.assertEqual(len(matrix), len(self.posts))
+        for target in self.posts[:6]:
+            rows = matrix.rows_for([p.id for p in self.posts])
+            scores = matrix.similarity_scores(matrix.target_vector(target), rows)
+            by_id = dict(zip(matrix.ids[rows].tolist(), scores.tolist()))
+            for post in self.posts:
+                self.assertAlmostEqual(by_id[post.id], content._calculate_similarity(target, post), places=6)
+
+    def test_similar_posts_match_pairwise_and_refresh_incrementally(self):
+        content = ContentBasedRecommender()
+        active = content._get_active_posts()
+        target = self.posts[1]
+
+        fast = content._recommend_similar_posts(target, active, 8)
+        slow = content._recommend_similar_posts_pairwise(target, active, 8)
+        self.assertEqual(len(fast), 8)
+        # Hai bài cùng địa điểm đứng đầu, phần còn lại cùng tập điểm với bản từng cặp
+        self.assertTrue(all(p.province_id == target.province_id for p in fast[:2]))
+        score = lambda p: content._calculate_similarity(target, p)
+        self.assertEqual(sorted(map(score, fast[2:]), reverse=True), [score(p) for p in fast[2:]])
+        self.assertEqual(sorted(map(score, fast[2:])), sorted(map(score, slow[2:])))
+
+        # Bài bị cho thuê → lần làm mới kế tiếp gỡ đúng hàng đó, không dựng lại cả ma trận
+        rented = fast[0]
+        rented.is_rented = True
+        rented.save()
+        built_at = feature_matrix.get_matrix().built_at
+        feature_matrix.invalidate(rented.id)
+        matrix = feature_matrix.get_matrix()
+        self.assertEqual(matrix.built_at, built_at)
+        self.assertNotIn(rented.id, matrix.row_of)
+        self.assertNotIn(rented, content._recommend_similar_posts(target, content._get_active_posts(), 8))
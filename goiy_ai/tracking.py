@@ -0,0 +1,175 @@
+"""
+Ghi tracking (PostView / UserInteraction) theo lô thay vì INSERT trong request.
+
+Request chỉ gọi track_view() / track_interaction(): event (dict các cột) được đẩy vào
+ring buffer trong process rồi trả về ngay. Thread nền flush bằng bulk_create mỗi khi
+buffer đủ AI_TRACKING_BATCH_SIZE event hoặc sau AI_TRACKING_FLUSH_MS mili-giây.
+
+- Buffer đầy (DB chậm / sự cố) → bỏ event CŨ nhất và tăng bộ đếm `dropped`, request
+  không bao giờ bị chặn vì tracking.
+- Request không cần RentalPost.objects.get nữa: bài không tồn tại được lọc lúc flush
+  bằng 1 query cho cả lô (tính vào `dropped`).
+- created_at / viewed_at (auto_now_add) là thời điểm flush, trễ tối đa ~AI_TRACKING_FLUSH_MS.
+- stats() trả về các bộ đếm buffered / flushed / dropped / failed (xem trang admin / log).
+
+Settings:
+    AI_TRACKING_BUFFERED      False → INSERT trực tiếp như cũ (mặc định True)
+    AI_TRACKING_BATCH_SIZE    số event mỗi lần bulk_create (mặc định 200)
+    AI_TRACKING_FLUSH_MS      chu kỳ flush tối đa (mặc định 1000)
+    AI_TRACKING_BUFFER_SIZE   sức chứa ring buffer (mặc định 20000)
+"""
+import atexit
+import threading
+from collections import deque
+
+from django.conf import settings
+
+_LOCK = threading.Lock()
+_BUFFER = deque()
+_WAKE = threading.Event()
+_WORKER = None
+_STATS = {'flushed': 0, 'dropped': 0, 'failed': 0}
+
+VIEW = 'view'
+INTERACTION = 'interaction'
+
+
+def client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0]
+    return request.META.get('REMOTE_ADDR')
+
+
+def _request_fields(request):
+    user = getattr(request, 'user', None)
+    return {
+        'user_id': user.id if user is not None and user.is_authenticated else None,
+        'session_id': request.session.session_key or '',
+        'ip_address': client_ip(request),
+    }
+
+
+def track_view(request, post_id, duration=0):
+    """PostView cho 1 lượt xem chi tiết."""
+    fields = _request_fields(request)
+    fields.update(post_id=post_id, duration=duration)
+    return enqueue(VIEW, fields)
+
+
+def track_interaction(request, post_id, interaction_type, user_agent=True):
+    """UserInteraction (view/save/unsave/contact/request/share)."""
+    fields = _request_fields(request)
+    fields.update(post_id=post_id, interaction_type=interaction_type)
+    if user_agent:
+        fields['user_agent'] = request.META.get('HTTP_USER_AGENT', '')[:500]
+    return enqueue(INTERACTION, fields)
+
+
+def enqueue(kind, fields):
+    """Đưa 1 event vào buffer (hoặc INSERT ngay nếu tắt AI_TRACKING_BUFFERED)."""
+    if not getattr(settings, 'AI_TRACKING_BUFFERED', True):
+        try:
+            _model(kind).objects.create(**fields)
+        except Exception as e:
+            print(f"⚠️  Tracking: không ghi được {kind}: {e}")
+            return False
+        return True
+
+    capacity = getattr(settings, 'AI_TRACKING_BUFFER_SIZE', 20000)
+    with _LOCK:
+        while len(_BUFFER) >= capacity:
+            _BUFFER.popleft()
+            _STATS['dropped'] += 1
+        _BUFFER.append((kind, fields))
+        full = len(_BUFFER) >= getattr(settings, 'AI_TRACKING_BATCH_SIZE', 200)
+    _ensure_worker()
+    if full:
+        _WAKE.set()
+    return True
+
+
+def stats():
+    with _LOCK:
+        return dict(_STATS, buffered=len(_BUFFER))
+
+
+def _model(kind):
+    from goiy_ai.models import PostView, UserInteraction
+    return PostView if kind == VIEW else UserInteraction
+
+
+def _ensure_worker():
+    global _WORKER
+    if _WORKER is not None and _WORKER.is_alive():
+        return
+    with _LOCK:
+        if _WORKER is not None and _WORKER.is_alive():
+            return
+        _WORKER = threading.Thread(target=_worker_loop, name='tracking-flush', daemon=True)
+        _WORKER.start()
+
+
+def _worker_loop():
+    from django.db import close_old_connections
+
+    while True:
+        _WAKE.wait(getattr(settings, 'AI_TRACKING_FLUSH_MS', 1000) / 1000.0)
+        _WAKE.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"⚠️  Tracking flush lỗi: {e}")
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Ghi toàn bộ event đang chờ bằng bulk_create (worker nền / test / lúc tắt process).
+
+    Returns: số dòng đã ghi.
+    """
+    from website.models import RentalPost
+
+    batch_size = getattr(settings, 'AI_TRACKING_BATCH_SIZE', 200)
+    written = 0
+    while True:
+        with _LOCK:
+            if not _BUFFER:
+                return written
+            n = min(len(_BUFFER), batch_size)
+            events = [_BUFFER.popleft() for _ in range(n)]
+
+        post_ids = {fields['post_id'] for _, fields in events}
+        existing = set(RentalPost.objects.filter(id__in=post_ids).values_list('id', flat=True))
+        by_kind = {}
+        dropped = 0
+        for kind, fields in events:
+            if fields['post_id'] in existing:
+                by_kind.setdefault(kind, []).append(_model(kind)(**fields))
+            else:
+                dropped += 1
+
+        flushed = failed = 0
+        for kind, objs in by_kind.items():
+            try:
+                _model(kind).objects.bulk_create(objs, batch_size=batch_size)
+                flushed += len(objs)
+            except Exception as e:
+                failed += len(objs)
+                print(f"⚠️  Tracking: bulk_create {kind} lỗi ({len(objs)} event): {e}")
+        with _LOCK:
+            _STATS['flushed'] += flushed
+            _STATS['dropped'] += dropped
+            _STATS['failed'] += failed
+        written += flushed
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -9,13 +9,12 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from datetime import timedelta
 
+from . import tracking
 from .models import PostView, SearchHistory, UserInteraction, RecommendationLog
-from .ml_models.hybrid import HybridRecommender
-from website.models import RentalPost
+from .ml_models import precomputed
 
 
-# Khởi tạo recommender
-recommender = HybridRecommender()
+# Gợi ý phục vụ từ bảng tính sẵn (ml_models/precomputed.py), miss mới gọi Hybrid dùng chung
 
 
 def get_recommendations_view(request):
@@ -24,11 +23,9 @@ def get_recommendations_view(request):
 
     Query params:
     - limit: số lượng gợi ý (default: 10)
-    - strategy: 'weighted', 'switching', 'mixed' (default: 'weighted')
     - post_id: ID bài để tìm similar (optional)
     """
     limit = int(request.GET.get('limit', 10))
-    strategy = request.GET.get('strategy', 'weighted')
     post_id = request.GET.get('post_id', None)
 
     user = request.user if request.user.is_authenticated else None
@@ -39,23 +36,13 @@ def get_recommendations_view(request):
         request.session.create()
         session_id = request.session.session_key
 
-    context = {
-        'session_id': session_id,
-    }
-
-    # Lấy recommendations
-    if post_id:
-        recommended_posts = recommender.get_similar_posts(post_id=post_id, limit=limit)
-        algorithm = 'similar_posts'
-    else:
-        recommended_posts = recommender.get_recommendations(
-            user=user,
-            post_id=None,
-            limit=limit,
-            context=context,
-            strategy=strategy
-        )
-        algorithm = f'hybrid_{strategy}'
+    # Lấy recommendations: tra danh sách tính sẵn + lọc bài còn hiển thị
+    recommended_posts, algorithm = precomputed.recommend(
+        user=user,
+        session_id=session_id,
+        post_id=post_id,
+        limit=limit
+    )
 
     # Log recommendation
     _log_recommendation(user, session_id, recommended_posts, algorithm)
@@ -90,24 +77,11 @@ def track_view(request, post_id):
 
     POST /goiy-ai/track/view/<post_id>/
     Body: { "duration": 30 }  # Thời gian xem (giây)
+
+    Event vào buffer của goiy_ai.tracking (bulk_create nền), không INSERT trong request.
     """
     import json
 
-    try:
-        post = RentalPost.objects.get(id=post_id)
-    except RentalPost.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Post not found'}, status=404)
-
-    user = request.user if request.user.is_authenticated else None
-    session_id = request.session.session_key or ''
-
-    # Lấy IP address
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip_address = x_forwarded_for.split(',')[0]
-    else:
-        ip_address = request.META.get('REMOTE_ADDR')
-
     # Lấy duration từ request body
     duration = 0
     if request.method == 'POST' and request.body:
@@ -117,24 +91,8 @@ def track_view(request, post_id):
         except:
             pass
 
-    # Tạo PostView record
-    PostView.objects.create(
-        user=user,
-        post=post,
-        session_id=session_id,
-        ip_address=ip_address,
-        duration=duration
-    )
-
-    # Tạo UserInteraction
-    UserInteraction.objects.create(
-        user=user,
-        post=post,
-        session_id=session_id,
-        interaction_type='view',
-        ip_address=ip_address,
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
+    tracking.track_view(request, post_id, duration=duration)
+    tracking.track_interaction(request, post_id, 'view')
 
     return JsonResponse({'success': True})
 
@@ -145,114 +103,25 @@ def track_save(request, post_id):
 
     POST /goiy-ai/track/save/<post_id>/
     """
-    try:
-        post = RentalPost.objects.get(id=post_id)
-    except RentalPost.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Post not found'}, status=404)
-
-    user = request.user if request.user.is_authenticated else None
-    session_id = request.session.session_key or ''
-
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip_address = x_forwarded_for.split(',')[0]
-    else:
-        ip_address = request.META.get('REMOTE_ADDR')
-
-    # Tạo UserInteraction
-    UserInteraction.objects.create(
-        user=user,
-        post=post,
-        session_id=session_id,
-        interaction_type='save',
-        ip_address=ip_address,
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
-
+    tracking.track_interaction(request, post_id, 'save')
     return JsonResponse({'success': True})
 
 
 def track_unsave(request, post_id):
     """Track khi user bỏ lưu tin"""
-    try:
-        post = RentalPost.objects.get(id=post_id)
-    except RentalPost.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Post not found'}, status=404)
-
-    user = request.user if request.user.is_authenticated else None
-    session_id = request.session.session_key or ''
-
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip_address = x_forwarded_for.split(',')[0]
-    else:
-        ip_address = request.META.get('REMOTE_ADDR')
-
-    UserInteraction.objects.create(
-        user=user,
-        post=post,
-        session_id=session_id,
-        interaction_type='unsave',
-        ip_address=ip_address,
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
-
+    tracking.track_interaction(request, post_id, 'unsave')
     return JsonResponse({'success': True})
 
 
 def track_contact(request, post_id):
     """Track khi user liên hệ/chat"""
-    try:
-        post = RentalPost.objects.get(id=post_id)
-    except RentalPost.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Post not found'}, status=404)
-
-    user = request.user if request.user.is_authenticated else None
-    session_id = request.session.session_key or ''
-
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip_address = x_forwarded_for.split(',')[0]
-    else:
-        ip_address = request.META.get('REMOTE_ADDR')
-
-    UserInteraction.objects.create(
-        user=user,
-        post=post,
-        session_id=session_id,
-        interaction_type='contact',
-        ip_address=ip_address,
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
-
+    tracking.track_interaction(request, post_id, 'contact')
     return JsonResponse({'success': True})
 
 
 def track_request(request, post_id):
     """Track khi user gửi yêu cầu thuê"""
-    try:
-        post = RentalPost.objects.get(id=post_id)
-    except RentalPost.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Post not found'}, status=404)
-
-    user = request.user if request.user.is_authenticated else None
-    session_id = request.session.session_key or ''
-
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip_address = x_forwarded_for.split(',')[0]
-    else:
-        ip_address = request.META.get('REMOTE_ADDR')
-
-    UserInteraction.objects.create(
-        user=user,
-        post=post,
-        session_id=session_id,
-        interaction_type='request',
-        ip_address=ip_address,
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
-
+    tracking.track_interaction(request, post_id, 'request')
     return JsonResponse({'success': True})
 
 
@@ -329,8 +198,9 @@ def my_recommendations_page(request):
     Trang hiển thị gợi ý cá nhân hóa cho user
     """
     # Lấy gợi ý
-    recommended_posts = recommender.get_personalized_recommendations(
+    recommended_posts, _ = precomputed.recommend(
         user=request.user,
+        session_id=request.session.session_key,
         limit=20
     )
 
@@ -69,7 +69,11 @@ class RentalPostAdmin(admin.ModelAdmin):
     unapprove_posts.short_description = "Bỏ duyệt các tin đã chọn"
 
     def mark_rented(self, request, queryset):
+        post_ids = list(queryset.values_list('id', flat=True))
         updated = queryset.update(is_rented=True)
+        # update() không bắn signal → tự gỡ khỏi danh sách gợi ý tính sẵn
+        from goiy_ai.ml_models.precomputed import invalidate_posts
+        invalidate_posts(post_ids)
         self.message_user(request, f"Đã đánh dấu đã cho thuê {updated} tin")
     mark_rented.short_description = "Đánh dấu đã cho thuê"
 
@@ -152,6 +156,11 @@ class ChatThreadAdmin(admin.ModelAdmin):
 
     actions = ("activate_threads", "deactivate_threads",)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline sửa is_read / is_deleted → tính lại bộ đếm chưa đọc + tin mới nhất
+        ChatThread.recount([form.instance.pk])
+
     def activate_threads(self, request, queryset):
         updated = queryset.update(is_active=True)
         self.message_user(request, f"Đã kích hoạt {updated} cuộc trò chuyện")
@@ -185,13 +194,30 @@ class ChatMessageAdmin(admin.ModelAdmin):
         return (text[:80] + "...") if len(text) > 80 else text
     short_content.short_description = "Nội dung"
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        ChatThread.recount({obj.thread_id} | ({form.initial['thread']} if form.initial.get('thread') else set()))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ChatThread.recount([obj.thread_id])
+
+    def delete_queryset(self, request, queryset):
+        thread_ids = set(queryset.values_list('thread_id', flat=True))
+        super().delete_queryset(request, queryset)
+        ChatThread.recount(thread_ids)
+
     def soft_delete_messages(self, request, queryset):
+        thread_ids = set(queryset.values_list('thread_id', flat=True))
         updated = queryset.update(is_deleted=True, deleted_at=timezone.now())
+        ChatThread.recount(thread_ids)
         self.message_user(request, f"Đã thu hồi {updated} tin nhắn")
     soft_delete_messages.short_description = "Thu hồi tin nhắn (đặt is_deleted)"
 
     def restore_messages(self, request, queryset):
+        thread_ids = set(queryset.values_list('thread_id', flat=True))
         updated = queryset.update(is_deleted=False, deleted_at=None)
+        ChatThread.recount(thread_ids)
         self.message_user(request, f"Đã khôi phục {updated} tin nhắn")
     restore_messages.short_description = "Khôi phục tin nhắn"
 
@@ -0,0 +1,157 @@
+"""
+Batch loader cho huy hiệu chủ tin trong template (vip_tags / review_tags).
+
+Trước đây mỗi card bài đăng gọi vip_style_color + vip_star_count → 3-4 query / card
+(VIPSubscription, VIPPackageConfig), trang chi tiết thêm 2 aggregate LandlordReview.
+
+BadgeLoader gắn vào request (1 instance / request):
+- Lần đầu tag hỏi tới 1 user chưa có, loader quét context template để gom chủ tin của
+  mọi RentalPost đã load sẵn (list, Page, QuerySet đã evaluate — không ép query mới)
+  rồi tải VIP đang hoạt động / điểm đánh giá cho cả lô bằng 1 query mỗi loại.
+- Cấu hình gói VIP lấy từ registry thường trú (website/vip_configs.py).
+- prime(users) cho view muốn chủ động nạp trước.
+"""
+from django.core.paginator import Page
+from django.db.models import Avg, Count, QuerySet
+from django.utils import timezone
+
+# Fallback khi gói không có cấu hình: vip1 -> 5, vip2 -> 4, vip3 -> 3
+STAR_FALLBACK = {"vip1": 5, "vip2": 4, "vip3": 3}
+
+
+def _user_id(user):
+    if isinstance(user, int):
+        return user
+    return getattr(user, 'id', None)
+
+
+def _post_owner_ids(value, depth=0):
+    from website.models import RentalPost
+
+    if isinstance(value, RentalPost):
+        return {value.user_id}
+    if depth > 1:
+        return set()
+    if isinstance(value, Page):
+        return _post_owner_ids(value.object_list, depth + 1)
+    if isinstance(value, QuerySet):
+        if value.model is not RentalPost or value._result_cache is None:
+            return set()
+        value = value._result_cache
+    if isinstance(value, (list, tuple)):
+        ids = set()
+        for item in value:
+            if isinstance(item, RentalPost):
+                ids.add(item.user_id)
+            else:
+                # SavedPost... chỉ đọc bài đã load sẵn (select_related), không truy cập FK
+                post = getattr(getattr(item, '_state', None), 'fields_cache', {}).get('post')
+                if isinstance(post, RentalPost):
+                    ids.add(post.user_id)
+        return ids
+    return set()
+
+
+class BadgeLoader:
+    def __init__(self):
+        self._vip = {}       # user_id → VIPSubscription | None
+        self._ratings = {}   # user_id → (avg, count)
+        self._configs = None
+        self._pending = set()
+
+    def prime(self, users):
+        self._pending.update(uid for uid in map(_user_id, users) if uid)
+
+    def prime_from_context(self, context):
+        if context is None:
+            return
+        try:
+            for value in context.flatten().values():
+                self._pending.update(_post_owner_ids(value))
+        except Exception:
+            pass
+
+    # ----- VIP -----
+
+    def configs(self):
+        """plan → VIPPackageConfig đang kích hoạt (registry thường trú của process)."""
+        if self._configs is None:
+            from website import vip_configs
+            self._configs = vip_configs.active_configs()
+        return self._configs
+
+    def vip(self, user_id, context=None):
+        """Gói VIP còn hạn lâu nhất của user (None nếu không có)."""
+        if not user_id:
+            return None
+        if user_id not in self._vip:
+            self.prime_from_context(context)
+            self._load_vip(self._pending - self._vip.keys() | {user_id})
+        return self._vip[user_id]
+
+    def _load_vip(self, user_ids):
+        from website.models import VIPSubscription
+
+        rows = (VIPSubscription.objects
+                .filter(user_id__in=user_ids, expires_at__gte=timezone.now())
+                .order_by('user_id', '-expires_at'))
+        for uid in user_ids:
+            self._vip[uid] = None
+        for vip in rows:
+            if self._vip[vip.user_id] is None:
+                self._vip[vip.user_id] = vip
+
+    def color(self, user_id, context=None):
+        vip = self.vip(user_id, context)
+        if not vip:
+            return ''
+        cfg = self.configs().get(vip.plan)
+        return cfg.title_color if cfg else vip.COLOR_MAP.get(vip.plan, '')
+
+    def stars(self, user_id, context=None):
+        vip = self.vip(user_id, context)
+        if not vip:
+            return 0
+        cfg = self.configs().get(vip.plan)
+        if cfg and cfg.stars:
+            return int(max(0, min(5, cfg.stars)))
+        return STAR_FALLBACK.get(vip.plan, 0)
+
+    # ----- Đánh giá chủ trọ -----
+
+    def rating(self, user_id, context=None):
+        """(điểm trung bình làm tròn 1 chữ số, số đánh giá đã duyệt)."""
+        if not user_id:
+            return (0, 0)
+        if user_id not in self._ratings:
+            self.prime_from_context(context)
+            self._load_ratings(self._pending - self._ratings.keys() | {user_id})
+        return self._ratings[user_id]
+
+    def _load_ratings(self, user_ids):
+        from website.models import LandlordReview
+
+        for uid in user_ids:
+            self._ratings[uid] = (0.0, 0)
+        rows = (LandlordReview.objects
+                .filter(landlord_id__in=user_ids, is_approved=True)
+                .values('landlord_id')
+                .annotate(avg=Avg('rating'), n=Count('id')))
+        for row in rows:
+            self._ratings[row['landlord_id']] = (round(float(row['avg'] or 0), 1), row['n'])
+
+
+def for_context(context):
+    """BadgeLoader của request đang render (không có request → theo lần render template)."""
+    request = context.get('request') if context is not None else None
+    if request is None:
+        if context is None:
+            return BadgeLoader()
+        loader = context.render_context.get('_badge_loader')
+        if loader is None:
+            loader = context.render_context['_badge_loader'] = BadgeLoader()
+        return loader
+    loader = getattr(request, '_badge_loader', None)
+    if loader is None:
+        loader = request._badge_loader = BadgeLoader()
+    return loader
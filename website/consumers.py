@@ -1,7 +1,7 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import RentalPost, ChatThread, ChatMessage
+from .models import RentalPost, ChatThread
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -83,10 +83,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
        if changed_fields:
            thread.save(update_fields=changed_fields)
 
-       ChatMessage.objects.create(
-           thread=thread,
-           sender=user,
-           content=content
-       )
+       thread.add_message(user, content=content)
        return thread
 
@@ -0,0 +1,123 @@
+"""
+Số liệu cho dashboard admin (admin_dashboard_stats / ai_moderation_alerts).
+
+Hai context processor này đăng ký toàn cục nên trước đây mọi trang đều chạy ~10 COUNT.
+Giờ:
+- Context processor chỉ trả về giá trị lazy (SimpleLazyObject): trang nào không dùng
+  biến {{ users_count }}, {{ ai_stats }}... thì không đụng tới cache lẫn DB.
+- Khi template admin dùng tới, số liệu đọc từ cache với key có version
+  (admin_stats:v<version>:...), miss mới tính lại bằng vài aggregate gộp.
+- Signal RentalPost / User gọi bump() → tăng version, lần đọc sau tính lại. Lượt truy cập
+  đổi liên tục nên chỉ dựa vào TTL (ADMIN_STATS_CACHE_SECONDS, mặc định 60).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+VERSION_KEY = 'admin_stats:version'
+
+DASHBOARD_KEYS = (
+    'users_count', 'logged_in_count', 'posts_count', 'posts_approved',
+    'visits_today', 'visits_week', 'unique_visitors_today',
+)
+MODERATION_KEYS = ('ai_flagged_posts', 'ai_stats')
+
+
+def version():
+    v = cache.get(VERSION_KEY)
+    if v is None:
+        # Khởi tạo theo thời gian để không trùng version của các key cũ còn sót
+        cache.add(VERSION_KEY, int(time.time()), None)
+        v = cache.get(VERSION_KEY) or 0
+    return v
+
+
+def bump():
+    """Đánh dấu số liệu đã cũ (gọi từ signal)."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time()), None)
+
+
+def _cached(name, compute):
+    key = f'admin_stats:v{version()}:{name}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, getattr(settings, 'ADMIN_STATS_CACHE_SECONDS', 60))
+    return value
+
+
+def _compute_dashboard():
+    from django.contrib.auth.models import User
+    from .models import RentalPost
+    from . import visits
+
+    stats = dict.fromkeys(DASHBOARD_KEYS, 0)
+    try:
+        last_day = timezone.now() - timezone.timedelta(days=1)
+        stats.update(User.objects.aggregate(
+            users_count=Count('id'),
+            logged_in_count=Count('id', filter=Q(last_login__gte=last_day)),
+        ))
+    except Exception:
+        pass
+
+    try:
+        stats.update(RentalPost.objects.aggregate(
+            posts_count=Count('id'),
+            posts_approved=Count('id', filter=Q(is_approved=True)),
+        ))
+    except Exception:
+        pass
+
+    # Đọc rollup theo phút (website/visits.py) thay vì đếm từng dòng SiteVisit
+    try:
+        today = timezone.localdate()
+        stats['visits_today'] = visits.visits_between(today)
+        stats['visits_week'] = visits.visits_between(today - timezone.timedelta(days=6))
+        stats['unique_visitors_today'] = visits.unique_visitors_between(today)
+    except Exception:
+        pass
+    return stats
+
+
+def _compute_moderation():
+    from .models import RentalPost
+
+    try:
+        pending = RentalPost.objects.filter(ai_flagged=True, is_approved=False)
+        # Tin đã gắn cờ AI chưa duyệt
+        flagged_posts = list(pending.order_by('-ai_confidence', '-created_at')[:5])
+        # Thống kê AI
+        ai_stats = RentalPost.objects.aggregate(
+            total_flagged=Count('id', filter=Q(ai_flagged=True, is_approved=False)),
+            high_confidence_flagged=Count('id', filter=Q(ai_flagged=True, is_approved=False,
+                                                         ai_confidence__gte=0.8)),
+            pending_review=Count('id', filter=Q(is_approved=False)),
+        )
+        return {'ai_flagged_posts': flagged_posts, 'ai_stats': ai_stats}
+    except Exception:
+        return {
+            'ai_flagged_posts': [],
+            'ai_stats': {'total_flagged': 0, 'high_confidence_flagged': 0, 'pending_review': 0},
+        }
+
+
+def dashboard_stats():
+    return _cached('dashboard', _compute_dashboard)
+
+
+def moderation_alerts():
+    return _cached('ai_moderation', _compute_moderation)
+
+
+def lazy_context(loader, keys):
+    """{key: giá trị lazy}; loader chỉ chạy (1 lần / request) khi template đọc 1 biến."""
+    values = SimpleLazyObject(loader)
+    return {key: SimpleLazyObject(lambda key=key: values[key]) for key in keys}
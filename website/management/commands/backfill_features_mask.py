@@ -0,0 +1,36 @@
+"""
+Management command để tính lại RentalPost.features_mask từ cột features.
+Bài cũ đã được migration 0081 backfill; chỉ cần chạy sau khi sửa features bằng
+queryset.update() (bỏ qua save()) hoặc đổi thứ tự FEATURE_CHOICES.
+"""
+from django.core.management.base import BaseCommand
+
+from website.models import RentalPost, features_to_mask
+
+
+class Command(BaseCommand):
+    help = 'Đồng bộ bitmask tiện ích (features_mask) cho các bài đăng hiện có'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Số bài ghi mỗi lần (default: 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = RentalPost.objects.order_by('id').values_list('id', 'features', 'features_mask')
+
+        pending = []
+        checked = updated = 0
+        for post_id, features, current in rows.iterator(chunk_size=batch_size):
+            checked += 1
+            mask = features_to_mask(features)
+            if mask != current:
+                pending.append(RentalPost(id=post_id, features_mask=mask))
+            if len(pending) >= batch_size:
+                RentalPost.objects.bulk_update(pending, ['features_mask'])
+                updated += len(pending)
+                pending = []
+        if pending:
+            RentalPost.objects.bulk_update(pending, ['features_mask'])
+            updated += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Đã kiểm tra {checked} bài, cập nhật features_mask cho {updated} bài'))
@@ -1,7 +1,5 @@
 from django.core.management.base import BaseCommand
 import os
-import sys
-import importlib
 
 class Command(BaseCommand):
     help = "Build RAG index: TF-IDF + vector embeddings (if sentence-transformers installed)"
@@ -12,6 +10,24 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip vector embeddings (build only TF-IDF index)',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Số doc mỗi chunk khi encode/upsert embeddings (mặc định RAG_EMBED_CHUNK_SIZE=256)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Batch size gửi vào model (mặc định RAG_EMBED_BATCH_SIZE=64)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Số thread encode song song (mặc định RAG_EMBED_WORKERS=1)',
+        )
         parser.add_argument(
             '--no-reload',
             action='store_true',
@@ -34,7 +50,13 @@ class Command(BaseCommand):
         else:
             self.stdout.write("   - TF-IDF index only (--no-embeddings flag)")
 
-        idx = build_index(use_embeddings=use_embeddings)
+        # Tham số pipeline embeddings truyền thẳng vào build_index (None → RAG_EMBED_* trong settings)
+        idx = build_index(
+            use_embeddings=use_embeddings,
+            chunk_size=options.get('chunk_size'),
+            batch_size=options.get('batch_size'),
+            workers=options.get('workers'),
+        )
         n = idx.get('n_docs', 0)
 
         self.stdout.write(self.style.SUCCESS(
@@ -47,6 +69,13 @@ class Command(BaseCommand):
                 from chatbot.models import VectorDocument
                 vec_count = VectorDocument.objects.count()
                 self.stdout.write(f"   Vector docs: {vec_count} embeddings in DB")
+                stats = idx.get('embedding_stats')
+                if stats:
+                    self.stdout.write(
+                        f"   Embedding throughput: {stats['docs_per_sec']} docs/s "
+                        f"({stats['docs']} docs in {stats['seconds']}s, removed {stats['removed']} stale), "
+                        f"peak RSS: {stats['peak_rss_mb'] or 'n/a'} MB"
+                    )
             except Exception:
                 self.stdout.write(self.style.WARNING(
                     "   ⚠️ Vector embeddings skipped (sentence-transformers not installed?)"
@@ -56,27 +85,13 @@ class Command(BaseCommand):
         if auto_reload:
             self.stdout.write("\n🔄 Reloading cache...")
             try:
-                from chatbot.performance_optimizer import LazyRAGLoader
-                import chatbot.performance_optimizer as perf_opt
-
-                # Reset global flag
-                perf_opt._RAG_INDEX_LOADED = False
-
-                # Clear instance cache
-                loader = LazyRAGLoader.get_instance()
-                loader._rag_index = None
+                from chatbot.rag_index import reload_index
 
-                # Reload module
-                if 'chatbot.rag_index' in sys.modules:
-                    importlib.reload(sys.modules['chatbot.rag_index'])
-
-                # Force load new index
-                loader.load_rag_index()
+                # build_index đã swap bản mới trong process này; các worker khác
+                # tự phát hiện file mới qua mtime ở query kế tiếp.
+                reload_index()
 
                 self.stdout.write(self.style.SUCCESS("✅ Cache reloaded successfully"))
-                self.stdout.write(self.style.WARNING(
-                    "⚠️  If chatbot still shows old data, restart the server with: python manage.py runserver"
-                ))
             except Exception as e:
                 self.stdout.write(self.style.WARNING(
                     f"⚠️  Cache reload failed: {e}\n"
@@ -0,0 +1,32 @@
+"""
+Chạy scheduler của website (bài hết hạn, gửi email outbox) như 1 process riêng.
+Dùng khi đặt SCHEDULER_IN_PROCESS = False cho web worker:
+    python manage.py run_scheduler
+    python manage.py run_scheduler --once   # 1 tick (cron)
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = 'Chạy các job định kỳ của website (lease DB, mỗi chu kỳ chỉ 1 worker chạy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Chạy 1 tick rồi thoát')
+
+    def handle(self, *args, **options):
+        from website import scheduler
+
+        tick = getattr(settings, 'SCHEDULER_TICK_SECONDS', 30)
+        self.stdout.write(self.style.WARNING(f'⏱️  Scheduler chạy mỗi {tick}s (Ctrl+C để dừng)'))
+        while True:
+            ran = scheduler.run_pending()
+            if ran:
+                self.stdout.write(f"✅ {', '.join(ran)}")
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(tick)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0075_rentalpost_is_rejected_rentalpost_rejected_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rentalpost',
+            name='features_mask',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0076_rentalpost_features_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteVisitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255)),
+                ('minute', models.DateTimeField()),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hll', models.BinaryField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['path', 'day'], name='website_sit_path_93e4eb_idx')],
+                'unique_together': {('path', 'minute')},
+            },
+        ),
+    ]
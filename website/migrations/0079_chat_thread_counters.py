@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+
+
+def backfill_counters(apps, schema_editor):
+    ChatThread = apps.get_model('website', 'ChatThread')
+    ChatMessage = apps.get_model('website', 'ChatMessage')
+
+    unread = Q(messages__is_read=False, messages__is_deleted=False)
+    latest = ChatMessage.objects.filter(thread=OuterRef('pk'), is_deleted=False).order_by('-created_at')
+    threads = (ChatThread.objects
+               .annotate(
+                   n_owner=Count('messages', filter=unread & Q(messages__sender=F('guest'))),
+                   n_guest=Count('messages', filter=unread & Q(messages__sender=F('owner'))),
+                   last_id=Subquery(latest.values('id')[:1]),
+                   last_at=Subquery(latest.values('created_at')[:1]),
+               ))
+    batch = []
+    for t in threads.iterator(chunk_size=1000):
+        if t.owner_id != t.guest_id:  # thread tự-kỷ không đếm chưa đọc
+            t.owner_unread, t.guest_unread = t.n_owner, t.n_guest
+        t.last_message_id, t.last_message_at = t.last_id, t.last_at
+        batch.append(t)
+        if len(batch) >= 1000:
+            ChatThread.objects.bulk_update(batch, ['owner_unread', 'guest_unread', 'last_message', 'last_message_at'])
+            batch = []
+    if batch:
+        ChatThread.objects.bulk_update(batch, ['owner_unread', 'guest_unread', 'last_message', 'last_message_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0078_job_lease_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatthread',
+            name='guest_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='website.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='owner_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
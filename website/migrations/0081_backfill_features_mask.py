@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:12
+
+from django.db import migrations
+
+
+def backfill_features_mask(apps, schema_editor):
+    from website.models import features_to_mask
+
+    RentalPost = apps.get_model('website', 'RentalPost')
+    rows = RentalPost.objects.order_by('id').values_list('id', 'features', 'features_mask')
+    batch = []
+    for post_id, features, current in rows.iterator(chunk_size=1000):
+        mask = features_to_mask(features)
+        if mask != current:
+            batch.append(RentalPost(id=post_id, features_mask=mask))
+        if len(batch) >= 1000:
+            RentalPost.objects.bulk_update(batch, ['features_mask'])
+            batch = []
+    if batch:
+        RentalPost.objects.bulk_update(batch, ['features_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0080_email_outbox_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_features_mask, migrations.RunPython.noop),
+    ]
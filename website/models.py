@@ -140,6 +140,35 @@ FEATURE_CHOICES = [
     ('gio_giac_tu_do', 'Giờ giấc tự do'),
 ]
 
+# Bit của từng tiện ích trong RentalPost.features_mask (theo thứ tự FEATURE_CHOICES:
+# chỉ thêm tiện ích mới vào CUỐI danh sách, đổi thứ tự thì phải chạy backfill_features_mask)
+FEATURE_BITS = {key: 1 << i for i, (key, _) in enumerate(FEATURE_CHOICES)}
+
+
+def features_to_mask(features):
+    """List/chuỗi 'a,b' tiện ích → bitmask (bỏ qua mã không có trong FEATURE_CHOICES)."""
+    if isinstance(features, str):
+        features = features.split(',')
+    mask = 0
+    for f in features or []:
+        mask |= FEATURE_BITS.get(f, 0)
+    return mask
+
+
+def filter_by_features(qs, features):
+    """Lọc bài có ĐỦ mọi tiện ích bằng 1 điều kiện bitwise trên features_mask.
+
+    features_mask >= mask là điều kiện cần (dùng được index) để thu hẹp trước khi so bit.
+    """
+    if not features:
+        return qs
+    if any(f not in FEATURE_BITS for f in features):
+        return qs.none()  # giống features__contains với mã không tồn tại
+    mask = features_to_mask(features)
+    return (qs.filter(features_mask__gte=mask)
+              .alias(features_hit=models.F('features_mask').bitand(mask))
+              .filter(features_hit=mask))
+
 class RentalPost(models.Model):
     CATEGORY_CHOICES = [
         ('phongtro', 'Phòng trọ, nhà trọ'),
@@ -173,6 +202,8 @@ class RentalPost(models.Model):
     category_obj = models.ForeignKey('RoomCategory', null=True, blank=True, on_delete=models.SET_NULL, related_name='posts')
     features_obj = models.ManyToManyField('Feature', blank=True, related_name='posts')
     features = MultiSelectField(choices=FEATURE_CHOICES, blank=True, default=[])
+    # Bitmask của `features` (FEATURE_BITS) để lọc nhiều tiện ích bằng 1 phép AND; tự đồng bộ trong save()
+    features_mask = models.PositiveIntegerField(default=0, db_index=True, editable=False)
     expired_at = models.DateTimeField(null=True, blank=True)
     # Thời điểm gần nhất bài được gia hạn (phục vụ giới hạn lượt/ngày)
     renewed_at = models.DateTimeField(null=True, blank=True)
@@ -209,6 +240,13 @@ class RentalPost(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.features_mask = features_to_mask(self.features)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'features' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'features_mask'}
+        super().save(*args, **kwargs)
+
     def get_nearby_pois(self, radius_km=2, poi_types=None):
         """Lấy các POI gần đây trong bán kính radius_km (sử dụng Haversine formula)
 
@@ -297,6 +335,11 @@ class ChatThread(models.Model):
     hidden_for_owner = models.BooleanField(default=False)
     hidden_for_guest_at = models.DateTimeField(null=True, blank=True)
     hidden_for_owner_at = models.DateTimeField(null=True, blank=True)
+    # Số tin chưa đọc của từng phía + tin mới nhất (cập nhật khi gửi / đọc / thu hồi tin)
+    owner_unread = models.PositiveIntegerField(default=0)
+    guest_unread = models.PositiveIntegerField(default=0)
+    last_message = models.ForeignKey('ChatMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('post', 'guest', 'owner')
@@ -305,6 +348,106 @@ class ChatThread(models.Model):
     def __str__(self):
         return f"Chat: {self.guest.username} - {self.owner.username} ({self.post.title})"
 
+    def unread_field(self, user):
+        """Tên cột đếm tin chưa đọc của `user` trong thread (None nếu không tham gia / thread tự-kỷ)."""
+        user_id = getattr(user, 'id', user)
+        if self.owner_id == self.guest_id:
+            return None
+        if user_id == self.owner_id:
+            return 'owner_unread'
+        if user_id == self.guest_id:
+            return 'guest_unread'
+        return None
+
+    def unread_for(self, user):
+        field = self.unread_field(user)
+        return getattr(self, field) if field else 0
+
+    def add_message(self, sender, **fields):
+        """Tạo tin nhắn và cập nhật bộ đếm chưa đọc của người nhận + tin mới nhất trong cùng transaction."""
+        from django.db import transaction
+        from django.db.models import F, Q
+
+        recipient_field = self.unread_field(self.guest_id if sender.id == self.owner_id else self.owner_id)
+        with transaction.atomic():
+            message = ChatMessage.objects.create(thread=self, sender=sender, **fields)
+            if recipient_field:
+                ChatThread.objects.filter(pk=self.pk).update(**{recipient_field: F(recipient_field) + 1})
+            # Chỉ dời con trỏ tới tin mới hơn (2 tin gửi song song không ghi đè ngược)
+            (ChatThread.objects.filter(pk=self.pk)
+             .filter(Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.created_at))
+             .update(last_message=message, last_message_at=message.created_at))
+        return message
+
+    def mark_read(self, user):
+        """Đánh dấu đã đọc tin của đối phương gửi cho `user`. Returns: số tin vừa đánh dấu."""
+        from django.db import transaction
+        from django.db.models import F, Value
+        from django.db.models.functions import Greatest
+
+        field = self.unread_field(user)
+        with transaction.atomic():
+            n = (self.messages.filter(is_deleted=False, is_read=False)
+                 .exclude(sender=user).update(is_read=True))
+            if n and field:
+                ChatThread.objects.filter(pk=self.pk).update(**{field: Greatest(F(field) - n, Value(0))})
+        if n and field:
+            setattr(self, field, max(0, getattr(self, field) - n))
+        return n
+
+    @classmethod
+    def recount(cls, thread_ids):
+        """Tính lại bộ đếm chưa đọc + tin mới nhất từ ChatMessage (admin sửa / xóa tin hàng loạt)."""
+        from django.db import transaction
+        from django.db.models import Count, F, OuterRef, Q, Subquery
+
+        thread_ids = set(thread_ids)
+        if not thread_ids:
+            return 0
+        unread = Q(messages__is_read=False, messages__is_deleted=False)
+        latest = ChatMessage.objects.filter(thread=OuterRef('pk'), is_deleted=False).order_by('-created_at')
+        with transaction.atomic():
+            # Khóa thread trước khi đếm: add_message song song cộng dồn sau khi tính xong
+            list(cls.objects.select_for_update().filter(pk__in=thread_ids).values_list('pk', flat=True))
+            threads = list(cls.objects.filter(pk__in=thread_ids).annotate(
+                n_owner=Count('messages', filter=unread & Q(messages__sender=F('guest'))),
+                n_guest=Count('messages', filter=unread & Q(messages__sender=F('owner'))),
+                last_id=Subquery(latest.values('id')[:1]),
+                last_at=Subquery(latest.values('created_at')[:1]),
+            ))
+            for t in threads:
+                self_chat = t.owner_id == t.guest_id
+                t.owner_unread = 0 if self_chat else t.n_owner
+                t.guest_unread = 0 if self_chat else t.n_guest
+                t.last_message_id, t.last_message_at = t.last_id, t.last_at
+            cls.objects.bulk_update(threads, ['owner_unread', 'guest_unread', 'last_message', 'last_message_at'])
+        return len(threads)
+
+    def recall_message(self, message):
+        """Thu hồi tin: bớt bộ đếm nếu người nhận chưa đọc, dời con trỏ tin mới nhất nếu cần."""
+        from django.db import transaction
+        from django.db.models import F, Value
+        from django.db.models.functions import Greatest
+
+        now = timezone.now()
+        with transaction.atomic():
+            live = ChatMessage.objects.filter(pk=message.pk, is_deleted=False)
+            # UPDATE có điều kiện is_read=False: không lệch với mark_read chạy song song
+            was_unread = live.filter(is_read=False).update(is_deleted=True, deleted_at=now)
+            if not was_unread and not live.update(is_deleted=True, deleted_at=now):
+                return False
+            field = self.unread_field(self.guest_id if message.sender_id == self.owner_id else self.owner_id)
+            if field and was_unread:
+                ChatThread.objects.filter(pk=self.pk).update(**{field: Greatest(F(field) - 1, Value(0))})
+            latest = self.messages.filter(is_deleted=False).order_by('-created_at').first()
+            ChatThread.objects.filter(pk=self.pk, last_message=message.pk).update(
+                last_message=latest,
+                last_message_at=latest.created_at if latest else None,
+            )
+        message.is_deleted = True
+        message.deleted_at = now
+        return True
+
 class ChatMessage(models.Model):
     thread = models.ForeignKey(ChatThread, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -331,6 +474,28 @@ class SiteVisit(models.Model):
         indexes = [models.Index(fields=['created_at'])]
 
 
+class SiteVisitBucket(models.Model):
+    """Lượt truy cập gộp theo (path, phút) — do website.visits flush định kỳ.
+
+    path là route của URLconf, '*' là tổng toàn site. `hll` (chỉ bucket '*', các bucket
+    khác để rỗng) là sketch HyperLogLog các IP — đếm IP duy nhất, gộp bằng max từng register.
+    """
+    ALL_PATHS = '*'
+
+    path = models.CharField(max_length=255)
+    minute = models.DateTimeField()
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    hll = models.BinaryField()
+
+    class Meta:
+        unique_together = ('path', 'minute')
+        indexes = [models.Index(fields=['path', 'day'])]
+
+    def __str__(self):
+        return f"{self.path} @ {self.minute:%d/%m %H:%M}: {self.count}"
+
+
 class Article(models.Model):
     """Bài viết tin tức/hướng dẫn do admin đăng."""
     title = models.CharField(max_length=200)
@@ -635,39 +800,39 @@ class VIPSubscription(models.Model):
 
     @property
     def badge_color(self) -> str:
-        # Lấy từ VIPPackageConfig trong database
-        try:
-            config = VIPPackageConfig.objects.get(plan=self.plan, is_active=True)
+        # Lấy từ VIPPackageConfig (registry thường trú, website/vip_configs.py)
+        from website import vip_configs
+        config = vip_configs.get(self.plan)
+        if config is not None:
             return config.title_color
-        except VIPPackageConfig.DoesNotExist:
-            return self.COLOR_MAP.get(self.plan, "")
+        return self.COLOR_MAP.get(self.plan, "")
 
     @property
     def posts_per_day(self) -> int:
-        # Lấy từ VIPPackageConfig trong database
-        try:
-            config = VIPPackageConfig.objects.get(plan=self.plan, is_active=True)
+        # Lấy từ VIPPackageConfig (registry thường trú, website/vip_configs.py)
+        from website import vip_configs
+        config = vip_configs.get(self.plan)
+        if config is not None:
             return config.posts_per_day
-        except VIPPackageConfig.DoesNotExist:
-            return self.POSTS_PER_DAY.get(self.plan, 0)
+        return self.POSTS_PER_DAY.get(self.plan, 0)
 
     @property
     def post_expire_days(self) -> int:
-        # Lấy từ VIPPackageConfig trong database
-        try:
-            config = VIPPackageConfig.objects.get(plan=self.plan, is_active=True)
+        # Lấy từ VIPPackageConfig (registry thường trú, website/vip_configs.py)
+        from website import vip_configs
+        config = vip_configs.get(self.plan)
+        if config is not None:
             return config.expire_days
-        except VIPPackageConfig.DoesNotExist:
-            return self.POST_EXPIRE_DAYS.get(self.plan, 0)
+        return self.POST_EXPIRE_DAYS.get(self.plan, 0)
 
     @property
     def price(self) -> int:
-        # Lấy từ VIPPackageConfig trong database
-        try:
-            config = VIPPackageConfig.objects.get(plan=self.plan, is_active=True)
+        # Lấy từ VIPPackageConfig (registry thường trú, website/vip_configs.py)
+        from website import vip_configs
+        config = vip_configs.get(self.plan)
+        if config is not None:
             return int(config.price)
-        except VIPPackageConfig.DoesNotExist:
-            return self.PRICES.get(self.plan, 0)
+        return self.PRICES.get(self.plan, 0)
 
     @property
     def is_active(self) -> bool:
@@ -926,3 +1091,44 @@ class Notification(models.Model):
     def __str__(self):
         return f"[{self.user.username}] {self.title}"
 
+
+
+class JobLease(models.Model):
+    """Khóa (lease) trong DB cho job định kỳ: mỗi tick chỉ 1 worker chạy (website/scheduler.py)."""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=100, blank=True)
+    expires_at = models.DateTimeField(help_text="Lease hết hiệu lực sau thời điểm này")
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.owner or '-'})"
+
+
+class EmailOutbox(models.Model):
+    """Email chờ gửi: request / job chỉ ghi vào đây, scheduler gửi theo lô (website/outbox.py)."""
+    STATUS_CHOICES = [
+        ("pending", "Chờ gửi"),
+        ("sending", "Đang gửi"),
+        ("sent", "Đã gửi"),
+        ("failed", "Lỗi"),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Worker đang giữ thư (status='sending') — tránh 2 worker gửi trùng
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.to_email}: {self.subject[:40]} [{self.status}]"
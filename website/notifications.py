@@ -1,3 +1,7 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q
 from django.urls import reverse
 from django.utils import timezone
 from .models import Notification
@@ -20,6 +24,29 @@ def notify(user, type_, title, message="", url="", post=None, rental_request=Non
         pass
 
 
+# ===== Số chưa đọc + 5 thông báo mới nhất (cho notifications_context) =====
+
+RECENT_LIMIT = 5
+
+
+def summary(user_id):
+    """{'unread': int, 'recent': [Notification]} của user.
+
+    Mỗi trang chỉ chạy 1 aggregate (tổng, chưa đọc, id mới nhất) — luôn đúng dù thông báo
+    được tạo / đọc / xóa ở worker nào. 5 thông báo mới nhất cache theo đúng bộ số đó nên
+    chỉ query lại khi có thay đổi (CACHES là LocMem riêng từng process, không dùng để
+    invalidate chéo worker).
+    """
+    qs = Notification.objects.filter(user_id=user_id)
+    sig = qs.aggregate(total=Count('id'), unread=Count('id', filter=Q(is_read=False)), last=Max('id'))
+    key = f"notifications:recent:{user_id}:{sig['total']}:{sig['unread']}:{sig['last']}"
+    recent = cache.get(key)
+    if recent is None:
+        recent = list(qs.order_by('-created_at')[:RECENT_LIMIT]) if sig['total'] else []
+        cache.set(key, recent, getattr(settings, 'NOTIFICATIONS_CACHE_SECONDS', 300))
+    return {'unread': sig['unread'], 'recent': recent}
+
+
 def url_for_post(post):
     try:
         return reverse('post_detail', args=[post.id])
@@ -39,3 +66,148 @@ def url_for_my_rooms():
         return reverse('my_rooms')
     except Exception:
         return '/'
+
+
+EXPIRED_POST_EMAIL = """
+Xin chào {username},
+
+Bài đăng của bạn đã hết hạn:
+
+📋 Thông tin bài đăng:
+- Tiêu đề: {title}
+- Địa chỉ: {address}
+- Giá: {price:,} VNĐ/tháng
+- Diện tích: {area} m²
+- Hết hạn: {expired_at}
+
+💡 Để tiếp tục hiển thị bài đăng, vui lòng gia hạn:
+🔗 Gia hạn ngay: {renew_url}
+
+---
+Trân trọng,
+Hệ thống PhongTro NMA
+"""
+
+
+def queue_expired_post_notices(since=None, now=None, send_email=True):
+    """Bài hết hạn (sau `since` nếu có) → Notification 'post_expired' + email vào outbox.
+
+    Mỗi bài chỉ báo 1 lần / 24h. Không gửi SMTP ở đây: email nằm trong EmailOutbox,
+    job 'email_outbox' của scheduler gửi theo lô. send_email=False (fan-out nhắc lại
+    hằng ngày) chỉ tạo thông báo trên web.
+    Returns: (số bài đã báo, số bài bỏ qua vì đã báo trong 24h)
+    """
+    from .models import RentalPost
+    from .outbox import enqueue_many
+
+    now = now or timezone.now()
+    posts = RentalPost.objects.filter(
+        expired_at__isnull=False,
+        expired_at__lte=now,
+        is_deleted=False,
+    ).select_related('user', 'user__customerprofile')
+    if since is not None:
+        posts = posts.filter(expired_at__gt=since)
+
+    candidates = []
+    for post in posts.iterator(chunk_size=500):
+        owner = post.user
+        # Chỉ chủ trọ (email chỉ gửi khi có địa chỉ)
+        if not hasattr(owner, 'customerprofile') or not owner.customerprofile.is_owner():
+            continue
+        candidates.append(post)
+    if not candidates:
+        return 0, 0
+
+    # Đã báo trong 24h qua → bỏ qua (1 query cho cả lô thay vì exists() từng bài)
+    notified = set(Notification.objects.filter(
+        type='post_expired',
+        post_id__in=[p.id for p in candidates],
+        created_at__gte=now - timezone.timedelta(hours=24),
+    ).values_list('user_id', 'post_id'))
+
+    renew_path = reverse('expired_posts')
+    notices, emails = [], []
+    for post in candidates:
+        owner = post.user
+        if (owner.id, post.id) in notified:
+            continue
+        notices.append(Notification(
+            user=owner,
+            type='post_expired',
+            title='Phòng hết hạn',
+            message=f"Bài đăng '{post.title}' đã hết hạn.",
+            url=renew_path,
+            post=post,
+        ))
+        if not (send_email and owner.email):
+            continue
+        emails.append((
+            owner.email,
+            f"⏰ Bài đăng đã hết hạn - {post.title[:50]}",
+            EXPIRED_POST_EMAIL.format(
+                username=owner.username,
+                title=post.title,
+                address=post.address or 'Chưa cập nhật',
+                price=int(post.price),
+                area=post.area,
+                expired_at=post.expired_at.strftime('%d/%m/%Y %H:%M'),
+                renew_url=f"{settings.SITE_URL}{renew_path}",
+            ),
+        ))
+    if notices:
+        # Thông báo + email cùng 1 transaction: lỗi giữa chừng thì lần chạy sau báo lại cả hai
+        with transaction.atomic():
+            Notification.objects.bulk_create(notices, batch_size=500)
+            enqueue_many(emails)
+    return len(notices), len(candidates) - len(notices)
+
+
+def queue_vip_expired_notices(now=None, lookback_days=None):
+    """Nhắc 'Gói VIP đã hết hạn' (1 lần / 24h) cho user có gói mới nhất đã hết hạn
+    trong lookback_days ngày gần đây. Returns: số thông báo tạo mới.
+    """
+    from .models import VIPSubscription
+
+    now = now or timezone.now()
+    lookback_days = lookback_days or getattr(settings, 'NOTIFICATION_FANOUT_LOOKBACK_DAYS', 7)
+    expired_users = set(VIPSubscription.objects
+                        .values('user_id')
+                        .annotate(last=Max('expires_at'))
+                        .filter(last__lt=now, last__gte=now - timezone.timedelta(days=lookback_days))
+                        .values_list('user_id', flat=True))
+    if not expired_users:
+        return 0
+    expired_users -= set(Notification.objects.filter(
+        type='vip_expired',
+        user_id__in=expired_users,
+        created_at__gte=now - timezone.timedelta(days=1),
+    ).values_list('user_id', flat=True))
+
+    url = reverse('subscribe_vip')
+    Notification.objects.bulk_create([
+        Notification(
+            user_id=uid,
+            type='vip_expired',
+            title='Gói VIP đã hết hạn',
+            message='Gia hạn để tiếp tục hưởng quyền lợi VIP.',
+            url=url,
+        )
+        for uid in expired_users
+    ], batch_size=500)
+    return len(expired_users)
+
+
+def fan_out_notifications(now=None):
+    """Job định kỳ: tạo hàng loạt thông báo nhắc (bài hết hạn, VIP hết hạn).
+
+    Thay cho việc notifications_context tự quét và INSERT trong lúc render từng trang.
+    Bài hết hạn trong NOTIFICATION_FANOUT_LOOKBACK_DAYS ngày được nhắc lại mỗi ngày
+    (chỉ trên web, email đã gửi 1 lần ở job expired_posts).
+    Returns: (số thông báo bài hết hạn, số thông báo VIP hết hạn)
+    """
+    now = now or timezone.now()
+    lookback = timezone.timedelta(days=getattr(settings, 'NOTIFICATION_FANOUT_LOOKBACK_DAYS', 7))
+    posts, _ = queue_expired_post_notices(since=now - lookback, now=now, send_email=False)
+    vips = queue_vip_expired_notices(now=now)
+    return posts, vips
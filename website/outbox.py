@@ -0,0 +1,114 @@
+"""
+Hộp thư đi (EmailOutbox): ghi email vào DB, scheduler gửi theo lô.
+
+Không request nào gọi SMTP trực tiếp nữa: enqueue()/enqueue_many() chỉ INSERT, job
+'email_outbox' của website/scheduler.py gọi send_pending() — mở 1 kết nối cho cả lô,
+lỗi từng thư được ghi lại và thử lại tối đa EMAIL_OUTBOX_MAX_ATTEMPTS lần.
+
+Mỗi lô được "giành" trước khi gửi: UPDATE có điều kiện status='pending' → 'sending'
+kèm claimed_by riêng của lần gửi, rồi chỉ đọc lại đúng các thư mình giành được. Vì vậy
+scheduler trong web và command cron chạy song song, hay 1 lô SMTP chậm hơn TTL của
+lease, cũng không gửi trùng thư. Thư kẹt ở 'sending' (worker chết giữa chừng) quá
+EMAIL_OUTBOX_CLAIM_TIMEOUT giây thì được trả về 'pending'.
+
+Settings:
+    EMAIL_OUTBOX_BATCH_SIZE     số thư mỗi lần gửi (mặc định 50)
+    EMAIL_OUTBOX_MAX_ATTEMPTS   số lần thử tối đa trước khi đánh dấu failed (mặc định 3)
+    EMAIL_OUTBOX_CLAIM_TIMEOUT  giây trước khi thư 'sending' bị coi là bỏ dở (mặc định 600)
+"""
+import os
+import socket
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+
+def enqueue(to_email, subject, body):
+    return EmailOutbox.objects.create(to_email=to_email, subject=subject[:255], body=body)
+
+
+def enqueue_many(messages):
+    """messages: iterable (to_email, subject, body) → 1 bulk INSERT."""
+    rows = [EmailOutbox(to_email=to, subject=subject[:255], body=body) for to, subject, body in messages]
+    if rows:
+        EmailOutbox.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def _claim(limit, now):
+    """Giành tối đa `limit` thư 'pending' cho lần gửi này. Returns: list EmailOutbox."""
+    stale = now - timezone.timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_TIMEOUT', 600))
+    EmailOutbox.objects.filter(status='sending', claimed_at__lt=stale).update(status='pending')
+
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+    with transaction.atomic():
+        ids = list(EmailOutbox.objects
+                   .select_for_update(skip_locked=True)
+                   .filter(status='pending')
+                   .order_by('created_at')
+                   .values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        EmailOutbox.objects.filter(id__in=ids, status='pending').update(
+            status='sending', claimed_by=token, claimed_at=now)
+    return list(EmailOutbox.objects.filter(status='sending', claimed_by=token).order_by('created_at'))
+
+
+def send_pending(limit=None):
+    """Gửi 1 lô thư đang chờ. Returns: (số gửi được, số lỗi)."""
+    limit = limit or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 3)
+    now = timezone.now()
+    batch = _claim(limit, now)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for item in batch:
+            item.attempts += 1
+            item.status = 'pending'  # lỗi → trả về hàng đợi (hoặc failed bên dưới)
+            try:
+                connection.send_messages([EmailMessage(
+                    item.subject, item.body, settings.DEFAULT_FROM_EMAIL, [item.to_email],
+                    connection=connection,
+                )])
+                item.status = 'sent'
+                item.sent_at = now
+                item.last_error = ''
+                sent += 1
+            except Exception as e:
+                item.last_error = str(e)[:1000]
+                if item.attempts >= max_attempts:
+                    item.status = 'failed'
+                failed += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        for item in batch:
+            if item.status == 'sending':  # connection.open() lỗi, chưa thử thư nào
+                item.status = 'pending'
+            item.claimed_by, item.claimed_at = '', None
+        EmailOutbox.objects.bulk_update(
+            batch, ['status', 'attempts', 'last_error', 'sent_at', 'claimed_by', 'claimed_at'])
+    return sent, failed
+
+
+def send_all():
+    """Gửi hết hàng đợi theo từng lô (command cron). Returns: (số gửi được, số lỗi)."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_pending()
+        total_sent += sent
+        total_failed += failed
+        if not sent:
+            return total_sent, total_failed
@@ -0,0 +1,196 @@
+"""
+Scheduler chạy job định kỳ ngoài request, điều phối giữa các worker bằng lease trong DB.
+
+Mỗi job có 1 dòng JobLease. Một tick chỉ chạy job khi UPDATE có điều kiện giành được
+lease (lease cũ đã hết hạn và lần chạy xong gần nhất đủ xa) → dù có bao nhiêu worker /
+process thì mỗi chu kỳ chỉ 1 nơi chạy.
+
+Cách chạy:
+- Trong process web: ExpiredPostNotificationMiddleware chỉ gọi start() (thread nền,
+  tắt bằng SCHEDULER_IN_PROCESS = False) — request không làm việc gì khác.
+- Tách riêng: python manage.py run_scheduler (vòng lặp), hoặc cron gọi check_expired_posts.
+
+Job:
+    expired_posts   báo bài hết hạn (Notification + email vào outbox), mỗi EXPIRED_POSTS_CHECK_SECONDS
+    email_outbox    gửi email trong EmailOutbox theo lô, mỗi EMAIL_OUTBOX_SEND_SECONDS
+    notification_fanout  nhắc bài / gói VIP hết hạn (chỉ thông báo web), mỗi NOTIFICATION_FANOUT_SECONDS
+"""
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_LOCK = threading.Lock()
+_THREAD = None
+
+
+# ---------------------------------------------------------------------------
+# Lease
+# ---------------------------------------------------------------------------
+
+def acquire(name, interval, ttl, now=None):
+    """Giành lease của job `name` nếu đã tới hạn chạy. Returns: True nếu process này chạy."""
+    from .models import JobLease
+
+    now = now or timezone.now()
+    JobLease.objects.bulk_create(
+        [JobLease(name=name, expires_at=now - timezone.timedelta(seconds=1))],
+        ignore_conflicts=True,
+    )
+    due = Q(last_finished_at__isnull=True) | Q(last_finished_at__lte=now - timezone.timedelta(seconds=interval))
+    won = (JobLease.objects
+           .filter(name=name, expires_at__lte=now)
+           .filter(due)
+           .update(owner=_OWNER, expires_at=now + timezone.timedelta(seconds=ttl), last_started_at=now))
+    return won == 1
+
+
+def release(name, finished=True):
+    from .models import JobLease
+
+    now = timezone.now()
+    fields = {'expires_at': now}
+    if finished:
+        fields['last_finished_at'] = now
+    JobLease.objects.filter(name=name, owner=_OWNER).update(**fields)
+
+
+def run_job(name, func, interval, ttl=None, force=False):
+    """Chạy func() dưới lease. Returns: kết quả func hoặc None nếu worker khác đang / vừa chạy."""
+    ttl = ttl or max(interval, 60)
+    if not acquire(name, 0 if force else interval, ttl):
+        return None
+    ok = False
+    try:
+        result = func()
+        ok = True
+        return result
+    finally:
+        release(name, finished=ok)
+
+
+# ---------------------------------------------------------------------------
+# Job
+# ---------------------------------------------------------------------------
+
+def expired_posts_since():
+    """Mốc của job expired_posts: lần chạy xong trước (lần đầu / quá lâu: 1 giờ gần nhất)."""
+    from .models import JobLease
+
+    last = (JobLease.objects.filter(name='expired_posts')
+            .values_list('last_finished_at', flat=True).first())
+    lookback = timezone.now() - timezone.timedelta(hours=1)
+    return min(last, lookback) if last else lookback
+
+
+def expire_posts(since, now=None):
+    """Báo bài hết hạn trong (since, now] rồi gỡ bài không còn hiển thị khỏi gợi ý / RAG.
+
+    Dùng chung cho job expired_posts và command check_expired_posts.
+    Returns: (số bài đã báo, số bài bỏ qua, số danh sách gợi ý đã sửa, số doc gỡ khỏi RAG)
+    """
+    from .models import RentalPost
+    from .notifications import queue_expired_post_notices
+
+    now = now or timezone.now()
+    queued, skipped = queue_expired_post_notices(since=since, now=now)
+
+    # Bài hết hạn / vừa cho thuê, bị xóa, bỏ duyệt trong cửa sổ này → gỡ khỏi gợi ý tính
+    # sẵn theo lô (signal lúc lưu tin chỉ xóa danh sách "tương tự" của chính bài đó)
+    invalidated = pruned = 0
+    try:
+        from goiy_ai.ml_models.precomputed import invalidate_posts
+        invalidated = invalidate_posts(RentalPost.objects.filter(
+            Q(expired_at__gt=since, expired_at__lte=now)
+            | (Q(updated_at__gt=since)
+               & (Q(is_rented=True) | Q(is_deleted=True) | Q(is_approved=False)))
+        ).values_list('id', flat=True))
+    except Exception as e:
+        print(f"⚠️  Scheduler: không cập nhật được gợi ý tính sẵn: {e}")
+    try:
+        from chatbot.rag_index import prune_inactive_posts
+        pruned = prune_inactive_posts()
+    except Exception as e:
+        print(f"⚠️  Scheduler: không cập nhật được RAG index: {e}")
+    return queued, skipped, invalidated, pruned
+
+
+def check_expired_posts():
+    """Báo bài hết hạn kể từ lần chạy trước (lần đầu: 1 giờ gần nhất)."""
+    queued, skipped, _, _ = expire_posts(expired_posts_since())
+    if queued:
+        print(f"⏰ Scheduler: đã báo {queued} bài hết hạn (bỏ qua {skipped})")
+    return queued
+
+
+def send_outbox():
+    from .outbox import send_pending
+
+    sent, failed = send_pending()
+    if sent or failed:
+        print(f"📧 Scheduler: gửi {sent} email, lỗi {failed}")
+    return sent
+
+
+def fan_out_notifications():
+    from .notifications import fan_out_notifications as fan_out
+
+    posts, vips = fan_out()
+    if posts or vips:
+        print(f"🔔 Scheduler: nhắc {posts} bài hết hạn, {vips} gói VIP hết hạn")
+    return posts + vips
+
+
+def jobs():
+    return [
+        ('expired_posts', check_expired_posts, getattr(settings, 'EXPIRED_POSTS_CHECK_SECONDS', 30 * 60)),
+        ('email_outbox', send_outbox, getattr(settings, 'EMAIL_OUTBOX_SEND_SECONDS', 30)),
+        ('notification_fanout', fan_out_notifications, getattr(settings, 'NOTIFICATION_FANOUT_SECONDS', 60 * 60)),
+    ]
+
+
+def run_pending():
+    """1 tick: chạy các job tới hạn mà process này giành được lease."""
+    ran = []
+    for name, func, interval in jobs():
+        try:
+            if run_job(name, func, interval) is not None:
+                ran.append(name)
+        except Exception as e:
+            print(f"⚠️  Scheduler: job {name} lỗi: {e}")
+    return ran
+
+
+# ---------------------------------------------------------------------------
+# Thread nền trong process web
+# ---------------------------------------------------------------------------
+
+def _loop():
+    from django.db import close_old_connections
+
+    while True:
+        time.sleep(getattr(settings, 'SCHEDULER_TICK_SECONDS', 30))
+        try:
+            run_pending()
+        finally:
+            close_old_connections()
+
+
+def start():
+    """Khởi động thread scheduler 1 lần / process (không chặn request)."""
+    global _THREAD
+    if not getattr(settings, 'SCHEDULER_IN_PROCESS', True):
+        return False
+    if _THREAD is not None and _THREAD.is_alive():
+        return False
+    with _LOCK:
+        if _THREAD is not None and _THREAD.is_alive():
+            return False
+        _THREAD = threading.Thread(target=_loop, name='website-scheduler', daemon=True)
+        _THREAD.start()
+    return True
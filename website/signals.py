@@ -361,20 +361,73 @@ def check_customer_profile_on_social_login(sender, request, sociallogin, **kwarg
         print(f"❌ Lỗi kiểm tra CustomerProfile khi đăng nhập Google: {e}")
 
 
-# ===== Auto rebuild RAG when VIP pricing changes =====
+# ===== Auto update RAG when VIP pricing / posts change =====
 @receiver([post_save, post_delete], sender=VIPPackageConfig)
 def rebuild_rag_on_vip_change(sender, instance: VIPPackageConfig, **kwargs):
-    """Khi thay đổi bảng giá VIP → rebuild RAG index và reload cache để RAG có doc VIP mới.
-    Lưu ý: trả lời trực tiếp về bảng giá vẫn lấy từ DB ngay lập tức; rebuild nhằm cập nhật RAG context.
+    """Khi thay đổi bảng giá VIP → cập nhật các doc VIP trong RAG index (chạy nền).
+    Lưu ý: trả lời trực tiếp về bảng giá vẫn lấy từ DB ngay lập tức; cập nhật nhằm làm mới RAG context.
     """
     try:
-        from django.core.management import call_command
-        # Build nhanh TF-IDF + embeddings (nếu có), tự động reload cache
-        call_command('build_rag_index')
+        from chatbot.rag_index import enqueue_vip_configs
+        enqueue_vip_configs()
     except Exception as e:
-        print(f"Warning: auto RAG rebuild failed on VIP change: {e}")
+        print(f"Warning: auto RAG update failed on VIP change: {e}")
 
 
+@receiver([post_save, post_delete], sender=VIPPackageConfig)
+def invalidate_vip_config_registry(sender, instance: VIPPackageConfig, **kwargs):
+    """Registry cấu hình gói VIP (website/vip_configs.py) load lại ở lần đọc kế tiếp."""
+    try:
+        from .vip_configs import invalidate
+        invalidate()
+    except Exception as e:
+        print(f"Warning: VIP config registry invalidation failed: {e}")
+
+
+@receiver([post_save, post_delete], sender=RentalPost)
+def update_rag_on_post_change(sender, instance: RentalPost, **kwargs):
+    """Tin được tạo/sửa/duyệt/xóa → thêm, cập nhật hoặc gỡ đúng doc của tin đó khỏi RAG index."""
+    try:
+        from chatbot.rag_index import enqueue_post
+        enqueue_post(instance.pk)
+    except Exception as e:
+        print(f"Warning: auto RAG update failed on post change: {e}")
+
+
+@receiver([post_save, post_delete], sender=RentalPost)
+def refresh_feature_matrix_on_post_change(sender, instance: RentalPost, **kwargs):
+    """Ma trận đặc trưng (goiy_ai) của process này đọc lại các bài vừa đổi ở lần dùng kế tiếp."""
+    try:
+        from goiy_ai.ml_models.feature_matrix import invalidate
+        invalidate(instance.pk)
+    except Exception as e:
+        print(f"Warning: feature matrix refresh failed on post change: {e}")
+
+
+@receiver([post_save, post_delete], sender=RentalPost)
+def invalidate_recommendations_on_post_change(sender, instance: RentalPost, **kwargs):
+    """Tin hết hạn / đã cho thuê / bị xóa → bỏ danh sách "tương tự" của chính tin đó.
+
+    Gỡ ID khỏi danh sách của bài / user khác (quét toàn bảng) để job expired_posts của
+    scheduler làm theo lô; trong lúc chờ, lookup() đã lọc bài không còn hiển thị.
+    """
+    from django.db import transaction
+
+    if kwargs.get('created'):
+        return  # tin mới chưa nằm trong danh sách nào
+    still_live = (
+        kwargs.get('signal') is post_save
+        and instance.is_approved and not instance.is_rented and not instance.is_deleted
+        and (instance.expired_at is None or instance.expired_at > timezone.now())
+    )
+    if still_live:
+        return
+    try:
+        from goiy_ai.ml_models.precomputed import drop_similar
+        post_id = instance.pk
+        transaction.on_commit(lambda: drop_similar([post_id]))
+    except Exception as e:
+        print(f"Warning: recommendation invalidation failed on post change: {e}")
 
 
 
@@ -424,3 +477,16 @@ def rebuild_rag_on_vip_change(sender, instance: VIPPackageConfig, **kwargs):
 
 
 
+
+
+
+
+@receiver([post_save, post_delete], sender=RentalPost)
+@receiver([post_save, post_delete], sender=User)
+def bump_admin_dashboard_stats(sender, instance, **kwargs):
+    """Số liệu dashboard admin (cache có version) được tính lại ở lần đọc kế tiếp."""
+    try:
+        from .dashboard_stats import bump
+        bump()
+    except Exception as e:
+        print(f"Warning: admin stats invalidation failed: {e}")
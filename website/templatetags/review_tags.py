@@ -1,22 +1,21 @@
 from django import template
-from django.db.models import Avg, Count
+from website import badges
 from website.models import LandlordReview
 
 register = template.Library()
 
-@register.simple_tag
-def landlord_rating_avg(user):
+@register.simple_tag(takes_context=True)
+def landlord_rating_avg(context, user):
     """Return average rating (float with 1 decimal) for a landlord user."""
     if not user or not getattr(user, 'id', None):
         return 0
-    avg = LandlordReview.objects.filter(landlord=user, is_approved=True).aggregate(a=Avg('rating'))['a'] or 0
-    return round(float(avg), 1)
+    return badges.for_context(context).rating(user.id, context)[0]
 
-@register.simple_tag
-def landlord_rating_count(user):
+@register.simple_tag(takes_context=True)
+def landlord_rating_count(context, user):
     if not user or not getattr(user, 'id', None):
         return 0
-    return LandlordReview.objects.filter(landlord=user, is_approved=True).count()
+    return badges.for_context(context).rating(user.id, context)[1]
 
 @register.simple_tag
 def latest_landlord_reviews(user, limit=3):
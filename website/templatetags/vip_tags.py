@@ -1,22 +1,24 @@
 from django import template
 from django.utils import timezone
 from django.utils.timesince import timesince
-from website.models import VIPSubscription
+from website import badges
 
 register = template.Library()
 
 
-@register.simple_tag
-def vip_color(user) -> str:
+# Tra qua BadgeLoader của request (website/badges.py): cả trang chỉ tốn 1 query VIP
+# cho mọi chủ tin + 1 query cấu hình gói, thay vì vài query mỗi card.
+
+@register.simple_tag(takes_context=True)
+def vip_color(context, user) -> str:
     if not user or not getattr(user, 'id', None):
         return ''
-    vip = VIPSubscription.objects.filter(user=user, expires_at__gte=timezone.now()).order_by('-expires_at').first()
-    return vip.badge_color if vip else ''
+    return badges.for_context(context).color(user.id, context)
 
 
-@register.simple_tag
-def vip_style_color(user) -> str:
-    color = vip_color(user)
+@register.simple_tag(takes_context=True)
+def vip_style_color(context, user) -> str:
+    color = vip_color(context, user)
     if color == 'red':
         return '#ef4444'
     if color == 'blue':
@@ -26,29 +28,15 @@ def vip_style_color(user) -> str:
     return ''
 
 
-@register.simple_tag
-def vip_star_count(user) -> int:
+@register.simple_tag(takes_context=True)
+def vip_star_count(context, user) -> int:
     """Return number of stars to show for a user's active VIP plan.
     Falls back to VIPPackageConfig.stars when available; otherwise maps:
     vip1 -> 5, vip2 -> 4, vip3 -> 3. Non-VIP -> 0.
     """
     if not user or not getattr(user, 'id', None):
         return 0
-    vip = VIPSubscription.objects.filter(user=user, expires_at__gte=timezone.now()).order_by('-expires_at').first()
-    if not vip:
-        return 0
-    # Prefer reading configured stars from VIPPackageConfig via model property if present
-    try:
-        # Access via related config using the plan
-        from website.models import VIPPackageConfig
-        cfg = VIPPackageConfig.objects.filter(plan=vip.plan, is_active=True).first()
-        if cfg and cfg.stars:
-            return int(max(0, min(5, cfg.stars)))
-    except Exception:
-        pass
-    # Fallback mapping
-    mapping = {"vip1": 5, "vip2": 4, "vip3": 3}
-    return mapping.get(vip.plan, 0)
+    return badges.for_context(context).stars(user.id, context)
 
 
 @register.filter
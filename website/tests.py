@@ -1,3 +1,443 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from . import dashboard_stats, notifications, outbox, scheduler, vip_configs, visits
+from .context_processors import (
+    admin_dashboard_stats, ai_moderation_alerts, notifications_context, unread_messages_context,
+)
+from .models import (
+    RentalPost, Province, SiteVisit, SiteVisitBucket, VIPSubscription, VIPPackageConfig, RentalRequest, LandlordReview,
+    CustomerProfile, EmailOutbox, JobLease, Notification, ChatThread, ChatMessage,
+    FEATURE_BITS, filter_by_features,
+)
+
+
+class FeaturesMaskTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner_features")
+        cls.prov = Province.objects.create(name="Vũng Tàu")
+
+    def _mk(self, features):
+        return RentalPost.objects.create(
+            user=self.owner, title="Phòng", description="desc", price=3000000, area=20,
+            province=self.prov, features=features, is_approved=True,
+        )
+
+    def test_mask_synced_on_save_and_used_for_multi_feature_filter(self):
+        both = self._mk(['co_may_lanh', 'co_gac', 'co_tu_lanh'])
+        only_ac = self._mk(['co_may_lanh'])
+        self._mk([])
+        self.assertEqual(both.features_mask,
+                         FEATURE_BITS['co_may_lanh'] | FEATURE_BITS['co_gac'] | FEATURE_BITS['co_tu_lanh'])
+
+        qs = RentalPost.objects.all()
+        self.assertEqual(list(filter_by_features(qs, ['co_may_lanh', 'co_gac'])), [both])
+        self.assertEqual(set(filter_by_features(qs, ['co_may_lanh'])), {both, only_ac})
+        self.assertFalse(filter_by_features(qs, ['khong_ton_tai']).exists())
+        self.assertEqual(filter_by_features(qs, []).count(), 3)
+
+        only_ac.features = ['co_gac', 'co_may_lanh']
+        only_ac.save(update_fields=['features'])
+        self.assertEqual(set(filter_by_features(qs, ['co_may_lanh', 'co_gac'])), {both, only_ac})
+
+    def test_backfill_command_repairs_stale_masks(self):
+        post = self._mk(['co_thang_may', 'bao_ve_24_24'])
+        RentalPost.objects.filter(id=post.id).update(features_mask=0)
+        self.assertFalse(filter_by_features(RentalPost.objects.all(), ['co_thang_may']).exists())
+
+        out = StringIO()
+        call_command('backfill_features_mask', stdout=out)
+        self.assertIn('1 bài', out.getvalue())
+        self.assertTrue(filter_by_features(RentalPost.objects.all(), ['co_thang_may', 'bao_ve_24_24']).exists())
+
+    def test_data_migration_backfills_existing_posts(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        post = self._mk(['co_gac', 'co_may_lanh'])
+        RentalPost.objects.filter(id=post.id).update(features_mask=0)  # bài có trước 0076
+        import_module('website.migrations.0081_backfill_features_mask').backfill_features_mask(apps, None)
+        self.assertEqual(list(filter_by_features(RentalPost.objects.all(), ['co_gac', 'co_may_lanh'])), [post])
+
+
+class SiteVisitRollupTests(TestCase):
+    def setUp(self):
+        visits._BUCKETS.clear()  # lượt truy cập của các test khác
+        cache.clear()
+        patcher = mock.patch.object(visits, '_ensure_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def _hit(self, path, ip):
+        return visits.record(self.factory.get(path, REMOTE_ADDR=ip))
+
+    def test_requests_are_counted_in_memory_and_flushed_as_rollups(self):
+        with self.assertNumQueries(0):
+            for i in range(30):
+                self._hit(f'/post/{i}/', f'10.0.0.{i % 10}')
+            self._hit('/', '10.0.0.1')
+            self._hit('/wp-login.php', '10.0.0.2')  # không resolve được → chỉ tính vào '*'
+            self.assertFalse(self._hit('/static/css/app.css', '10.0.0.1'))
+            self.assertFalse(self._hit('/admin/', '10.0.0.1'))
+        self.assertFalse(SiteVisit.objects.exists())
+
+        self.assertEqual(visits.flush(), 3)  # '/post/<int:pk>/', '/' và tổng '*'
+        for i in range(5):
+            self._hit('/post/1/', f'10.0.1.{i}')
+        visits.flush()  # cùng phút → cộng dồn vào bucket cũ
+
+        today = timezone.localdate()
+        self.assertEqual(visits.visits_between(today), 37)
+        self.assertEqual(visits.visits_between(today, path='/post/<int:pk>/'), 35)
+        self.assertEqual(visits.unique_visitors_between(today), 15)
+        self.assertEqual(bytes(SiteVisitBucket.objects.get(path='/').hll), b'')
+
+        with override_settings(SITE_VISIT_MAX_PATHS=2):
+            self._hit('/', '10.0.0.1')
+            self._hit('/post/1/', '10.0.0.1')
+            self.assertEqual(len(visits._BUCKETS), 2)  # '*' + '/', route thứ 2 chỉ tính vào '*'
+
+        stats = admin_dashboard_stats(self.factory.get('/admin/'))
+        self.assertEqual(stats['visits_today'], 37)
+        self.assertEqual(stats['visits_week'], 37)
+
+    def test_hyperloglog_estimate_within_error(self):
+        registers = bytearray(visits.HLL_M)
+        for i in range(20000):
+            visits.hll_add(registers, f'192.168.{i // 256}.{i % 256}')
+        self.assertLess(abs(visits.hll_estimate(registers) - 20000) / 20000, 0.1)
+
+    @override_settings(SITE_VISIT_RAW_SAMPLE_RATE=1.0)
+    def test_raw_rows_can_still_be_sampled(self):
+        self._hit('/', '10.0.0.9')
+        self.assertEqual(SiteVisit.objects.get().path, '/')
+
+
+class AdminDashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username="admin_stats", is_staff=True)
+        prov = Province.objects.create(name="Cần Thơ")
+        posts = [
+            RentalPost.objects.create(
+                user=cls.admin, title="Phòng", description="desc", price=2000000, area=20,
+                province=prov, is_approved=False,
+            )
+            for _ in range(2)
+        ]
+        # Bỏ qua kết quả moderator thật (signal lúc tạo tin)
+        RentalPost.objects.filter(id=posts[0].id).update(ai_flagged=True, ai_confidence=0.9, is_approved=False)
+        RentalPost.objects.filter(id=posts[1].id).update(ai_flagged=False, is_approved=False)
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/admin/')
+        self.request.user = self.admin
+
+    def test_stats_are_lazy_cached_and_versioned(self):
+        # Trang không dùng biến nào → không query
+        with self.assertNumQueries(0):
+            admin_dashboard_stats(self.request)
+            ai_moderation_alerts(self.request)
+
+        ctx = admin_dashboard_stats(self.request)
+        with self.assertNumQueries(5):  # User, RentalPost, 3 rollup lượt truy cập
+            self.assertEqual(ctx['posts_count'], 2)
+            self.assertEqual(ctx['users_count'], 1)
+        alerts = ai_moderation_alerts(self.request)
+        with self.assertNumQueries(2):
+            self.assertEqual(alerts['ai_stats']['total_flagged'], 1)
+            self.assertEqual(len(alerts['ai_flagged_posts']), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(admin_dashboard_stats(self.request)['posts_approved'], 0)
+            self.assertEqual(ai_moderation_alerts(self.request)['ai_stats']['pending_review'], 2)
+
+        RentalPost.objects.update(is_approved=True)
+        dashboard_stats.bump()  # signal post_save làm việc này khi lưu qua model
+        self.assertEqual(admin_dashboard_stats(self.request)['posts_approved'], 2)
+        self.assertEqual(ai_moderation_alerts(self.request)['ai_stats']['total_flagged'], 0)
+
+
+class BadgeLoaderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        prov = Province.objects.create(name="Nha Trang")
+        cls.owners = [User.objects.create(username=f"badge_owner_{i}") for i in range(3)]
+        cls.posts = [
+            RentalPost.objects.create(
+                user=owner, title=f"Phòng {i}", description="desc", price=2000000, area=20,
+                province=prov, is_approved=True,
+            )
+            for i, owner in enumerate(cls.owners)
+        ]
+        later = timezone.now() + timezone.timedelta(days=5)
+        VIPSubscription.objects.create(user=cls.owners[0], plan='vip1', expires_at=later)
+        VIPSubscription.objects.create(user=cls.owners[1], plan='vip2', expires_at=later)
+        VIPSubscription.objects.create(user=cls.owners[1], plan='vip3',
+                                       expires_at=timezone.now() - timezone.timedelta(days=1))
+        VIPPackageConfig.objects.create(plan='vip2', title_color='pink', stars=2)
+        guest = User.objects.create(username="badge_guest")
+        for rating in (4, 5):
+            req = RentalRequest.objects.create(customer=guest, post=cls.posts[0], status='confirmed')
+            LandlordReview.objects.create(rental_request=req, landlord=cls.owners[0], reviewer=guest, rating=rating)
+
+    def setUp(self):
+        vip_configs.invalidate()
+
+    def test_tags_batch_load_per_request(self):
+        tpl = Template(
+            "{% load vip_tags review_tags %}{% for p in posts %}"
+            "{% vip_style_color p.user %}/{% vip_star_count p.user %}/"
+            "{% landlord_rating_avg p.user %}/{% landlord_rating_count p.user %};{% endfor %}"
+        )
+        posts = list(RentalPost.objects.filter(id__in=[p.id for p in self.posts])
+                     .select_related('user').order_by('id'))
+        request = RequestFactory().get('/')
+        # 1 query VIP + 1 aggregate đánh giá cho cả trang + 1 lần nạp registry cấu hình gói
+        with self.assertNumQueries(3):
+            out = tpl.render(Context({'posts': posts, 'request': request}))
+        self.assertEqual(out, "#ef4444/5/4.5/2;#ec4899/2/0.0/0;/0/0.0/0;")
+
+        with self.assertNumQueries(0):
+            tpl.render(Context({'posts': posts, 'request': request}))
+
+
+class VIPConfigRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="vip_registry")
+        cls.sub = VIPSubscription.objects.create(user=cls.user, plan='vip1',
+                                                 expires_at=timezone.now() + timezone.timedelta(days=3))
+
+    def setUp(self):
+        vip_configs.invalidate()
+
+    def test_properties_read_resident_configs_and_follow_invalidation(self):
+        cfg = VIPPackageConfig.objects.create(plan='vip1', title_color='blue', posts_per_day=9,
+                                              expire_days=4, price=123000)
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertEqual((self.sub.badge_color, self.sub.posts_per_day,
+                                  self.sub.post_expire_days, self.sub.price), ('blue', 9, 4, 123000))
+
+        # Sửa qua model → signal invalidate ngay trong process này
+        cfg.posts_per_day = 2
+        cfg.save()
+        vip_configs.invalidate()  # website/signals.py chỉ nạp được một phần trong môi trường test (allauth)
+        self.assertEqual(self.sub.posts_per_day, 2)
+
+        # Worker khác sửa (không có signal ở process này): version trong DB đổi →
+        # process này hội tụ sau VIP_CONFIG_CHECK_SECONDS
+        VIPPackageConfig.objects.filter(pk=cfg.pk).update(
+            is_active=False, updated_at=timezone.now() + timezone.timedelta(seconds=1))
+        self.assertEqual(self.sub.posts_per_day, 2)
+        with override_settings(VIP_CONFIG_CHECK_SECONDS=0):
+            self.assertEqual(self.sub.posts_per_day, VIPSubscription.POSTS_PER_DAY['vip1'])
+            self.assertEqual(self.sub.badge_color, 'red')
+
+
+class ExpiredPostSchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner_expired", email="owner@example.com")
+        CustomerProfile.objects.update_or_create(user=cls.owner, defaults={'role': 'owner'})
+        prov = Province.objects.create(name="Đà Lạt")
+        cls.posts = [
+            RentalPost.objects.create(
+                user=cls.owner, title=f"Phòng hết hạn {i}", description="desc", price=2000000, area=20,
+                province=prov, is_approved=True,
+            )
+            for i in range(3)
+        ]
+        RentalPost.objects.filter(id__in=[p.id for p in cls.posts[:2]]).update(
+            expired_at=timezone.now() - timezone.timedelta(minutes=10))
+
+    def test_lease_lets_only_one_worker_run_each_tick(self):
+        self.assertTrue(scheduler.acquire('demo', interval=60, ttl=60))
+        self.assertFalse(scheduler.acquire('demo', interval=60, ttl=60))  # đang giữ lease
+        scheduler.release('demo')
+        self.assertFalse(scheduler.acquire('demo', interval=60, ttl=60))  # chưa tới chu kỳ
+        later = timezone.now() + timezone.timedelta(seconds=61)
+        self.assertTrue(scheduler.acquire('demo', interval=60, ttl=60, now=later))
+        self.assertEqual(JobLease.objects.filter(name='demo').count(), 1)
+
+    def test_expired_posts_are_queued_once_and_mailed_from_outbox(self):
+        self.client.get('/')  # request không còn quét / gửi mail
+        self.assertFalse(EmailOutbox.objects.exists())
+        self.assertEqual(len(mail.outbox), 0)
+
+        with mock.patch('chatbot.rag_index.prune_inactive_posts', return_value=0):
+            self.assertEqual(scheduler.run_job('expired_posts', scheduler.check_expired_posts, 1800), 2)
+            self.assertIsNone(scheduler.run_job('expired_posts', scheduler.check_expired_posts, 1800))
+        self.assertEqual(Notification.objects.filter(type='post_expired').count(), 2)
+        self.assertEqual(EmailOutbox.objects.filter(status='pending').count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+        # Chạy lại (vd. cron check_expired_posts) → đã báo trong 24h, không trùng
+        from .notifications import queue_expired_post_notices
+        self.assertEqual(queue_expired_post_notices(), (0, 2))
+
+        self.assertEqual(outbox.send_pending(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ['owner@example.com'])
+        self.assertFalse(EmailOutbox.objects.filter(status='pending').exists())
+
+    def test_outbox_skips_mail_claimed_by_another_worker(self):
+        busy = outbox.enqueue('a@example.com', 'A', 'body')
+        outbox.enqueue('b@example.com', 'B', 'body')
+        EmailOutbox.objects.filter(pk=busy.pk).update(
+            status='sending', claimed_by='other', claimed_at=timezone.now())
+        self.assertEqual(outbox.send_pending(), (1, 0))
+        self.assertEqual([m.to for m in mail.outbox], [['b@example.com']])
+
+        # Worker kia chết giữa chừng: hết hạn giành thì thư được gửi lại
+        with override_settings(EMAIL_OUTBOX_CLAIM_TIMEOUT=0):
+            self.assertEqual(outbox.send_pending(), (1, 0))
+        self.assertEqual(EmailOutbox.objects.get(pk=busy.pk).status, 'sent')
+
+    def test_rented_post_is_dropped_from_precomputed_lists_by_the_job(self):
+        from goiy_ai.models import PrecomputedRecommendation
+
+        live, rented = self.posts[2], self.posts[1]
+        row = PrecomputedRecommendation.objects.create(
+            scope='user', key='1', post_ids=[rented.id, live.id],
+            expires_at=timezone.now() + timezone.timedelta(hours=1))
+        rented.is_rented = True
+        rented.save()  # signal không quét bảng trong request nữa
+        with mock.patch('chatbot.rag_index.prune_inactive_posts', return_value=0):
+            scheduler.check_expired_posts()
+        row.refresh_from_db()
+        self.assertEqual(row.post_ids, [live.id])
+
+    def test_command_only_invalidates_posts_in_the_window(self):
+        old = self.posts[2]
+        RentalPost.objects.filter(id=old.id).update(expired_at=timezone.now() - timezone.timedelta(days=30))
+        with mock.patch('chatbot.rag_index.prune_inactive_posts', return_value=0), \
+                mock.patch('goiy_ai.ml_models.precomputed.invalidate_posts',
+                           side_effect=lambda ids: len(list(ids))) as invalidate:
+            call_command('check_expired_posts', '--no-send', stdout=StringIO())
+        self.assertEqual(sorted(invalidate.call_args[0][0]), sorted(p.id for p in self.posts[:2]))
+
+
+class NotificationSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="owner_notif")
+        CustomerProfile.objects.update_or_create(user=cls.owner, defaults={'role': 'owner'})
+        prov = Province.objects.create(name="Cần Thơ")
+        post = RentalPost.objects.create(
+            user=cls.owner, title="Phòng cũ", description="desc", price=1500000, area=18,
+            province=prov, is_approved=True,
+        )
+        RentalPost.objects.filter(id=post.id).update(expired_at=timezone.now() - timezone.timedelta(days=2))
+        VIPSubscription.objects.create(user=cls.owner, plan='vip1',
+                                       expires_at=timezone.now() - timezone.timedelta(days=1))
+        Notification.objects.all().delete()  # thông báo "mua VIP" do signal tạo
+
+    def setUp(self):
+        cache.clear()
+        request = RequestFactory().get('/')
+        request.user = self.owner
+        self.request = request
+
+    def test_context_reads_summary_without_writing(self):
+        with self.assertNumQueries(1):
+            ctx = notifications_context(self.request)
+        self.assertEqual(ctx['notifications_unread_count'], 0)
+        self.assertFalse(Notification.objects.exists())
+
+        notifications.notify(self.owner, 'chat_new', 'Tin nhắn mới')
+        with self.assertNumQueries(2):  # aggregate + danh sách mới nhất
+            self.assertEqual(notifications_context(self.request)['notifications_unread_count'], 1)
+        with self.assertNumQueries(1):  # danh sách lấy từ cache
+            ctx = notifications_context(self.request)
+
+        # Worker khác đánh dấu đã đọc (không invalidate cache ở process này) → vẫn đúng
+        Notification.objects.filter(user=self.owner).update(is_read=True)
+        ctx = notifications_context(self.request)
+        self.assertEqual(ctx['notifications_unread_count'], 0)
+        self.assertTrue(ctx['notifications_recent'][0].is_read)
+
+    def test_fan_out_creates_reminders_once_per_day(self):
+        notifications_context(self.request)
+        self.assertEqual(notifications.fan_out_notifications(), (1, 1))
+        self.assertEqual(notifications.fan_out_notifications(), (0, 0))
+        self.assertEqual(Notification.objects.filter(type='post_expired').count(), 1)
+        self.assertEqual(Notification.objects.filter(type='vip_expired').count(), 1)
+        self.assertFalse(EmailOutbox.objects.exists())  # nhắc lại chỉ trên web
+        self.assertEqual(notifications_context(self.request)['notifications_unread_count'], 2)
+
+
+class ChatUnreadCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username="chat_owner")
+        cls.guest = User.objects.create(username="chat_guest")
+        prov = Province.objects.create(name="Huế")
+        posts = [
+            RentalPost.objects.create(
+                user=cls.owner, title=f"Phòng chat {i}", description="desc", price=1000000, area=15,
+                province=prov, is_approved=True,
+            )
+            for i in range(2)
+        ]
+        cls.threads = [ChatThread.objects.create(post=p, owner=cls.owner, guest=cls.guest) for p in posts]
+
+    def _unread(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return unread_messages_context(request)['unread_messages_count']
+
+    def test_counters_follow_send_read_and_recall(self):
+        t1, t2 = self.threads
+        t1.add_message(self.guest, content="Còn phòng không?")
+        recalled = t1.add_message(self.guest, content="Gửi nhầm")
+        t2.add_message(self.guest, content="Phòng 2?")
+        last = t2.add_message(self.owner, content="Còn bạn nhé")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self._unread(self.owner), 3)
+        self.assertEqual(self._unread(self.guest), 1)
+
+        t1.recall_message(recalled)
+        t1.refresh_from_db()
+        self.assertEqual((t1.owner_unread, t1.last_message.content), (1, "Còn phòng không?"))
+
+        t2.refresh_from_db()
+        self.assertEqual(t2.last_message_id, last.id)
+        self.assertEqual(t2.mark_read(self.owner), 1)
+        self.assertEqual(self._unread(self.owner), 1)
+        # Số trên thread khớp với số tin chưa đọc thật
+        for t in ChatThread.objects.all():
+            real = ChatMessage.objects.filter(thread=t, is_read=False, is_deleted=False)
+            self.assertEqual(t.owner_unread, real.filter(sender=self.guest).count())
+            self.assertEqual(t.guest_unread, real.filter(sender=self.owner).count())
+
+    def test_admin_message_actions_recount_thread(self):
+        from django.contrib.admin.sites import site
+        from .admin import ChatMessageAdmin
+
+        t1 = self.threads[0]
+        first = t1.add_message(self.guest, content="Tin 1")
+        second = t1.add_message(self.guest, content="Tin 2")
+        admin_obj = ChatMessageAdmin(ChatMessage, site)
+        qs = ChatMessage.objects.filter(pk=second.pk)
+        with mock.patch.object(admin_obj, 'message_user'):
+            admin_obj.soft_delete_messages(None, qs)
+            t1.refresh_from_db()
+            self.assertEqual((t1.owner_unread, t1.last_message_id), (1, first.id))
+            admin_obj.restore_messages(None, qs)
+        t1.refresh_from_db()
+        self.assertEqual((t1.owner_unread, t1.last_message_id), (2, second.id))
 
-# Create your tests here.
@@ -6,7 +6,7 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.utils import timezone
-from .models import RentalPost, RentalPostImage, RentalVideo, CustomerProfile, Province, District, Ward, ChatThread, ChatMessage, Article, SuggestedLink, Wallet, RechargeTransaction, VIPSubscription, Notification, SavedPost, OTPCode, PostReport
+from .models import filter_by_features, RentalPost, RentalPostImage, RentalVideo, CustomerProfile, Province, District, Ward, ChatThread, ChatMessage, Article, SuggestedLink, Wallet, RechargeTransaction, VIPSubscription, Notification, SavedPost, OTPCode, PostReport
 from .notifications import notify
 from .forms import RegisterForm, RentalPostForm, AccountProfileForm, ChangePasswordForm, RequestOTPForm, VerifyOTPForm, RechargeForm
 from django.core.mail import send_mail
@@ -153,16 +153,12 @@ def home(request):
                               .values_list('post_id', flat=True)
         )
 
-    # Lấy AI recommendations (5 bài) để hiển thị ở carousel "Tin đăng mới cập nhật"
-    # NÂNG CẤP: Dùng Hybrid Recommender (ML + Content-based)
+    # Lấy AI recommendations (6 bài) để hiển thị ở carousel "Tin đăng mới cập nhật"
+    # Danh sách Hybrid (ML + Content-based) được tính sẵn offline (precompute_recommendations):
+    # ở đây chỉ tra theo user / cohort của session + lọc bài còn hiển thị
     recommended_posts = []
     if request.user.is_authenticated or request.session.session_key:
-        from goiy_ai.ml_models.hybrid import HybridRecommender
-        from django.db.models import Q
-        from django.utils import timezone
-
-        # Khởi tạo Hybrid Recommender (tự động load CF model nếu có)
-        hybrid_recommender = HybridRecommender()
+        from goiy_ai.ml_models import precomputed
 
         user = request.user if request.user.is_authenticated else None
         session_id = request.session.session_key
@@ -170,41 +166,7 @@ def home(request):
             request.session.create()
             session_id = request.session.session_key
 
-        # Lấy recommendations từ Hybrid AI (ML + Content-based)
-        ai_recommendations = hybrid_recommender.get_recommendations(
-            user=user,
-            limit=20,  # Lấy nhiều hơn để đảm bảo có đủ 5 bài sau khi filter
-            context={'session_id': session_id}
-        )
-
-        # Filter: chỉ lấy bài đã duyệt, chưa cho thuê, chưa hết hạn
-        now = timezone.now()
-        if ai_recommendations:
-            # Lấy list IDs từ AI recommendations và giữ nguyên thứ tự
-            rec_ids = [post.id for post in ai_recommendations]
-
-            # Filter lại với các điều kiện
-            filtered_posts = RentalPost.objects.filter(
-                id__in=rec_ids,
-                is_approved=True,
-                is_rented=False
-            ).filter(
-                Q(expired_at__isnull=True) | Q(expired_at__gt=now)
-            )
-
-            # Giữ nguyên thứ tự từ AI (không sort lại)
-            # Tạo dict để lookup nhanh
-            posts_dict = {post.id: post for post in filtered_posts}
-
-            # Giữ thứ tự từ AI recommendations
-            recommended_posts = []
-            for post_id in rec_ids:
-                if post_id in posts_dict:
-                    recommended_posts.append(posts_dict[post_id])
-                    if len(recommended_posts) >= 6:
-                        break
-        else:
-            recommended_posts = []
+        recommended_posts, _ = precomputed.recommend(user=user, session_id=session_id, limit=6)
 
     # Lấy các tỉnh/thành phố nổi bật với số lượng tin đăng
     from django.db.models import Count
@@ -942,8 +904,8 @@ def rental_list(request):
 
     # Features filter (MultiSelectField)
     if features:
-        for f in features:
-            posts = posts.filter(features__contains=f)
+        # 1 điều kiện bitwise trên features_mask thay vì LIKE cho từng tiện ích
+        posts = filter_by_features(posts, features)
 
     paginator = Paginator(posts, 10)
     page_number = request.GET.get('page')
@@ -986,22 +948,10 @@ def post_detail(request, pk):
 
     # 🔥 TRACKING: Log view event for analytics
     if request.user.is_authenticated:
-        from goiy_ai.models import PostView, UserInteraction
-        # Track view in PostView
-        PostView.objects.create(
-            user=request.user,
-            post=post,
-            session_id=request.session.session_key or '',
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
-        # Track interaction
-        UserInteraction.objects.create(
-            user=request.user,
-            post=post,
-            session_id=request.session.session_key or '',
-            interaction_type='view',
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
+        # Ghi theo lô ở thread nền (goiy_ai.tracking), không INSERT trong request
+        from goiy_ai import tracking
+        tracking.track_view(request, post.id)
+        tracking.track_interaction(request, post.id, 'view', user_agent=False)
 
     # Nếu bài đã bị admin gỡ (soft delete bởi staff) thì chỉ chặn khách/ngoài chủ
     if post.is_deleted and post.deleted_by and post.deleted_by.is_staff:
@@ -1333,27 +1283,15 @@ def toggle_save_post(request, post_id):
     saved, created = SavedPost.objects.get_or_create(user=request.user, post=post)
 
     # 🔥 TRACKING: Log save/unsave event for analytics
-    from goiy_ai.models import UserInteraction
+    from goiy_ai import tracking
     if not created:
         saved.delete()
         # Track unsave
-        UserInteraction.objects.create(
-            user=request.user,
-            post=post,
-            session_id=request.session.session_key or '',
-            interaction_type='unsave',
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
+        tracking.track_interaction(request, post.id, 'unsave', user_agent=False)
         return JsonResponse({'status': 'removed'})
     else:
         # Track save
-        UserInteraction.objects.create(
-            user=request.user,
-            post=post,
-            session_id=request.session.session_key or '',
-            interaction_type='save',
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
+        tracking.track_interaction(request, post.id, 'save', user_agent=False)
     return JsonResponse({'status': 'saved'})
 
 
@@ -1385,8 +1323,8 @@ def chat_thread(request, thread_id):
         # Save full to ensure updated_at is refreshed
         thread.save()
 
-    # Đánh dấu đã đọc các tin nhắn của đối phương
-    thread.messages.filter(is_deleted=False, is_read=False).exclude(sender=request.user).update(is_read=True)
+    # Đánh dấu đã đọc các tin nhắn của đối phương (kèm bộ đếm chưa đọc của thread)
+    thread.mark_read(request.user)
 
     # Lấy tin nhắn chưa xóa
     messages = thread.messages.filter(is_deleted=False).order_by('created_at')[:50]
@@ -1416,14 +1354,8 @@ def start_chat(request, post_id):
 
     # 🔥 TRACKING: Log contact interaction for analytics (only first time)
     if created:
-        from goiy_ai.models import UserInteraction
-        UserInteraction.objects.create(
-            user=request.user,
-            post=post,
-            session_id=request.session.session_key or '',
-            interaction_type='contact',
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
+        from goiy_ai import tracking
+        tracking.track_interaction(request, post.id, 'contact', user_agent=False)
 
     # Mở lại cuộc trò chuyện nếu phía khách đã ẩn trước đó
     changed_fields = []
@@ -1475,13 +1407,8 @@ def send_chat_message(request, thread_id):
     if changed_fields:
         thread.save(update_fields=changed_fields)
 
-    # Create message
-    message = ChatMessage.objects.create(
-        thread=thread,
-        sender=request.user,
-        content=content,
-        image=image
-    )
+    # Create message (cập nhật bộ đếm chưa đọc + tin mới nhất của thread)
+    message = thread.add_message(request.user, content=content, image=image)
 
     return JsonResponse({
         'status': 'success',
@@ -1496,22 +1423,15 @@ def delete_message(request, message_id):
     if message.sender != request.user:
         return JsonResponse({'status': 'error', 'message': 'Không được phép'}, status=403)
 
-    message.is_deleted = True
-    message.deleted_at = timezone.now()
-    message.save(update_fields=['is_deleted', 'deleted_at'])
+    message.thread.recall_message(message)
     return JsonResponse({'status': 'success'})
 
 @login_required
 def my_chats(request):
 
-    # Subqueries for last message content and timestamp
-    last_msg_qs = ChatMessage.objects.filter(
-        thread=models.OuterRef('pk'),
-        is_deleted=False
-    ).order_by('-created_at')
-
+    # Tin mới nhất + số chưa đọc đọc thẳng từ cột của thread (không subquery / COUNT)
     threads = (
-        ChatThread.objects.select_related('post', 'owner', 'guest')
+        ChatThread.objects.select_related('post', 'owner', 'guest', 'last_message')
         .filter(is_active=True)
         .exclude(owner=models.F('guest'))
         .filter(
@@ -1519,14 +1439,11 @@ def my_chats(request):
             | (Q(guest=request.user) & Q(hidden_for_guest=False))
         )
         .annotate(
-            last_message=models.Subquery(last_msg_qs.values('content')[:1]),
-            last_time=models.Subquery(last_msg_qs.values('created_at')[:1]),
-            unread_count=models.Count(
-                'messages',
-                filter=(Q(messages__is_read=False) & ~Q(messages__sender=request.user))
+            unread_count=models.Case(
+                models.When(owner=request.user, then=models.F('owner_unread')),
+                default=models.F('guest_unread'),
             ),
         )
-        .distinct()
         .order_by('-updated_at')
     )
 
@@ -1828,13 +1745,11 @@ def mark_all_chats_read(request):
     """Đánh dấu tất cả tin nhắn chưa đọc (của đối phương) là đã đọc cho user hiện tại."""
     # Tìm các thread mà user tham gia
     user = request.user
-    user_threads = ChatThread.objects.filter(is_active=True).filter(Q(owner=user) | Q(guest=user))
-    # Đánh dấu các tin nhắn trong các thread đó, do đối phương gửi, chưa đọc, chưa xóa
-    ChatMessage.objects.filter(
-        thread__in=user_threads,
-        is_deleted=False,
-        is_read=False
-    ).exclude(sender=user).update(is_read=True)
+    user_threads = (ChatThread.objects.filter(is_active=True)
+                    .filter((Q(owner=user) & Q(owner_unread__gt=0)) | (Q(guest=user) & Q(guest_unread__gt=0))))
+    # Chỉ các thread còn tin chưa đọc: đánh dấu tin của đối phương + trừ bộ đếm từng thread
+    for thread in user_threads:
+        thread.mark_read(user)
 
     # Điều hướng về danh sách chat
     if request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'application/json' in request.META.get('HTTP_ACCEPT', ''):
@@ -2608,14 +2523,8 @@ def send_rental_request(request, post_id):
     req = RentalRequest.objects.create(customer=request.user, post=post, status='pending')
 
     # 🔥 TRACKING: Log rental request for analytics
-    from goiy_ai.models import UserInteraction
-    UserInteraction.objects.create(
-        user=request.user,
-        post=post,
-        session_id=request.session.session_key or '',
-        interaction_type='request',
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
+    from goiy_ai import tracking
+    tracking.track_interaction(request, post.id, 'request', user_agent=False)
     # Notify owner về yêu cầu thuê mới
     try:
         notify(
@@ -2845,9 +2754,8 @@ def owner_request_deposit(request, request_id):
 
     # Gửi QR link cho khách qua chat
     thread, _ = ChatThread.objects.get_or_create(post=rr.post, guest=rr.customer, owner=rr.post.user)
-    ChatMessage.objects.create(
-        thread=thread,
-        sender=request.user,
+    thread.add_message(
+        request.user,
         content=f"💰 Yêu cầu đặt cọc {amount:,} VNĐ cho phòng '{rr.post.title}'\n\n"
                 f"📱 Vui lòng quét mã QR để thanh toán:\n{payment_url}\n\n"
                 f"⚠️ Sau khi thanh toán, {amount:,} VNĐ sẽ được trừ từ ví của bạn và chuyển cho chủ trọ."
@@ -2879,8 +2787,8 @@ def owner_waive_deposit(request, request_id):
     rr.save(update_fields=['deposit_status'])
 
     thread, _ = ChatThread.objects.get_or_create(post=rr.post, guest=rr.customer, owner=rr.post.user)
-    ChatMessage.objects.create(thread=thread, sender=request.user,
-                               content=f"Chủ trọ xác nhận không cần đặt cọc cho phòng '{rr.post.title}'.")
+    thread.add_message(request.user,
+                       content=f"Chủ trọ xác nhận không cần đặt cọc cho phòng '{rr.post.title}'.")
     messages.success(request, "Đã đánh dấu không cần đặt cọc.")
     return redirect('rental_management')
 
@@ -2921,8 +2829,8 @@ def customer_cancel_deposit(request, request_id):
 
     # Notify owner
     thread, _ = ChatThread.objects.get_or_create(post=rr.post, guest=rr.customer, owner=rr.post.user)
-    ChatMessage.objects.create(thread=thread, sender=request.user,
-                               content=f"Khách hàng đã hủy yêu cầu đặt cọc cho phòng '{rr.post.title}'.")
+    thread.add_message(request.user,
+                       content=f"Khách hàng đã hủy yêu cầu đặt cọc cho phòng '{rr.post.title}'.")
     messages.success(request, "Bạn đã hủy đặt cọc.")
     try:
         notify(user=rr.post.user, type_='deposit_paid',  # reuse bucket
@@ -3042,9 +2950,8 @@ def deposit_momo_return(request):
 
         # Nhắn chat
         thread, _ = ChatThread.objects.get_or_create(post=rr.post, guest=rr.customer, owner=owner)
-        ChatMessage.objects.create(
-            thread=thread,
-            sender=rr.customer,
+        thread.add_message(
+            rr.customer,
             content=(
                 "✅ ĐÃ THANH TOÁN ĐẶT CỌC\n\n"
                 f"💰 Số tiền: {amount:,} VNĐ\n"
@@ -3192,9 +3099,8 @@ def view_deposit_bill(request, request_id):
         guest=rr.customer,
         owner=rr.post.user
     )
-    ChatMessage.objects.create(
-        thread=thread,
-        sender=request.user,
+    thread.add_message(
+        request.user,
         content=f"✅ Chủ trọ đã xác nhận nhận tiền đặt cọc {rr.deposit_amount:,} VNĐ.\n\n" +
                 f"Phòng đã được giữ chỗ cho bạn!"
     )
@@ -0,0 +1,65 @@
+"""
+Registry cấu hình gói VIP (VIPPackageConfig) thường trú trong process.
+
+VIPSubscription.badge_color / posts_per_day / post_expire_days / price và badge loader
+của template đọc từ đây thay vì query VIPPackageConfig mỗi lần truy cập property.
+
+- Toàn bộ gói được load bằng 1 query, giữ kèm "version" lấy từ DB:
+  (số dòng, max(updated_at)) của bảng VIPPackageConfig — sửa / thêm / xóa đều đổi version.
+- Mỗi process chỉ kiểm tra lại version sau VIP_CONFIG_CHECK_SECONDS giây (mặc định 5),
+  bằng 1 aggregate nhỏ → mọi worker gunicorn hội tụ trong vài giây mà không cần cache
+  dùng chung (CACHES mặc định là LocMem, riêng từng process).
+- Signal post_save / post_delete của VIPPackageConfig gọi invalidate(): bỏ bản của
+  process hiện tại ngay lập tức.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+_LOCK = threading.Lock()
+_RESIDENT = None  # (version, checked_at, {plan: VIPPackageConfig})
+
+
+def _db_version():
+    from website.models import VIPPackageConfig
+    row = VIPPackageConfig.objects.aggregate(n=Count('id'), last=Max('updated_at'))
+    return (row['n'], row['last'])
+
+
+def _load():
+    """(version, {plan: cfg đang kích hoạt}) bằng 1 query — version tính trên mọi dòng như _db_version."""
+    from website.models import VIPPackageConfig
+    rows = list(VIPPackageConfig.objects.all())
+    version = (len(rows), max((cfg.updated_at for cfg in rows), default=None))
+    return version, {cfg.plan: cfg for cfg in rows if cfg.is_active}
+
+
+def active_configs():
+    """plan → VIPPackageConfig đang kích hoạt (không query khi còn mới)."""
+    global _RESIDENT
+    now = time.monotonic()
+    resident = _RESIDENT
+    if resident is not None and now - resident[1] < getattr(settings, 'VIP_CONFIG_CHECK_SECONDS', 5):
+        return resident[2]
+    with _LOCK:
+        resident = _RESIDENT
+        if resident is not None and resident[0] == _db_version():
+            _RESIDENT = (resident[0], now, resident[2])
+        else:
+            version, configs = _load()
+            _RESIDENT = (version, now, configs)
+        return _RESIDENT[2]
+
+
+def get(plan):
+    """VIPPackageConfig đang kích hoạt của gói (None nếu không có)."""
+    return active_configs().get(plan)
+
+
+def invalidate():
+    """Cấu hình gói vừa đổi: process này load lại ngay, process khác sau vài giây."""
+    global _RESIDENT
+    with _LOCK:
+        _RESIDENT = None
@@ -0,0 +1,260 @@
+"""
+Đếm lượt truy cập gộp theo phút thay vì INSERT 1 dòng SiteVisit mỗi request.
+
+SeparateSessionMiddleware gọi record(request): chỉ cộng vào bucket (route, phút) trong
+bộ nhớ process. Thread nền flush mỗi SITE_VISIT_FLUSH_SECONDS giây vào SiteVisitBucket
+(cộng dồn count), kèm 1 bucket path='*' cho toàn site để dashboard chỉ phải đọc vài dòng.
+
+- Path được chuẩn hóa về route của URLconf ('/post/<int:pk>/' thay vì từng '/post/123/');
+  path không resolve được (404, bot quét) chỉ tính vào '*'.
+- Chỉ bucket '*' giữ sketch HyperLogLog của IP (1 KB); bucket theo route chỉ có count.
+- Mỗi chu kỳ flush giữ tối đa SITE_VISIT_MAX_PATHS route khác nhau, phần dư chỉ tính vào '*'.
+
+Dashboard (admin_dashboard_stats) đọc rollup: visits_between() / unique_visitors_between().
+Vẫn có thể ghi SiteVisit từng dòng theo tỉ lệ lấy mẫu SITE_VISIT_RAW_SAMPLE_RATE (mặc định 0).
+
+Settings:
+    SITE_VISIT_FLUSH_SECONDS       chu kỳ flush (mặc định 60)
+    SITE_VISIT_RAW_SAMPLE_RATE     tỉ lệ request vẫn ghi SiteVisit (0..1, mặc định 0)
+    SITE_VISIT_MAX_PATHS           số route giữ riêng mỗi chu kỳ flush (mặc định 200)
+"""
+import atexit
+import functools
+import hashlib
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+# HyperLogLog: 2^10 register (1 KB / bucket), sai số chuẩn ~3.3%
+HLL_P = 10
+HLL_M = 1 << HLL_P
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_M)
+
+_LOCK = threading.Lock()
+_BUCKETS = {}  # (path, minute) → [count, bytearray registers | None]
+_WORKER = None
+_STATS = {'flushed': 0, 'failed': 0}
+
+
+# ---------------------------------------------------------------------------
+# HyperLogLog
+# ---------------------------------------------------------------------------
+
+def hll_add(registers, value):
+    x = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+    idx = x >> (64 - HLL_P)
+    rest = x & ((1 << (64 - HLL_P)) - 1)
+    rank = (64 - HLL_P) - rest.bit_length() + 1
+    if rank > registers[idx]:
+        registers[idx] = rank
+
+
+def hll_merge(a, b):
+    return bytearray(map(max, a, b))
+
+
+def hll_estimate(registers):
+    zeros = registers.count(0)
+    estimate = _HLL_ALPHA * HLL_M * HLL_M / sum(2.0 ** -r for r in registers)
+    if estimate <= 2.5 * HLL_M and zeros:
+        estimate = HLL_M * math.log(HLL_M / zeros)  # linear counting cho tập nhỏ
+    return int(round(estimate))
+
+
+# ---------------------------------------------------------------------------
+# Ghi nhận trong request
+# ---------------------------------------------------------------------------
+
+def _skip(path):
+    for prefix in (getattr(settings, 'STATIC_URL', None), getattr(settings, 'MEDIA_URL', None)):
+        if prefix and prefix.startswith('/') and path.startswith(prefix):
+            return True
+    return path.startswith('/admin') or path == '/favicon.ico'
+
+
+@functools.lru_cache(maxsize=4096)
+def route_for(path):
+    """'/post/123/' → '/post/<int:pk>/' theo URLconf; None nếu không resolve được."""
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return ('/' + match.route)[:255] if match.route else path[:255]
+
+
+def record(request):
+    """Cộng 1 lượt truy cập vào bucket phút hiện tại (không chạm DB)."""
+    path = request.path[:255]
+    if _skip(path):
+        return False
+    ip = request.META.get('REMOTE_ADDR') or ''
+    minute = timezone.now().replace(second=0, microsecond=0)
+    route = route_for(path)
+    max_paths = getattr(settings, 'SITE_VISIT_MAX_PATHS', 200)
+    with _LOCK:
+        total = _BUCKETS.get((_all_paths(), minute))
+        if total is None:
+            total = _BUCKETS[(_all_paths(), minute)] = [0, bytearray(HLL_M)]
+        total[0] += 1
+        hll_add(total[1], ip)
+        if route is not None:
+            bucket = _BUCKETS.get((route, minute))
+            if bucket is None and len(_BUCKETS) < max_paths:
+                bucket = _BUCKETS[(route, minute)] = [0, None]
+            if bucket is not None:
+                bucket[0] += 1
+
+    rate = getattr(settings, 'SITE_VISIT_RAW_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        try:
+            from website.models import SiteVisit
+            user = getattr(request, 'user', None)
+            SiteVisit.objects.create(path=path, ip=ip or None,
+                                     user=user if getattr(user, 'is_authenticated', False) else None)
+        except Exception:
+            pass
+    _ensure_worker()
+    return True
+
+
+def _all_paths():
+    from website.models import SiteVisitBucket
+    return SiteVisitBucket.ALL_PATHS
+
+
+def stats():
+    with _LOCK:
+        return dict(_STATS, pending=len(_BUCKETS))
+
+
+# ---------------------------------------------------------------------------
+# Flush
+# ---------------------------------------------------------------------------
+
+def _ensure_worker():
+    global _WORKER
+    if _WORKER is not None and _WORKER.is_alive():
+        return
+    with _LOCK:
+        if _WORKER is not None and _WORKER.is_alive():
+            return
+        _WORKER = threading.Thread(target=_worker_loop, name='site-visit-flush', daemon=True)
+        _WORKER.start()
+
+
+def _worker_loop():
+    from django.db import close_old_connections
+
+    while True:
+        time.sleep(getattr(settings, 'SITE_VISIT_FLUSH_SECONDS', 60))
+        try:
+            flush()
+        except Exception as e:
+            print(f"⚠️  SiteVisit flush lỗi: {e}")
+        finally:
+            close_old_connections()
+
+
+def _write(pending):
+    from website.models import SiteVisitBucket
+
+    paths = {path for path, _ in pending}
+    minutes = {minute for _, minute in pending}
+    with transaction.atomic():
+        existing = {
+            (row.path, row.minute): row
+            for row in SiteVisitBucket.objects.select_for_update().filter(path__in=paths, minute__in=minutes)
+        }
+        new, changed = [], []
+        for (path, minute), (count, registers) in pending.items():
+            row = existing.get((path, minute))
+            if row is None:
+                new.append(SiteVisitBucket(path=path, minute=minute, day=timezone.localdate(minute),
+                                           count=count, hll=bytes(registers or b'')))
+            else:
+                row.count += count
+                if registers is not None:
+                    old = bytes(row.hll)
+                    row.hll = bytes(hll_merge(old, registers) if old else registers)
+                changed.append(row)
+        if changed:
+            SiteVisitBucket.objects.bulk_update(changed, ['count', 'hll'], batch_size=500)
+        if new:
+            SiteVisitBucket.objects.bulk_create(new, batch_size=500)
+
+
+def flush():
+    """Ghi các bucket đang giữ vào SiteVisitBucket. Returns: số bucket đã ghi."""
+    with _LOCK:
+        pending = dict(_BUCKETS)
+        _BUCKETS.clear()
+    if not pending:
+        return 0
+    try:
+        try:
+            _write(pending)
+        except IntegrityError:
+            # Process khác vừa tạo cùng bucket → đọc lại và cộng dồn
+            _write(pending)
+    except Exception as e:
+        with _LOCK:
+            _STATS['failed'] += len(pending)
+        print(f"⚠️  SiteVisit: không ghi được {len(pending)} bucket: {e}")
+        return 0
+    with _LOCK:
+        _STATS['flushed'] += len(pending)
+    return len(pending)
+
+
+def _flush_at_exit():
+    if not _BUCKETS:
+        return
+    try:
+        from django.db import connection
+        from website.models import SiteVisitBucket
+        # Test runner đã hủy DB test / kết nối không còn bảng → bỏ qua, không in lỗi
+        if SiteVisitBucket._meta.db_table not in connection.introspection.table_names():
+            return
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+# ---------------------------------------------------------------------------
+# Đọc rollup cho dashboard
+# ---------------------------------------------------------------------------
+
+def visits_between(start_day, end_day=None, path=None):
+    """Tổng lượt truy cập từ start_day đến end_day (gồm cả 2 đầu)."""
+    from website.models import SiteVisitBucket
+
+    qs = SiteVisitBucket.objects.filter(path=path or SiteVisitBucket.ALL_PATHS, day__gte=start_day)
+    if end_day is not None:
+        qs = qs.filter(day__lte=end_day)
+    return qs.aggregate(n=Sum('count'))['n'] or 0
+
+
+def unique_visitors_between(start_day, end_day=None):
+    """Ước lượng số IP khác nhau toàn site (HyperLogLog của bucket '*') trong khoảng ngày."""
+    from website.models import SiteVisitBucket
+
+    qs = SiteVisitBucket.objects.filter(path=SiteVisitBucket.ALL_PATHS, day__gte=start_day)
+    if end_day is not None:
+        qs = qs.filter(day__lte=end_day)
+    registers = bytearray(HLL_M)
+    found = False
+    for sketch in qs.values_list('hll', flat=True).iterator(chunk_size=500):
+        if sketch:
+            registers = hll_merge(registers, bytes(sketch))
+            found = True
+    return hll_estimate(registers) if found else 0